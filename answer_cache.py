@@ -0,0 +1,113 @@
+import hashlib
+import math
+import re
+import threading
+import time
+from collections import OrderedDict
+from config import (ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL_SECONDS, ANSWER_CACHE_SEMANTIC,
+                    ANSWER_CACHE_SEMANTIC_THRESHOLD)
+
+_WS_RE = re.compile(r"\s+")
+_TRAILING_PUNCT_RE = re.compile(r"[\s?.!]+$")
+
+def normalize_question(question: str) -> str:
+    return _TRAILING_PUNCT_RE.sub("", _WS_RE.sub(" ", question.strip().lower()))
+
+def _cosine(a, b):
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+class AnswerCache:
+    """LRU + TTL cache of generated answers.
+
+    Entries are keyed by (index scope, normalized question, retrieved chunk ids, prompt
+    template, model order), where the scope names the index (namespace) that was searched.
+    Each scope remembers its own index version, and when it changes only that scope's
+    entries are dropped, so sessions on other namespaces keep their hits. In semantic mode
+    a miss falls back to the most similar cached question of the same scope with the same
+    chunks, template and models, if its query embedding is at least `semantic_threshold`
+    cosine-similar.
+    """
+
+    def __init__(self, max_entries=ANSWER_CACHE_SIZE, ttl_seconds=ANSWER_CACHE_TTL_SECONDS,
+                 semantic=ANSWER_CACHE_SEMANTIC, semantic_threshold=ANSWER_CACHE_SEMANTIC_THRESHOLD):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.semantic = semantic
+        self.semantic_threshold = semantic_threshold
+        self._entries = OrderedDict()
+        self._index_versions = {}
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "semantic_hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    @staticmethod
+    def _context_key(chunk_ids, template, models):
+        raw = "\0".join(["|".join(sorted(chunk_ids)), template, "|".join(models)])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _check_version(self, scope, index_version):
+        if scope in self._index_versions and self._index_versions[scope] == index_version:
+            return
+        stale = [key for key in self._entries if key[0] == scope]
+        if stale:
+            self.stats["invalidations"] += 1
+        for key in stale:
+            del self._entries[key]
+        self._index_versions[scope] = index_version
+
+    def get(self, question, scope, chunk_ids, template, models, index_version, question_vector=None):
+        """Return (answer_text, model_name) or None."""
+        context = self._context_key(chunk_ids, template, models)
+        key = (scope, normalize_question(question), context)
+        now = time.monotonic()
+        with self._lock:
+            self._check_version(scope, index_version)
+            entry = self._entries.get(key)
+            if entry and now - entry["created"] <= self.ttl_seconds:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return entry["text"], entry["model"]
+            if entry:
+                del self._entries[key]
+            if self.semantic and question_vector is not None:
+                best, best_score = None, self.semantic_threshold
+                for other_key, other in self._entries.items():
+                    if (other_key[0] != scope or other_key[2] != context or other["vector"] is None
+                            or now - other["created"] > self.ttl_seconds):
+                        continue
+                    score = _cosine(question_vector, other["vector"])
+                    if score >= best_score:
+                        best, best_score = other_key, score
+                if best is not None:
+                    self._entries.move_to_end(best)
+                    self.stats["semantic_hits"] += 1
+                    return self._entries[best]["text"], self._entries[best]["model"]
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, question, scope, chunk_ids, template, models, index_version, text, model,
+            question_vector=None):
+        key = (scope, normalize_question(question), self._context_key(chunk_ids, template, models))
+        with self._lock:
+            self._check_version(scope, index_version)
+            self._entries[key] = {"text": text, "model": model, "created": time.monotonic(),
+                                  "vector": list(question_vector) if self.semantic and question_vector is not None else None}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._index_versions.clear()
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats["entries"] = len(self._entries)
+        return stats
+
+# process-wide cache shared by all sessions
+answer_cache = AnswerCache()
@@ -1,20 +1,21 @@
+import sys
 import streamlit as st
-import shutil
-from config import FAISS_DIR, init_config
-from parsers import get_pdf_text, get_text_chunks
-from embeddings import build_vector_store, load_vector_store
-from qa_chain import (build_plain_prompt, build_bullets_prompt,
-                      generate_answer_with_fallback_using_prompt)
+from config import init_config
+from index_store import namespace_root, has_index, list_documents, get_index_info
+from tracing import json_lines, prometheus_text
 from utils import (
-    init_session_state, add_message, find_preceding_user_message_text,
-    render_markdown_like_to_html, format_time
+    init_session_state, add_message, clear_messages, load_page, find_question, find_answer_to_regenerate,
+    render_markdown_like_to_html, render_message_html, format_time, chat_window, export_conversation_file,
+    render_trace_waterfall
 )
-import datetime
-import html as html_module
 import streamlit.components.v1 as components
 
-# initialize configuration (loads env / configures genai)
-init_config()
+# The first paint only needs the modules above. The ingest / query stack (LangChain, FAISS,
+# PyPDF2, Google clients) is imported on first use, and init_config() runs once per process.
+
+def _loaded(module_name):
+    """The module if an ingest or query already imported it, else None (stats panels only)."""
+    return sys.modules.get(module_name)
 
 # Streamlit app
 def main():
@@ -26,6 +27,16 @@ def main():
     with cols[0]:
         st.title("💻 ChatPDF — Plain & Bullets")
         st.caption("Upload PDFs, process them and chat — choose Plain or Bullets formatting.")
+        workspace = st.text_input("Workspace", key="workspace",
+                                  help="Each workspace has its own index; leave empty for the shared one.")
+        try:
+            index_root = namespace_root(workspace.strip())
+        except ValueError as e:
+            st.error(str(e))
+            index_root = namespace_root(None)
+        if index_root != st.session_state.index_root:
+            st.session_state.index_root = index_root
+            st.session_state.faiss_ready = has_index(index_root)
     with cols[1]:
         st.metric(label="", value="Yes" if st.session_state.faiss_ready else "No")
 
@@ -34,45 +45,54 @@ def main():
     # Left: conversations + export
     with left_col:
         st.header("💬 Conversations")
-        if not st.session_state.history:
+        if not st.session_state.message_count:
             st.info("No messages yet — your conversation history will appear here.")
         else:
-            preview_items = []
-            for i, m in enumerate(st.session_state.history):
+            n_messages = st.session_state.message_count
+            # only the page holding the focused message is loaded, listed and rendered in the chat window
+            start, end = chat_window(n_messages, st.session_state.focus_index)
+            preview_items = {}
+            for m in load_page(start, end):
                 role = "You" if m['role'] == 'user' else "Assistant"
                 preview = m['text'][:80].replace('\n', ' ')
-                ts = format_time(m.get('time', ''))
-                preview_items.append(f"{i}: [{ts}] {role}: {preview}")
+                ts = format_time(m['time'])
+                preview_items[m['id']] = f"{m['id']}: [{ts}] {role}: {preview}"
 
             default_index = 0
             if st.session_state.get("focus_index") is not None:
                 fi = st.session_state.focus_index
-                if 0 <= fi < len(preview_items):
-                    default_index = fi
+                if start <= fi < end:
+                    default_index = fi - start
 
-            selected = st.radio("Select message to focus", options=list(range(len(preview_items))), index=default_index, format_func=lambda x: preview_items[x])
+            selected = st.radio("Select message to focus", options=list(preview_items), index=default_index, format_func=lambda x: preview_items[x])
             if st.session_state.get("focus_index") != selected:
                 st.session_state.focus_index = selected
 
+            cols_pages = st.columns([0.5, 0.5])
+            with cols_pages[0]:
+                if st.button("◀ Older", disabled=start == 0):
+                    st.session_state.focus_index = max(0, start - 1)
+                    st.rerun()
+            with cols_pages[1]:
+                if st.button("Newer ▶", disabled=end >= n_messages):
+                    st.session_state.focus_index = end
+                    st.rerun()
+            st.caption(f"Messages {start + 1}–{end} of {n_messages}")
+
             cols_left_actions = st.columns([0.5, 0.5])
             with cols_left_actions[0]:
                 if st.button("Clear History"):
-                    st.session_state.history = []
-                    st.session_state.focus_index = None
+                    clear_messages()
                     st.success("Chat history cleared.")
             with cols_left_actions[1]:
                 st.write(" ")
 
             st.markdown("---")
             st.subheader("Export")
-            conv_text = []
-            for m in st.session_state.history:
-                role = "You" if m['role'] == 'user' else 'Assistant'
-                conv_text.append(f"[{format_time(m.get('time',''))}] {role}: {m['text']}")
-            if conv_text:
-                st.download_button("Download conversation", data="\n".join(conv_text), file_name="chatpdf_conversation.txt")
-            else:
-                st.info("Nothing to download yet.")
+            # the transcript is written from the store to a temporary file only when the download is clicked
+            conversation_id = st.session_state.conversation_id
+            st.download_button("Download conversation", data=lambda: export_conversation_file(conversation_id),
+                               file_name="chatpdf_conversation.txt", mime="text/plain", on_click="ignore")
 
     # Center: Input form and chat UI
     with center_col:
@@ -89,30 +109,44 @@ def main():
                 if not st.session_state.faiss_ready:
                     st.error("FAISS index not found. Please upload and process PDFs first.")
                 else:
-                    add_message('user', user_question)
+                    init_config()
+                    from qa_chain import build_plain_prompt, build_bullets_prompt
+                    from query import stream_answer
+                    question_id = add_message('user', user_question)
+                    prompt_template = build_plain_prompt() if format_choice == "Plain text" else build_bullets_prompt()
+                    report = {}
+                    st.session_state.last_query_report = report
                     try:
-                        db = load_vector_store()
-                        docs = db.similarity_search(user_question, k=4)
+                        stream = stream_answer(user_question, prompt_template, path=index_root, report=report)
                     except Exception as e:
                         st.error(f"Failed to load FAISS index: {e}")
-                        docs = []
-
-                    if docs:
-                        with st.spinner("Generating answer..."):
-                            prompt_template = build_plain_prompt() if format_choice == "Plain text" else build_bullets_prompt()
-                            answer_text, model_used, error = generate_answer_with_fallback_using_prompt(prompt_template, docs, user_question)
-
-                        if answer_text:
-                            add_message('assistant', answer_text)
-                            st.session_state.last_model_used = model_used
-                            st.session_state.focus_index = len(st.session_state.history) - 1
-                            st.success("Answer generated and appended to conversation.")
-                        else:
-                            st.error(f"Failed to generate answer: {error}")
+                        stream = None
+
+                    answer_text, model_used, error = None, None, None
+                    if stream is not None:
+                        # render tokens as they arrive instead of waiting for the full answer
+                        live_answer = st.empty()
+                        live_answer.caption("Generating answer...")
+                        for _ in stream:
+                            live_answer.markdown(
+                                f"<div class='bubble assistant'>{render_markdown_like_to_html(stream.text)}</div>",
+                                unsafe_allow_html=True)
+                        live_answer.empty()
+                        answer_text = stream.text if not stream.error else None
+                        model_used, error = stream.model_name, stream.error
+
+                    if answer_text:
+                        st.session_state.focus_index = add_message('assistant', answer_text, reply_to=question_id)
+                        st.session_state.last_model_used = model_used
+                        st.success("Answer generated and appended to conversation.")
+                    elif error:
+                        st.error(f"Failed to generate answer: {error}")
 
         # Upload expander
         with st.expander("📎 Upload PDFs (attach & process here)"):
             uploaded = st.file_uploader("Upload PDF files", accept_multiple_files=True, type=['pdf'])
+            full_rebuild = st.checkbox("Replace existing index (full rebuild)", value=False,
+                                       help="By default only PDFs that are not indexed yet are embedded and appended.")
             if st.button("Submit & Process Files"):
                 if not uploaded:
                     st.warning("Please upload one or more PDF files first.")
@@ -120,27 +154,40 @@ def main():
                     progress_text = st.empty()
                     progress_bar = st.progress(0)
 
-                    progress_text.info("Stage 1/3 — Extracting text from PDFs...")
-                    raw_text = get_pdf_text(uploaded)
-                    progress_bar.progress(10)
+                    progress_text.info("Extracting, chunking, embedding and indexing PDFs...")
 
-                    if not raw_text.strip():
-                        st.error("No readable text found in the uploaded PDFs.")
-                    else:
-                        progress_text.info("Stage 2/3 — Chunking text for embeddings...")
-                        text_chunks = get_text_chunks(raw_text)
-                        progress_bar.progress(40)
-
-                        progress_text.info("Stage 3/3 — Creating embeddings and saving FAISS index...")
+                    def cb(msg):
+                        progress_text.info(msg)
 
-                        def cb(msg):
-                            progress_text.info(msg)
-
-                        build_vector_store(text_chunks, progress_callback=cb)
+                    init_config()
+                    from ingest import ingest_pdfs
+                    from embed_scheduler import EmbeddingError
+                    from embedders import EmbedderMismatchError
+                    try:
+                        summary = ingest_pdfs(uploaded, progress_callback=cb, path=index_root,
+                                              rebuild=full_rebuild)
+                    except EmbeddingError as e:
+                        st.error(str(e))
+                        summary = None
+                    except EmbedderMismatchError as e:
+                        st.error(f"{e} To rebuild it with the current embedder, tick \"Replace existing "
+                                 "index (full rebuild)\" and process the files again.")
+                        summary = None
+                    if summary is not None:
                         progress_bar.progress(100)
-
-                        st.session_state.faiss_ready = True
-                        st.success("✅ Processing complete — FAISS index saved.")
+                        st.session_state.faiss_ready = has_index(index_root)
+                        for name, error in summary["failures"]:
+                            st.warning(f"Could not read {name}: {error}")
+                        for stage, stats in summary["stages"].items():
+                            st.caption(f"{stage}: {stats['items']} {stats['unit']} in {stats['seconds']:.1f}s "
+                                       f"({stats['rate']:.1f} {stats['unit']}/s)")
+                    if summary and summary["added"]:
+                        st.success(f"✅ Processing complete — indexed {len(summary['added'])} new document(s), "
+                                   f"{summary['chunks']} chunks.")
+                    if summary and summary["skipped"]:
+                        st.info("Already indexed, skipped: " + ", ".join(summary["skipped"]))
+                    if summary and not summary["added"] and not summary["skipped"]:
+                        st.error("No readable text found in the uploaded PDFs.")
 
         # Render chat window
         chat_box = st.container()
@@ -158,35 +205,29 @@ def main():
             </style>
             """, unsafe_allow_html=True)
 
-        chat_html = "<div class='chat-window' id='chat-window'>"
-        if not st.session_state.history:
-            chat_html += "<div style='padding:20px;color:#6b7280'>No messages yet — upload PDFs and ask a question!</div>"
+        chat_parts = ["<div class='chat-window' id='chat-window'>"]
+        if not st.session_state.message_count:
+            chat_parts.append("<div style='padding:20px;color:#6b7280'>No messages yet — upload PDFs and ask a question!</div>")
         else:
-            for idx, msg in enumerate(st.session_state.history):
-                ts = format_time(msg.get('time',''))
+            start, end = chat_window(st.session_state.message_count, st.session_state.focus_index)
+            for msg in load_page(start, end):
+                idx = msg['id']
+                ts = format_time(msg['time'])
                 msg_id = f"msg-{idx}"
                 focused_class = "focused" if st.session_state.focus_index is not None and st.session_state.focus_index == idx else ""
-
-                if msg['role'] == 'assistant':
-                    content_html = render_markdown_like_to_html(msg['text'])
-                    chat_html += (
-                        f"<div class='message' id='{msg_id}'>"
-                        f"<div class='bubble assistant {focused_class}'>{content_html}<div class='meta'>{ts}</div></div>"
-                        f"</div>"
-                    )
-                else:
-                    content_html = "<p>" + html_module.escape(msg['text']).replace("\n","<br/>") + "</p>"
-                    chat_html += (
-                        f"<div class='message' id='{msg_id}'>"
-                        f"<div class='bubble user {focused_class}'>{content_html}<div class='meta'>{ts}</div></div>"
-                        f"</div>"
-                    )
-        chat_html += "</div>"
-        chat_box.markdown(chat_html, unsafe_allow_html=True)
+                role_class = "assistant" if msg['role'] == 'assistant' else "user"
+                content_html = render_message_html(role_class, msg['text'])
+                chat_parts.append(
+                    f"<div class='message' id='{msg_id}'>"
+                    f"<div class='bubble {role_class} {focused_class}'>{content_html}<div class='meta'>{ts}</div></div>"
+                    f"</div>"
+                )
+        chat_parts.append("</div>")
+        chat_box.markdown("".join(chat_parts), unsafe_allow_html=True)
 
         if st.session_state.focus_index is not None:
             focus_idx = st.session_state.focus_index
-            if 0 <= focus_idx < len(st.session_state.history):
+            if 0 <= focus_idx < st.session_state.message_count:
                 scroll_script = f"""
                 <script>
                 const el = document.getElementById("msg-{focus_idx}");
@@ -205,25 +246,35 @@ def main():
             st.success("FAISS index available.")
         else:
             st.warning("No FAISS index found.")
+        if st.session_state.faiss_ready:
+            index_info = get_index_info(index_root)
+            st.caption(f"Index: {index_info['kind']}"
+                       + (f" + {index_info['compression']}" if index_info.get('compression') else "")
+                       + f", recall@10 {index_info['recall_at_10']:.3f}"
+                       + (f", embedder {index_info['embedder']}" if index_info.get('embedder') else ""))
+        if _loaded("embeddings"):
+            cache_stats = _loaded("embeddings").get_vector_store_cache_stats()
+            st.caption(
+                f"Index cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses, "
+                f"{cache_stats['loads']} loads in {cache_stats['load_seconds']:.2f}s"
+            )
+        if _loaded("answer_cache"):
+            answer_stats = _loaded("answer_cache").answer_cache.get_stats()
+            st.caption(
+                f"Answer cache: {answer_stats['hits'] + answer_stats['semantic_hits']} hits / "
+                f"{answer_stats['misses']} misses"
+            )
+        if _loaded("embedding_cache"):
+            embed_stats = _loaded("embedding_cache").get_embedding_cache().get_stats()
+            st.caption(
+                f"Embedding cache: {embed_stats['entries']} vectors, "
+                f"{embed_stats['hit_ratio']:.0%} hit ratio ({embed_stats['evictions']} evicted)"
+            )
 
         st.markdown("---")
         st.subheader("Reformat Answer")
 
-        focus_idx = st.session_state.focus_index
-        target_idx = None
-        if focus_idx is not None and 0 <= focus_idx < len(st.session_state.history):
-            if st.session_state.history[focus_idx]["role"] == "assistant":
-                target_idx = focus_idx
-            else:
-                for j in range(focus_idx+1, len(st.session_state.history)):
-                    if st.session_state.history[j]["role"] == "assistant":
-                        target_idx = j
-                        break
-        else:
-            for j in range(len(st.session_state.history)-1, -1, -1):
-                if st.session_state.history[j]["role"] == "assistant":
-                    target_idx = j
-                    break
+        target_idx = find_answer_to_regenerate(st.session_state.focus_index)
 
         if target_idx is not None:
             st.write(f"Selected assistant message index: {target_idx}")
@@ -231,61 +282,76 @@ def main():
             cols_regen = st.columns([1,1])
             with cols_regen[0]:
                 if st.button("Regenerate — Plain Text", key=f"regen_plain_{target_idx}"):
-                    user_q = find_preceding_user_message_text(target_idx)
-                    if not user_q:
+                    question = find_question(target_idx)
+                    if not question:
                         st.error("Could not locate the original user question to regenerate.")
                     else:
+                        question_id, user_q = question
+                        init_config()
+                        from qa_chain import build_plain_prompt
+                        from query import answer_question
                         try:
-                            db = load_vector_store()
-                            docs = db.similarity_search(user_q, k=4)
+                            with st.spinner("Regenerating (plain text)..."):
+                                report = {}
+                                st.session_state.last_query_report = report
+                                answer_text, model_used, error = answer_question(user_q, build_plain_prompt(), path=index_root,
+                                                                                 report=report)
                         except Exception as e:
                             st.error(f"Failed to load FAISS index: {e}")
-                            docs = []
+                            answer_text, error = None, None
 
-                        if docs:
-                            with st.spinner("Regenerating (plain text)..."):
-                                prompt_template = build_plain_prompt()
-                                answer_text, model_used, error = generate_answer_with_fallback_using_prompt(prompt_template, docs, user_q)
-                            if answer_text:
-                                add_message('assistant', answer_text)
-                                st.session_state.last_model_used = model_used
-                                st.session_state.focus_index = len(st.session_state.history) - 1
-                                st.success("Regenerated (plain text)")
-                            else:
-                                st.error(f"Regeneration failed: {error}")
+                        if answer_text:
+                            st.session_state.focus_index = add_message('assistant', answer_text, reply_to=question_id)
+                            st.session_state.last_model_used = model_used
+                            st.success("Regenerated (plain text)")
+                        elif error:
+                            st.error(f"Regeneration failed: {error}")
             with cols_regen[1]:
                 if st.button("Regenerate — Bullets", key=f"regen_bullets_{target_idx}"):
-                    user_q = find_preceding_user_message_text(target_idx)
-                    if not user_q:
+                    question = find_question(target_idx)
+                    if not question:
                         st.error("Could not locate the original user question to regenerate.")
                     else:
+                        question_id, user_q = question
+                        init_config()
+                        from qa_chain import build_bullets_prompt
+                        from query import answer_question
                         try:
-                            db = load_vector_store()
-                            docs = db.similarity_search(user_q, k=4)
+                            with st.spinner("Regenerating (bullets)..."):
+                                report = {}
+                                st.session_state.last_query_report = report
+                                answer_text, model_used, error = answer_question(user_q, build_bullets_prompt(), path=index_root,
+                                                                                 report=report)
                         except Exception as e:
                             st.error(f"Failed to load FAISS index: {e}")
-                            docs = []
+                            answer_text, error = None, None
 
-                        if docs:
-                            with st.spinner("Regenerating (bullets)..."):
-                                prompt_template = build_bullets_prompt()
-                                answer_text, model_used, error = generate_answer_with_fallback_using_prompt(prompt_template, docs, user_q)
-                            if answer_text:
-                                add_message('assistant', answer_text)
-                                st.session_state.last_model_used = model_used
-                                st.session_state.focus_index = len(st.session_state.history) - 1
-                                st.success("Regenerated (bullets)." )
-                            else:
-                                st.error(f"Regeneration failed: {error}")
+                        if answer_text:
+                            st.session_state.focus_index = add_message('assistant', answer_text, reply_to=question_id)
+                            st.session_state.last_model_used = model_used
+                            st.success("Regenerated (bullets)." )
+                        elif error:
+                            st.error(f"Regeneration failed: {error}")
         else:
             st.info("No assistant message available to regenerate. Send a question first.")
 
         st.markdown("---")
         st.subheader("File Uploads")
+        if st.session_state.faiss_ready:
+            for doc_id, name, n_chunks in list_documents(index_root):
+                doc_cols = st.columns([0.7, 0.3])
+                with doc_cols[0]:
+                    st.caption(f"{name} ({n_chunks} chunks)")
+                with doc_cols[1]:
+                    if st.button("Remove", key=f"remove_{doc_id}"):
+                        from embeddings import remove_document
+                        remove_document(doc_id, index_root)
+                        st.session_state.faiss_ready = has_index(index_root)
+                        st.rerun()
         if st.button("Delete All"):
+            from embeddings import delete_vector_store
             try:
-                if __import__('os').path.isdir(FAISS_DIR):
-                    shutil.rmtree(FAISS_DIR)
+                delete_vector_store(index_root)
                 st.session_state.faiss_ready = False
                 st.success("FAISS index deleted.")
             except Exception as e:
@@ -294,6 +360,33 @@ def main():
         st.markdown("---")
         if st.session_state.last_model_used:
             st.write(f"_Last model used: {st.session_state.last_model_used}_")
+        last_report = st.session_state.get("last_query_report") or {}
+        if last_report.get("timings"):
+            st.caption("Retrieval: " + ", ".join(
+                f"{stage} {seconds * 1000:.1f} ms" for stage, seconds in last_report["timings"].items()))
+        if last_report.get("context"):
+            packing = last_report["context"]
+            st.caption(f"Context: {packing['tokens_out']} tokens sent, {packing['tokens_saved']} saved "
+                       f"({packing['merged']} merged, {packing['dropped']} dropped)")
+        with st.expander("Model health"):
+            model_router = _loaded("model_router")
+            health = model_router.get_default_router().get_stats() if model_router else {}
+            if not health:
+                st.caption("No model called yet.")
+            for model_name, stats in health.items():
+                state = "ok" if stats["available"] else "cooling down"
+                st.caption(f"{model_name}: {state}, {stats['successes']}/{stats['calls']} ok, "
+                           f"{stats['mean_latency']:.2f}s avg, {stats['skipped']} skipped"
+                           + (f" — last error: {stats['last_error']}" if stats["last_error"] else ""))
+        with st.expander("Debug: last request"):
+            # this session's own last query, not the process-wide latest one
+            trace = last_report.get("trace")
+            if trace is None or not trace.finished:
+                st.caption("No finished query yet.")
+            else:
+                st.markdown(render_trace_waterfall(trace), unsafe_allow_html=True)
+                st.download_button("Trace (JSON lines)", data=json_lines(trace), file_name="trace.jsonl")
+            st.download_button("Metrics (Prometheus)", data=prometheus_text(), file_name="metrics.prom")
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,126 @@
+"""Headless batch Q&A: answer a JSONL file of questions against the index.
+
+    python batch_qa.py questions.jsonl -o answers.jsonl --concurrency 8 --style bullets
+
+Each input line is a JSON object {"question": ..., "id": ..., "style": "plain"|"bullets"}
+(id and style optional) or a bare JSON string. Questions go through query.answer_question,
+the same retrieval, context packing, answer cache and model fallback the chat UI uses,
+over one shared loaded index. One JSON line per answer is written as it completes.
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from config import FAISS_DIR, BATCH_CONCURRENCY, MODEL_REQUESTS_PER_MINUTE, init_config
+from embed_scheduler import TokenBucket
+from embeddings import load_vector_store
+from qa_chain import build_plain_prompt, build_bullets_prompt
+from query import answer_question
+
+PROMPT_BUILDERS = {"plain": build_plain_prompt, "bullets": build_bullets_prompt}
+
+def read_questions(lines, default_style="plain"):
+    """Parse JSONL question lines into [{"id", "question", "style"}]; blank lines are skipped."""
+    questions = []
+    for n, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        item = json.loads(line)
+        if isinstance(item, str):
+            item = {"question": item}
+        if not item.get("question"):
+            raise ValueError(f"line {n}: missing \"question\"")
+        style = item.get("style", default_style)
+        if style not in PROMPT_BUILDERS:
+            raise ValueError(f"line {n}: unknown style {style!r}")
+        questions.append({"id": item.get("id", n), "question": item["question"], "style": style})
+    return questions
+
+def _answer_one(item, prompts, path, bucket):
+    # runs on a worker thread; the bucket spaces out model calls across all workers
+    bucket.acquire()
+    report = {}
+    start = time.perf_counter()
+    try:
+        text, model_name, error = answer_question(item["question"], prompts[item["style"]], path=path, report=report)
+    except Exception as e:
+        text, model_name, error = None, None, f"{type(e).__name__}: {e}"
+    return {
+        "id": item["id"], "question": item["question"], "style": item["style"],
+        "answer": text, "model": model_name, "error": error,
+        "latency_s": round(time.perf_counter() - start, 4),
+        "retrieval_ms": {stage: round(seconds * 1000, 3) for stage, seconds in report.get("timings", {}).items()},
+        "context_tokens": report.get("context", {}).get("tokens_out"),
+    }
+
+async def run_batch(questions, path=FAISS_DIR, concurrency=BATCH_CONCURRENCY,
+                    requests_per_minute=MODEL_REQUESTS_PER_MINUTE, on_result=None):
+    """Answer `questions` with at most `concurrency` in flight; returns results in input order.
+
+    `on_result(result)` is called as each answer completes (e.g. to stream it to a file).
+    """
+    load_vector_store(path)  # load once up front; workers then share the cached store
+    prompts = {style: build() for style, build in PROMPT_BUILDERS.items()}
+    bucket = TokenBucket(requests_per_minute)
+    loop = asyncio.get_running_loop()
+    results = [None] * len(questions)
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch-qa") as pool:
+        async def run_one(i, item):
+            results[i] = await loop.run_in_executor(pool, _answer_one, item, prompts, path, bucket)
+            if on_result:
+                on_result(results[i])
+
+        await asyncio.gather(*(run_one(i, item) for i, item in enumerate(questions)))
+    return results
+
+def summarize(results, wall_seconds):
+    latencies = [r["latency_s"] for r in results]
+    errors = sum(1 for r in results if r["error"])
+    summary = {"questions": len(results), "errors": errors, "wall_s": round(wall_seconds, 3)}
+    if latencies:
+        summary.update(p50_s=round(float(np.percentile(latencies, 50)), 4),
+                       p95_s=round(float(np.percentile(latencies, 95)), 4),
+                       questions_per_s=round(len(results) / wall_seconds, 3) if wall_seconds else None)
+    return summary
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Answer a JSONL file of questions against the PDF index.")
+    parser.add_argument("questions", help="JSONL file of questions ('-' for stdin)")
+    parser.add_argument("-o", "--output", help="JSONL file for the answers (default: stdout)")
+    parser.add_argument("--index", default=FAISS_DIR, help="index store directory (default: %(default)s)")
+    parser.add_argument("--style", choices=sorted(PROMPT_BUILDERS), default="plain",
+                        help="prompt style for questions that do not set one")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY)
+    parser.add_argument("--requests-per-minute", type=float, default=MODEL_REQUESTS_PER_MINUTE,
+                        help="upper bound on questions sent to the models per minute")
+    args = parser.parse_args(argv)
+
+    init_config()
+    if args.questions == "-":
+        questions = read_questions(sys.stdin, args.style)
+    else:
+        with open(args.questions, "r", encoding="utf-8") as f:
+            questions = read_questions(f, args.style)
+
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+
+    def write(result):
+        out.write(json.dumps(result, ensure_ascii=False) + "\n")
+        out.flush()
+
+    start = time.perf_counter()
+    try:
+        results = asyncio.run(run_batch(questions, args.index, max(1, args.concurrency),
+                                        args.requests_per_minute, on_result=write))
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    print(json.dumps(summarize(results, time.perf_counter() - start)), file=sys.stderr)
+    return 1 if any(r["error"] for r in results) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,244 @@
+"""Offline benchmarks for the ingest and query hot paths.
+
+Runs against generated PDFs and the deterministic backends in fakes.py, so it needs no
+network access or API key. Results are written as JSON and can be compared against a
+stored baseline; the exit status is 1 when a metric regressed beyond the tolerance.
+
+    python bench.py --runs 3 --output bench_results.json --baseline bench_baseline.json
+    python bench.py --runs 3 --save-baseline bench_baseline.json
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import numpy as np
+import faiss
+from langchain_community.vectorstores import FAISS
+from parsers import get_pdf_text, get_text_chunks
+from index_format import save_index, load_index
+from page_cache import PageTextCache
+from model_router import ModelRouter
+from qa_chain import build_plain_prompt, generate_answer_with_fallback_using_prompt
+from fakes import FakeEmbeddings, fake_client_factory
+
+try:
+    import resource
+except ImportError:  # not available on Windows: peak RSS is then not reported
+    resource = None
+
+SEED = 1234
+EMBED_DIM = 768  # same width as models/embedding-001
+QUERY_COUNT = 200
+ANSWER_RUNS = 50
+FULL_SIZES = (1_000, 10_000, 50_000)
+QUICK_SIZES = (1_000, 5_000)
+
+def _vocabulary(rng, n=2000):
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    return ["".join(rng.choice(letters) for _ in range(rng.randint(3, 10))) for _ in range(n)]
+
+def _sentence(rng, words, n=12):
+    return " ".join(rng.choice(words) for _ in range(n))
+
+def make_pdf(n_pages, rng, words, lines_per_page=45):
+    """Return the bytes of a minimal text PDF (Helvetica, one content stream per page)."""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None,
+               b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for _ in range(n_pages):
+        lines = [_sentence(rng, words) for _ in range(lines_per_page)]
+        stream = ("BT /F1 10 Tf 12 TL 50 760 Td " + " ".join(f"({line}) Tj T*" for line in lines) + " ET").encode("ascii")
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                       b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % len(objects))
+        kids.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        " ".join(f"{k} 0 R" for k in kids).encode("ascii"), n_pages)
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(b"%d 0 obj\n%s\nendobj\n" % (number, body))
+    xref = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    for offset in offsets:
+        out.write(b"%010d 00000 n \n" % offset)
+    out.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+    return out.getvalue()
+
+def _peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def _percentiles_ms(samples):
+    samples = np.asarray(samples) * 1000
+    return round(float(np.percentile(samples, 50)), 3), round(float(np.percentile(samples, 99)), 3)
+
+def _dir_mb(path):
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path)) / (1024 * 1024)
+
+def bench_pdf_extract(metrics, rng, words, files, pages_per_file):
+    pdfs = [io.BytesIO(make_pdf(pages_per_file, rng, words)) for _ in range(files)]
+    start = time.perf_counter()
+    text = get_pdf_text(pdfs, page_cache=None)
+    seconds = time.perf_counter() - start
+    metrics["pdf_extract.pages_per_s"] = round(files * pages_per_file / seconds, 2)
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = PageTextCache(os.path.join(tmp, "pages.sqlite3"))
+        get_pdf_text(pdfs, page_cache=cache)
+        start = time.perf_counter()
+        get_pdf_text(pdfs, page_cache=cache)
+        seconds = time.perf_counter() - start
+        cache.close()
+    metrics["pdf_extract_cached.pages_per_s"] = round(files * pages_per_file / seconds, 2)
+    return text
+
+def bench_chunking(metrics, text, repeats=3):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        chunks = get_text_chunks(text)
+    seconds = (time.perf_counter() - start) / repeats
+    metrics["chunking.mb_per_s"] = round(len(text) / (1024 * 1024) / seconds, 3)
+    metrics["chunking.chunks_per_s"] = round(len(chunks) / seconds, 1)
+
+def bench_index_and_search(metrics, rng, words, sizes, workdir):
+    """Build, save and reopen a flat index per corpus size, then time similarity_search."""
+    embeddings = FakeEmbeddings(EMBED_DIM)
+    queries = [_sentence(rng, words, 6) for _ in range(QUERY_COUNT)]
+    store = None
+    for n in sizes:
+        texts = [_sentence(rng, words) for _ in range(n)]
+        vectors = embeddings.embed_documents(texts)
+        rss_before = _peak_rss_mb()
+        start = time.perf_counter()
+        store = FAISS.from_embeddings(list(zip(texts, vectors)), embedding=embeddings)
+        path = os.path.join(workdir, f"index-{n}")
+        save_index(store, path)
+        metrics[f"index.n={n}.build_s"] = round(time.perf_counter() - start, 4)
+        if rss_before is not None:
+            metrics[f"index.n={n}.peak_rss_growth_mb"] = round(_peak_rss_mb() - rss_before, 1)
+        metrics[f"index.n={n}.disk_mb"] = round(_dir_mb(path), 2)
+
+        start = time.perf_counter()
+        store = load_index(path, embeddings)
+        metrics[f"index.n={n}.load_ms"] = round((time.perf_counter() - start) * 1000, 3)
+        latencies = []
+        for query in queries:
+            start = time.perf_counter()
+            store.similarity_search(query, k=4)
+            latencies.append(time.perf_counter() - start)
+        p50, p99 = _percentiles_ms(latencies)
+        metrics[f"search.n={n}.p50_ms"] = p50
+        metrics[f"search.n={n}.p99_ms"] = p99
+    return store, queries
+
+def bench_answer(metrics, store, queries):
+    """End-to-end answer latency through the router with an instant fake LLM."""
+    router = ModelRouter(client_factory=fake_client_factory())
+    prompt = build_plain_prompt()
+    # the first call builds the pooled client and chain; time the steady state
+    generate_answer_with_fallback_using_prompt(prompt, store.similarity_search(queries[0], k=4), queries[0], router=router)
+    latencies = []
+    for query in queries[:ANSWER_RUNS]:
+        start = time.perf_counter()
+        docs = store.similarity_search(query, k=4)
+        text, _, error = generate_answer_with_fallback_using_prompt(prompt, docs, query, router=router)
+        latencies.append(time.perf_counter() - start)
+        if error:
+            raise RuntimeError(f"fake answer failed: {error}")
+    p50, p99 = _percentiles_ms(latencies)
+    metrics["answer.p50_ms"] = p50
+    metrics["answer.p99_ms"] = p99
+
+def run(quick=False):
+    rng = random.Random(SEED)
+    words = _vocabulary(rng)
+    metrics = {}
+    with tempfile.TemporaryDirectory(prefix="chatpdf-bench-") as workdir:
+        text = bench_pdf_extract(metrics, rng, words, files=2 if quick else 4, pages_per_file=20 if quick else 50)
+        bench_chunking(metrics, text)
+        store, queries = bench_index_and_search(metrics, rng, words, QUICK_SIZES if quick else FULL_SIZES, workdir)
+        bench_answer(metrics, store, queries)
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "quick": quick,
+            "python": platform.python_version(), "platform": platform.platform(),
+            "faiss": faiss.__version__, "cpus": os.cpu_count(),
+        },
+        "metrics": metrics,
+    }
+
+# timing changes smaller than this are scheduler noise, whatever their relative size
+MIN_DELTA = {"_ms": 1.0, "_s": 0.05}
+
+def higher_is_better(metric):
+    return metric.endswith("_per_s")
+
+def best_of(results):
+    """Merge several runs, keeping each metric's best value, so one noisy run cannot flag a regression."""
+    merged = dict(results[0], metrics={})
+    for metric in results[0]["metrics"]:
+        values = [r["metrics"][metric] for r in results if metric in r["metrics"]]
+        merged["metrics"][metric] = max(values) if higher_is_better(metric) else min(values)
+    merged["meta"] = dict(results[0]["meta"], runs=len(results))
+    return merged
+
+def compare(metrics, baseline, tolerance):
+    """Return [(metric, baseline, current, change)] for metrics worse than baseline by > tolerance."""
+    regressions = []
+    for metric, old in baseline.items():
+        new = metrics.get(metric)
+        if new is None or not old:
+            continue
+        change = (new - old) / old
+        worse = -change if higher_is_better(metric) else change
+        floor = next((delta for suffix, delta in MIN_DELTA.items() if metric.endswith(suffix)), 0.0)
+        if worse > tolerance and abs(new - old) >= floor:
+            regressions.append((metric, old, new, change))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--quick", action="store_true", help="smaller corpora, for a fast smoke run")
+    parser.add_argument("--output", help="write results JSON here")
+    parser.add_argument("--baseline", help="compare against this results JSON")
+    parser.add_argument("--save-baseline", help="write results JSON here as the new baseline")
+    parser.add_argument("--runs", type=int, default=1, help="repeat the benchmarks and keep each metric's best value")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed relative slowdown before a metric counts as a regression")
+    args = parser.parse_args(argv)
+
+    results = best_of([run(quick=args.quick) for _ in range(max(1, args.runs))])
+    for metric, value in results["metrics"].items():
+        print(f"{metric:40s} {value}")
+    for path in filter(None, (args.output, args.save_baseline)):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    if not args.baseline:
+        return 0
+    if not os.path.exists(args.baseline):
+        # a missing baseline must not read as "no regressions"
+        print(f"No baseline at {args.baseline}; create one with --save-baseline.", file=sys.stderr)
+        return 1
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    regressions = compare(results["metrics"], baseline["metrics"], args.tolerance)
+    for metric, old, new, change in regressions:
+        print(f"REGRESSION {metric}: {old} -> {new} ({change:+.0%})")
+    if not regressions:
+        print(f"No regressions against {args.baseline} (tolerance {args.tolerance:.0%}).")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,6 @@
 import os
-import google.generativeai as genai
+from functools import lru_cache
 from dotenv import load_dotenv
-import streamlit as st
 
 # Load .env for local dev
 load_dotenv()
@@ -13,10 +12,122 @@ MODEL_ORDER = [
     "gemini-1.0-pro",
 ]
 EMBEDDING_MODEL = "models/embedding-001"
+# Embedding backend: "google" (EMBEDDING_MODEL over the API), "hashing" (local NumPy feature
+# hashing, no network) or "sentence-transformers" (local model, optional dependency).
+# Indexes record their embedder; switching it requires rebuilding the index.
+EMBEDDER = "google"
+HASH_EMBEDDING_DIM = 768
+LOCAL_EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
 FAISS_DIR = "faiss_index"
 
+# On-disk embedding cache (float32 vectors + offset index), shared across ingests
+EMBED_CACHE_DIR = "embedding_cache"
+EMBED_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+# Embedding scheduler: batch size, parallel workers, request rate limit and retry backoff
+EMBED_BATCH_SIZE = 64
+EMBED_WORKERS = 4
+EMBED_REQUESTS_PER_MINUTE = 120
+EMBED_MAX_RETRIES = 5
+EMBED_BACKOFF_SECONDS = 2.0
+
+# PDF extraction: worker processes and pages handed to a worker per task
+EXTRACT_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+EXTRACT_PAGES_PER_TASK = 16
+
+# Extracted page text cache (SQLite, zlib-compressed), keyed by page content hash and
+# extractor version; least recently used pages are evicted above the size cap.
+PAGE_CACHE_PATH = os.path.join("page_cache", "pages.sqlite3")
+PAGE_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# Pipelined ingest: capacity of the bounded queues between stages
+INGEST_QUEUE_SIZE = 256
+
+# Vector index selection: "auto" keeps an exact flat index below ANN_MIN_VECTORS and
+# switches to IVF above it; "flat", "ivf" and "hnsw" force a kind.
+INDEX_TYPE = "auto"
+ANN_MIN_VECTORS = 50_000
+INDEX_COMPRESSION = None  # None, "fp16", "sq8" (int8 scalar quantizer) or "pq"
+IVF_NLIST = None  # None picks ~4 * sqrt(n) lists
+IVF_NPROBE = 16  # lists scanned per query: higher = better recall, slower
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = 64  # candidate list size per query: higher = better recall, slower
+PQ_M = 16  # product-quantizer sub-vectors; must divide the embedding dimension
+RECALL_EVAL_QUERIES = 200
+
+# Answer cache: LRU + TTL, cleared when the index changes. Semantic mode also reuses answers
+# for near-duplicate questions (cosine similarity of query embeddings >= threshold).
+ANSWER_CACHE_SIZE = 512
+ANSWER_CACHE_TTL_SECONDS = 3600
+ANSWER_CACHE_SEMANTIC = False
+ANSWER_CACHE_SEMANTIC_THRESHOLD = 0.95
+
+# Model router: per-model circuit breakers and optional hedging. With a hedge delay set, the
+# next model is also started when the current one has not answered within that many seconds.
+MODEL_HEDGE_AFTER_SECONDS = None
+MODEL_QUOTA_COOLDOWN_SECONDS = 60
+MODEL_NOT_FOUND_COOLDOWN_SECONDS = 3600
+MODEL_FAILURE_THRESHOLD = 3
+MODEL_FAILURE_COOLDOWN_SECONDS = 30
+
+# Retrieval: "hybrid" fuses BM25 and vector results with reciprocal rank fusion,
+# "vector" / "lexical" use one retriever ("lexical" needs no embedding round trip).
+RETRIEVAL_MODE = "hybrid"
+RETRIEVAL_K = 4
+RETRIEVAL_CANDIDATES = 20  # results taken from each retriever before fusion
+RRF_K = 60
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Context packing: merge overlapping neighbour chunks, drop near-duplicates (word-shingle
+# Jaccard >= threshold) and keep the most relevant context within the token budget.
+CONTEXT_TOKEN_BUDGET = 3000
+CONTEXT_DEDUPE_THRESHOLD = 0.8
+
+# Chat view: messages rendered per page, and memoized per-message HTML renderings.
+CHAT_PAGE_SIZE = 20
+RENDER_CACHE_SIZE = 2048
+# Conversations are stored in SQLite; the session only keeps the visible page, and the
+# conversation id in the URL (?conversation=...) restores a chat after a reload.
+CONVERSATION_DB_PATH = os.path.join("conversations", "chat.sqlite3")
+
+# Headless batch Q&A (batch_qa.py): questions answered in parallel, and a cap on how many
+# questions per minute are sent to the models (hedged attempts count against the quota too).
+BATCH_CONCURRENCY = 4
+MODEL_REQUESTS_PER_MINUTE = 60
+
+# HTTP query service (service.py): worker threads for retrieval / generation, the default
+# per-request deadline, and query-embedding micro-batches (flushed when full or after the wait).
+SERVICE_HOST = "127.0.0.1"
+SERVICE_PORT = 8080
+SERVICE_WORKERS = 16
+SERVICE_DEADLINE_SECONDS = 30.0
+QUERY_EMBED_BATCH_SIZE = 32
+QUERY_EMBED_BATCH_WAIT_MS = 5
+
+# Tracing: finished traces kept in memory for the debug panel, and an optional JSON-lines
+# file that every finished trace is appended to (one line per span).
+TRACE_HISTORY = 20
+TRACE_LOG_PATH = None
+
+# Versioned index store: every write publishes a new generation under FAISS_DIR. This many
+# retired generations are kept for readers in other processes before they are deleted.
+INDEX_KEEP_GENERATIONS = 1
+# Default workspace namespace (None = shared store); the app lets each session pick its own.
+INDEX_NAMESPACE = None
+
+# Startup profile (startup_profile.py): budget for the modules the app imports before its
+# first paint, on top of Streamlit itself. LangChain, FAISS, PyPDF2 and the Google clients
+# are imported on the first ingest or query instead.
+STARTUP_IMPORT_BUDGET_MS = 100
+
+@lru_cache(maxsize=None)
 def init_config():
-    """Configure API keys and the genai client. Call this once at startup."""
+    """Configure API keys and the genai client. Runs once per process; later calls are no-ops."""
+    # imported here: the Google client library alone takes about a second to import
+    import google.generativeai as genai
+    import streamlit as st
     GOOGLE_API_KEY = None
     try:
         GOOGLE_API_KEY = st.secrets.get("GOOGLE_API_KEY")
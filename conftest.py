@@ -0,0 +1,33 @@
+import io
+import random
+import pytest
+import embeddings
+from bench import make_pdf, _vocabulary
+from conversation_store import get_conversation_store
+from embedding_cache import get_embedding_cache
+from page_cache import get_page_cache
+from fakes import FakeEmbeddings
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """Run in an empty directory with fresh process-wide caches and offline fake embeddings."""
+    monkeypatch.chdir(tmp_path)
+    shared = [get_page_cache, get_embedding_cache, get_conversation_store]
+    for get in shared:
+        get.reset()
+    embeddings.use_embeddings(FakeEmbeddings(dim=64))
+    yield tmp_path
+    embeddings.use_embeddings(None)
+    for get in shared:
+        get.reset()
+
+@pytest.fixture
+def make_upload():
+    """make_upload(name, pages, seed) -> a file-like PDF upload, as Streamlit passes them."""
+    words = _vocabulary(random.Random(0))
+
+    def make(name, pages=2, seed=0):
+        upload = io.BytesIO(make_pdf(pages, random.Random(seed), words))
+        upload.name = name
+        return upload
+    return make
@@ -0,0 +1,96 @@
+import math
+from langchain_core.documents import Document
+from config import CONTEXT_TOKEN_BUDGET, CONTEXT_DEDUPE_THRESHOLD
+
+# longest chunk overlap searched for when stitching neighbours (splitter overlap is 300 chars)
+_MAX_OVERLAP_CHARS = 1000
+# shorter suffix/prefix matches are coincidence (a shared letter or word), not splitter overlap
+_MIN_OVERLAP_CHARS = 50
+_SHINGLE_SIZE = 5
+
+def estimate_tokens(text):
+    """Cheap token estimate (~4 characters per token for English prose)."""
+    return int(math.ceil(len(text) / 4.0))
+
+def _shingles(text):
+    words = text.lower().split()
+    if len(words) <= _SHINGLE_SIZE:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + _SHINGLE_SIZE]) for i in range(len(words) - _SHINGLE_SIZE + 1)}
+
+def _jaccard(a, b):
+    return len(a & b) / float(len(a | b)) if a and b else 0.0
+
+def _stitch(first, second):
+    """Join two consecutive chunks, writing their shared overlap only once."""
+    for size in range(min(len(first), len(second), _MAX_OVERLAP_CHARS), _MIN_OVERLAP_CHARS - 1, -1):
+        if first.endswith(second[:size]):
+            return first + second[size:]
+    return first + "\n" + second
+
+def pack_context(docs, token_budget=CONTEXT_TOKEN_BUDGET, dedupe_threshold=CONTEXT_DEDUPE_THRESHOLD):
+    """Shrink retrieved chunks (in relevance order) into a prompt context.
+
+    Adjacent chunks of the same document are stitched together, near-duplicates are
+    dropped and documents are kept by relevance until `token_budget` is used. Returns
+    (docs, stats) where stats reports tokens in/out/saved and how many chunks were merged
+    or dropped.
+    """
+    stats = {"tokens_in": sum(estimate_tokens(d.page_content) for d in docs), "merged": 0, "dropped": 0}
+
+    # 1. drop near-duplicates, keeping the more relevant copy
+    unique, seen = [], []
+    for doc in docs:
+        shingles = _shingles(doc.page_content)
+        if any(_jaccard(shingles, other) >= dedupe_threshold for other in seen):
+            stats["dropped"] += 1
+            continue
+        seen.append(shingles)
+        unique.append(doc)
+
+    # 2. stitch runs of consecutive chunks from one document; a run ranks as its best chunk
+    groups = {}
+    for rank, doc in enumerate(unique):
+        doc_id, chunk = doc.metadata.get("doc_id"), doc.metadata.get("chunk")
+        key = doc_id if doc_id is not None and chunk is not None else ("rank", rank)
+        groups.setdefault(key, []).append((rank, doc))
+    merged = []
+    for members in groups.values():
+        members.sort(key=lambda rd: rd[1].metadata.get("chunk", 0))
+        run = [members[0]]
+        for rank, doc in members[1:]:
+            if doc.metadata.get("chunk") == run[-1][1].metadata.get("chunk") + 1:
+                run.append((rank, doc))
+                continue
+            merged.append(_merge_run(run, stats))
+            run = [(rank, doc)]
+        merged.append(_merge_run(run, stats))
+    merged.sort(key=lambda rd: rd[0])
+
+    # 3. fill the budget by relevance; trim the first document if it alone is too large
+    packed, used = [], 0
+    for _, doc in merged:
+        tokens = estimate_tokens(doc.page_content)
+        if used + tokens <= token_budget:
+            packed.append(doc)
+            used += tokens
+        elif not packed:
+            packed.append(Document(page_content=doc.page_content[:token_budget * 4], metadata=doc.metadata))
+            used = token_budget
+        else:
+            stats["dropped"] += 1
+    stats["tokens_out"] = used
+    stats["tokens_saved"] = stats["tokens_in"] - used
+    return packed, stats
+
+def _merge_run(run, stats):
+    best_rank = min(rank for rank, _ in run)
+    if len(run) == 1:
+        return best_rank, run[0][1]
+    text = run[0][1].page_content
+    for _, doc in run[1:]:
+        text = _stitch(text, doc.page_content)
+    stats["merged"] += len(run) - 1
+    metadata = dict(run[0][1].metadata)
+    metadata["chunks"] = [doc.metadata.get("chunk") for _, doc in run]
+    return best_rank, Document(page_content=text, metadata=metadata)
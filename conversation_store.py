@@ -0,0 +1,118 @@
+import threading
+import time
+import uuid
+from config import CONVERSATION_DB_PATH
+from sqlite_store import ProcessWide, connect
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    conversation TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    text TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    reply_to INTEGER,
+    PRIMARY KEY (conversation, seq)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS messages_by_role ON messages (conversation, role, seq);
+"""
+_COLUMNS = "seq, role, text, created_at, reply_to"
+# rows fetched per round trip while streaming an export
+_EXPORT_BATCH = 500
+
+def _message(row):
+    seq, role, text, created_at, reply_to = row
+    return {"id": seq, "role": role, "text": text, "time": created_at, "reply_to": reply_to}
+
+def new_conversation_id():
+    return uuid.uuid4().hex
+
+class ConversationStore:
+    """Chat messages in SQLite, addressed by (conversation id, position).
+
+    Positions (`id`) start at 0 and are the primary key together with the conversation,
+    so pages and single messages are index lookups. Timestamps are epoch seconds and an
+    answer's `reply_to` holds the position of the question it answers.
+    """
+
+    def __init__(self, path=CONVERSATION_DB_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        # one connection shared by every session (and the export download thread); autocommit
+        # mode, so add() can open its transaction with BEGIN IMMEDIATE
+        self._db = connect(path, _SCHEMA, isolation_level=None, timeout=30)
+
+    def add(self, conversation, role, text, reply_to=None):
+        """Append a message and return it."""
+        with self._lock:
+            # take the write lock before reading MAX(seq): another process sharing the file
+            # cannot pick the same position in between
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                seq = self._db.execute("SELECT COALESCE(MAX(seq) + 1, 0) FROM messages WHERE conversation = ?",
+                                       (conversation,)).fetchone()[0]
+                row = (seq, role, text, time.time(), reply_to)
+                self._db.execute(f"INSERT INTO messages (conversation, {_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?)",
+                                 (conversation, *row))
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return _message(row)
+
+    def count(self, conversation):
+        with self._lock:
+            return self._db.execute("SELECT COALESCE(MAX(seq) + 1, 0) FROM messages WHERE conversation = ?",
+                                    (conversation,)).fetchone()[0]
+
+    def page(self, conversation, start, end):
+        """Messages with start <= id < end, in order."""
+        with self._lock:
+            rows = self._db.execute(f"SELECT {_COLUMNS} FROM messages WHERE conversation = ? AND seq >= ? "
+                                    "AND seq < ? ORDER BY seq", (conversation, start, end)).fetchall()
+        return [_message(row) for row in rows]
+
+    def get(self, conversation, seq):
+        with self._lock:
+            row = self._db.execute(f"SELECT {_COLUMNS} FROM messages WHERE conversation = ? AND seq = ?",
+                                   (conversation, seq)).fetchone()
+        return _message(row) if row else None
+
+    def question_for(self, conversation, seq):
+        """The question answered by message `seq`: its reply_to link, else the closest earlier question."""
+        message = self.get(conversation, seq)
+        if message is None:
+            return None
+        if message["reply_to"] is not None:
+            return self.get(conversation, message["reply_to"])
+        with self._lock:
+            row = self._db.execute(f"SELECT {_COLUMNS} FROM messages WHERE conversation = ? AND role = 'user' "
+                                   "AND seq < ? ORDER BY seq DESC LIMIT 1", (conversation, seq)).fetchone()
+        return _message(row) if row else None
+
+    def find_answer(self, conversation, at=None):
+        """Id of the first answer at or after `at`, or of the latest answer when `at` is None."""
+        with self._lock:
+            if at is None:
+                row = self._db.execute("SELECT seq FROM messages WHERE conversation = ? AND role = 'assistant' "
+                                       "ORDER BY seq DESC LIMIT 1", (conversation,)).fetchone()
+            else:
+                row = self._db.execute("SELECT seq FROM messages WHERE conversation = ? AND role = 'assistant' "
+                                       "AND seq >= ? ORDER BY seq LIMIT 1", (conversation, at)).fetchone()
+        return row[0] if row else None
+
+    def iter_messages(self, conversation):
+        """Yield every message in order, fetching _EXPORT_BATCH rows at a time."""
+        start = 0
+        while True:
+            batch = self.page(conversation, start, start + _EXPORT_BATCH)
+            yield from batch
+            if len(batch) < _EXPORT_BATCH:
+                return
+            start += _EXPORT_BATCH
+
+    def clear(self, conversation):
+        with self._lock:
+            self._db.execute("DELETE FROM messages WHERE conversation = ?", (conversation,))
+
+get_conversation_store = ProcessWide(ConversationStore)
@@ -0,0 +1,91 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from google.api_core.exceptions import ResourceExhausted, ServiceUnavailable, DeadlineExceeded
+from config import (EMBED_BATCH_SIZE, EMBED_WORKERS, EMBED_REQUESTS_PER_MINUTE,
+                    EMBED_MAX_RETRIES, EMBED_BACKOFF_SECONDS)
+
+RETRYABLE_ERRORS = (ResourceExhausted, ServiceUnavailable, DeadlineExceeded)
+
+class EmbeddingError(RuntimeError):
+    """Raised when a batch still fails after all retries; completed batches stay checkpointed."""
+
+    def __init__(self, message, completed, total):
+        super().__init__(message)
+        self.completed = completed
+        self.total = total
+
+class TokenBucket:
+    """Thread-safe token bucket; `acquire` blocks until a token is available."""
+
+    def __init__(self, rate_per_minute, burst=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = burst or max(1, int(self.rate))
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+
+class EmbeddingScheduler:
+    """Embed texts in batches on a worker pool, rate limited and retried with backoff.
+
+    Pass a CachedEmbeddings backend: every finished batch is persisted in the embedding
+    cache, which doubles as the checkpoint, so re-running a failed ingest only embeds the
+    batches that never completed.
+    """
+
+    def __init__(self, embeddings, batch_size=EMBED_BATCH_SIZE, workers=EMBED_WORKERS,
+                 requests_per_minute=EMBED_REQUESTS_PER_MINUTE, max_retries=EMBED_MAX_RETRIES,
+                 backoff_seconds=EMBED_BACKOFF_SECONDS, rate_limiter=None):
+        self.embeddings = embeddings
+        self.batch_size = batch_size
+        self.workers = workers
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.rate_limiter = rate_limiter or TokenBucket(requests_per_minute)
+
+    def _embed_batch(self, batch):
+        for attempt in range(self.max_retries + 1):
+            self.rate_limiter.acquire()
+            try:
+                return self.embeddings.embed_documents(batch)
+            except RETRYABLE_ERRORS:
+                if attempt == self.max_retries:
+                    raise
+                # exponential backoff with jitter so workers do not retry in lockstep
+                time.sleep(self.backoff_seconds * (2 ** attempt) * (0.5 + random.random()))
+
+    def embed(self, texts, progress_callback=None):
+        """Return vectors aligned with `texts`."""
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        results = [None] * len(batches)
+        done_chunks = 0
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = {pool.submit(self._embed_batch, batch): i for i, batch in enumerate(batches)}
+            for done, future in enumerate(as_completed(futures), start=1):
+                i = futures[future]
+                try:
+                    results[i] = future.result()
+                except Exception as e:
+                    for f in futures:
+                        f.cancel()
+                    raise EmbeddingError(
+                        f"Embedding stopped after {done_chunks}/{len(texts)} chunks: {e}. "
+                        "Finished batches are cached; re-run to resume.",
+                        done_chunks, len(texts)) from e
+                done_chunks += len(batches[i])
+                if progress_callback:
+                    progress_callback(f"Embedded batch {done}/{len(batches)} ({done_chunks}/{len(texts)} chunks)")
+        return [vector for batch in results for vector in batch]
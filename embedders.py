@@ -0,0 +1,103 @@
+"""Embedding backends selectable with config.EMBEDDER.
+
+"google"                 Google embedding API behind the persistent chunk cache (network, quota)
+"hashing"                local signed feature hashing of words and word pairs, vectorized with
+                         NumPy: no model download, a few ms per query, works air-gapped
+"sentence-transformers"  a local sentence-transformers model on CPU (optional dependency)
+
+Each backend has an id recorded in the index manifest, so an index is never searched
+with vectors from a different embedder.
+"""
+import hashlib
+from functools import lru_cache
+from typing import List
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from config import EMBEDDER, EMBEDDING_MODEL, HASH_EMBEDDING_DIM, LOCAL_EMBEDDING_MODEL
+from embedding_cache import CachedEmbeddings, get_embedding_cache
+from lexical_index import tokenize
+
+class EmbedderMismatchError(RuntimeError):
+    """The index was built by a different embedder than the one configured."""
+
+@lru_cache(maxsize=1 << 18)
+def _feature_hash(feature):
+    return int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+
+class HashingEmbeddings(Embeddings):
+    """Signed feature hashing of word unigrams and bigrams into `dim` buckets.
+
+    Counts are damped with log1p and rows are L2-normalized, so inner product search
+    behaves like cosine similarity over shared terms. Deterministic and stateless.
+    """
+
+    def __init__(self, dim=HASH_EMBEDDING_DIM):
+        self.dim = dim
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        rows, hashes = [], []
+        for i, text in enumerate(texts):
+            # whole tokens only: parts would change the vectors of existing hashing-v1 indexes
+            tokens = tokenize(text, parts=False)
+            features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+            hashes.extend(_feature_hash(f) for f in features)
+            rows.extend([i] * len(features))
+        matrix = np.zeros((len(texts), self.dim), dtype="float32")
+        if hashes:
+            hashes = np.array(hashes, dtype="uint64")
+            signs = np.where(hashes >> np.uint64(63), 1.0, -1.0).astype("float32")
+            np.add.at(matrix, (np.array(rows), (hashes % np.uint64(self.dim)).astype("int64")), signs)
+        matrix = np.sign(matrix) * np.log1p(np.abs(matrix))
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix /= np.where(norms == 0, 1.0, norms)
+        return matrix.tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_documents(texts)
+
+class SentenceTransformerEmbeddings(Embeddings):
+    """A sentence-transformers model run locally on CPU (`pip install sentence-transformers`)."""
+
+    def __init__(self, model_name=LOCAL_EMBEDDING_MODEL, batch_size=64):
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError as e:
+            raise RuntimeError("EMBEDDER = \"sentence-transformers\" needs the sentence-transformers package: "
+                               "pip install sentence-transformers") from e
+        self.model = SentenceTransformer(model_name, device="cpu")
+        self.batch_size = batch_size
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.model.encode(list(texts), batch_size=self.batch_size, normalize_embeddings=True,
+                                 convert_to_numpy=True).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_documents(texts)
+
+def embedder_id(name=EMBEDDER):
+    """Identifier recorded in the index manifest: backend plus model / dimension."""
+    if name == "google":
+        return f"google:{EMBEDDING_MODEL}"
+    if name == "hashing":
+        return f"hashing-v1:{HASH_EMBEDDING_DIM}"
+    if name == "sentence-transformers":
+        return f"sentence-transformers:{LOCAL_EMBEDDING_MODEL}"
+    raise ValueError(f"Unknown EMBEDDER {name!r}: use \"google\", \"hashing\" or \"sentence-transformers\"")
+
+def create_embeddings(name=EMBEDDER):
+    """Build the LangChain Embeddings object for backend `name`."""
+    embedder_id(name)  # validates the name
+    if name == "google":
+        from langchain_google_genai import GoogleGenerativeAIEmbeddings
+        return CachedEmbeddings(GoogleGenerativeAIEmbeddings(model=EMBEDDING_MODEL), EMBEDDING_MODEL,
+                                get_embedding_cache())
+    if name == "hashing":
+        return HashingEmbeddings()
+    # model inference costs far more than a cache lookup, so local models are cached too
+    return CachedEmbeddings(SentenceTransformerEmbeddings(), embedder_id(name), get_embedding_cache())
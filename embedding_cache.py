@@ -0,0 +1,146 @@
+import hashlib
+import inspect
+import os
+import threading
+import time
+from array import array
+from langchain_core.embeddings import Embeddings
+from config import EMBED_CACHE_DIR, EMBED_CACHE_MAX_BYTES
+from sqlite_store import ProcessWide, connect, evict_lru
+
+DB_NAME = "cache.sqlite3"
+# files of the earlier flat-file layout, removed when the cache is opened
+_LEGACY_NAMES = ("vectors.f32", "index.json")
+# keys looked up per query (SQLite limits bound parameters)
+_LOOKUP_BATCH = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS vectors (
+    key TEXT PRIMARY KEY,
+    vector BLOB NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS vectors_by_last_used ON vectors (last_used);
+-- running byte total kept by triggers, so checking the cap does not scan the table
+CREATE TABLE IF NOT EXISTS totals (id INTEGER PRIMARY KEY CHECK (id = 0), bytes INTEGER NOT NULL);
+INSERT OR IGNORE INTO totals VALUES (0, 0);
+CREATE TRIGGER IF NOT EXISTS vectors_added AFTER INSERT ON vectors
+    BEGIN UPDATE totals SET bytes = bytes + LENGTH(NEW.vector) WHERE id = 0; END;
+CREATE TRIGGER IF NOT EXISTS vectors_removed AFTER DELETE ON vectors
+    BEGIN UPDATE totals SET bytes = bytes - LENGTH(OLD.vector) WHERE id = 0; END;
+"""
+
+def cache_key(model, text):
+    return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+class EmbeddingCache:
+    """Persistent embedding cache keyed by (model, chunk text hash).
+
+    Vectors are float32 blobs in one SQLite table, so each batch is written in a single
+    small transaction, and the app, service.py and batch_qa.py can share the directory:
+    SQLite serializes writers across processes and a reader never sees a half-written
+    entry. When the stored vectors grow past `max_bytes`, least recently used entries are
+    deleted in the same transaction as the insert that crossed the cap.
+    """
+
+    def __init__(self, directory=EMBED_CACHE_DIR, max_bytes=EMBED_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+        os.makedirs(directory, exist_ok=True)
+        for name in _LEGACY_NAMES:
+            try:
+                os.remove(os.path.join(directory, name))
+            except FileNotFoundError:
+                pass
+        # autocommit mode: transactions are opened explicitly with BEGIN IMMEDIATE
+        self._db = connect(os.path.join(directory, DB_NAME), _SCHEMA, isolation_level=None, timeout=30)
+
+    def get_many(self, model, texts):
+        """Return a list aligned with `texts` holding cached vectors or None for misses."""
+        keys = [cache_key(model, text) for text in texts]
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), _LOOKUP_BATCH):
+                batch = keys[start:start + _LOOKUP_BATCH]
+                marks = ",".join("?" * len(batch))
+                found.update(self._db.execute(f"SELECT key, vector FROM vectors WHERE key IN ({marks})",
+                                              batch).fetchall())
+            if found:
+                now = time.time()
+                self._db.executemany("UPDATE vectors SET last_used = ? WHERE key = ?",
+                                     [(now, key) for key in found])
+            hits = sum(1 for key in keys if key in found)
+            self.stats["hits"] += hits
+            self.stats["misses"] += len(keys) - hits
+        results = []
+        for key in keys:
+            blob = found.get(key)
+            if blob is None:
+                results.append(None)
+                continue
+            vec = array("f")
+            vec.frombytes(blob)
+            results.append(vec.tolist())
+        return results
+
+    def put_many(self, model, texts, vectors):
+        now = time.time()
+        rows = [(cache_key(model, text), array("f", vector).tobytes(), now) for text, vector in zip(texts, vectors)]
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.executemany("INSERT OR IGNORE INTO vectors VALUES (?, ?, ?)", rows)
+                # other processes write too, so the total is read inside the write transaction
+                total = self._db.execute("SELECT bytes FROM totals WHERE id = 0").fetchone()[0]
+                if total > self.max_bytes:
+                    self._evict()
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def _evict(self):
+        self.stats["evictions"] += evict_lru(self._db, "vectors", "LENGTH(vector)", self.max_bytes)
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats["entries"] = self._db.execute("SELECT COUNT(*) FROM vectors").fetchone()[0]
+            stats["bytes"] = self._db.execute("SELECT bytes FROM totals WHERE id = 0").fetchone()[0]
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_ratio"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that only sends cache misses to the backend.
+
+    Query embeddings pass straight through: they use a different task type and are rarely repeated.
+    """
+
+    def __init__(self, backend, model_name, cache):
+        self.backend = backend
+        self.model_name = model_name
+        self.cache = cache
+
+    def embed_documents(self, texts):
+        vectors = self.cache.get_many(self.model_name, texts)
+        missing = list(dict.fromkeys(t for t, v in zip(texts, vectors) if v is None))
+        if missing:
+            fresh = dict(zip(missing, self.backend.embed_documents(missing)))
+            self.cache.put_many(self.model_name, missing, [fresh[t] for t in missing])
+            vectors = [v if v is not None else list(fresh[t]) for t, v in zip(texts, vectors)]
+        return vectors
+
+    def embed_query(self, text):
+        return self.backend.embed_query(text)
+
+    def embed_queries(self, texts):
+        """Embed several queries in one backend request when the backend can batch them."""
+        if "task_type" in inspect.signature(self.backend.embed_documents).parameters:
+            # Google batches queries as documents with the query task type
+            return self.backend.embed_documents(texts, task_type="RETRIEVAL_QUERY")
+        return [self.backend.embed_query(text) for text in texts]
+
+get_embedding_cache = ProcessWide(EmbeddingCache)
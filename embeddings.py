@@ -1,18 +1,357 @@
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
+import contextlib
+import json
+import os
+import threading
+import time
 from langchain_community.vectorstores import FAISS
-from config import EMBEDDING_MODEL, FAISS_DIR
-
-def build_vector_store(text_chunks, progress_callback=None):
-    embeddings = GoogleGenerativeAIEmbeddings(model=EMBEDDING_MODEL)
-    if progress_callback:
-        progress_callback("Embedding texts and building FAISS index...")
-    vector_store = FAISS.from_texts(text_chunks, embedding=embeddings)
-    vector_store.save_local(FAISS_DIR)
-    if progress_callback:
-        progress_callback("Saved FAISS index to disk.")
-    return vector_store
-
-def load_vector_store():
-    embeddings = GoogleGenerativeAIEmbeddings(model=EMBEDDING_MODEL)
-    db = FAISS.load_local(FAISS_DIR, embeddings, allow_dangerous_deserialization=True)
-    return db
+from config import EMBEDDER, FAISS_DIR, INDEX_COMPRESSION, INDEX_KEEP_GENERATIONS
+from embedders import EmbedderMismatchError, create_embeddings, embedder_id
+from index_format import save_index, load_index, index_exists, INDEX_FILES
+from index_store import (current_generation, new_generation, publish_generation, collect_garbage, store_lock,
+                         stale_generations,
+                         MANIFEST_NAME, load_manifest, list_documents, get_index_info)
+from lexical_index import LexicalIndex, LEXICAL_NAME, forget_lexical_index
+from index_builder import (choose_index_kind, is_exact_flat, supports_compacting_removal, build_index,
+                           reconstruct_all, recall_at_k)
+
+# approximate / compressed indexes need enough vectors to train their quantizers
+_MIN_TRAIN_VECTORS = 1000
+# retrain an approximate index once it holds this many times the vectors it was trained on
+_RETRAIN_GROWTH = 4
+
+# Process-wide cache of loaded vector stores, shared by every Streamlit session.
+# Keyed by absolute generation path; each entry remembers the on-disk version it was loaded from.
+_store_cache = {}
+_store_lock = threading.Lock()
+_store_stats = {"hits": 0, "misses": 0, "loads": 0, "load_seconds": 0.0, "invalidations": 0}
+# serializes index writers (ingest / remove / rebuild) within the process
+_write_lock = threading.RLock()
+
+def _index_version(path):
+    """Return a token that changes whenever any file of the index at `path` is rewritten."""
+    entries = []
+    for name in sorted(os.listdir(path)):
+        stat = os.stat(os.path.join(path, name))
+        entries.append((name, stat.st_mtime_ns, stat.st_size))
+    return tuple(entries)
+
+# (embeddings, embedder id) set by use_embeddings() to replace the configured backend (e.g. fakes)
+_embeddings_override = None
+_shared_embeddings = None
+_embeddings_lock = threading.Lock()
+
+def use_embeddings(embeddings, embedder=None):
+    """Use `embeddings` instead of the configured EMBEDDER for this process (None restores it).
+
+    `embedder` is the id recorded in indexes built this way (default: the class name).
+    """
+    global _embeddings_override
+    _embeddings_override = None if embeddings is None else (
+        embeddings, embedder or f"custom:{type(embeddings).__name__}")
+
+def _get_embeddings():
+    """The configured embedding backend, created once per process (see embedders.py)."""
+    global _shared_embeddings
+    if _embeddings_override is not None:
+        return _embeddings_override[0]
+    with _embeddings_lock:
+        if _shared_embeddings is None:
+            _shared_embeddings = create_embeddings(EMBEDDER)
+        return _shared_embeddings
+
+def current_embedder():
+    """Id of the embedder new vectors come from; recorded in every index manifest."""
+    return _embeddings_override[1] if _embeddings_override is not None else embedder_id(EMBEDDER)
+
+def _check_embedder(manifest, path):
+    # indexes from before embedders were recorded carry no id and are not checked
+    built_with = manifest.get("embedder")
+    if built_with and built_with != current_embedder():
+        raise EmbedderMismatchError(
+            f"The index at {path} was built with embedder {built_with!r} but {current_embedder()!r} is "
+            "configured; rebuild the index or switch EMBEDDER back.")
+
+def embed_queries(texts):
+    """Query vectors for several questions, in one backend request where supported."""
+    embeddings = _get_embeddings()
+    if hasattr(embeddings, "embed_queries"):
+        return embeddings.embed_queries(texts)
+    return [embeddings.embed_query(text) for text in texts]
+
+def _cache_key(path):
+    return os.path.abspath(path)
+
+def _publish(path):
+    """Re-open a freshly written generation as the cached, memory-mapped reader copy.
+
+    Mapping the files is near-instant and lets the writer's in-memory copy be freed.
+    """
+    vector_store = load_index(path, _get_embeddings())
+    with _store_lock:
+        _cache_store(path, _index_version(path), vector_store)
+        _store_stats["invalidations"] += 1
+
+def _cache_store(generation, version, db):
+    # caller holds _store_lock; readers of other generations of this store are dropped, since
+    # another process may retire and delete them while their vectors stay mapped here
+    _store_cache[_cache_key(generation)] = (version, db)
+    for stale in stale_generations(generation, list(_store_cache)):
+        del _store_cache[stale]
+        _store_stats["invalidations"] += 1
+
+def _collect(root, keep=INDEX_KEEP_GENERATIONS):
+    """Garbage-collect retired generations of `root` and drop their cached readers."""
+    for generation in collect_garbage(root, keep):
+        _drop_cached(generation)
+        forget_lexical_index(generation)
+
+def _remove_in_place_index(root):
+    # indexes written before generations existed live directly in the store root
+    for name in INDEX_FILES + (MANIFEST_NAME, LEXICAL_NAME):
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(os.path.join(root, name))
+    _drop_cached(root)
+
+def _unpublish(root):
+    publish_generation(root, None)
+    _remove_in_place_index(root)
+    _collect(root, keep=0)
+
+def _save_manifest(path, manifest):
+    os.makedirs(path, exist_ok=True)
+    tmp = os.path.join(path, MANIFEST_NAME + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp, os.path.join(path, MANIFEST_NAME))
+
+def _load_writable(path):
+    # writers get a private copy so sessions searching the cached store never see a partial add
+    embeddings = _get_embeddings()
+    return load_index(path, embeddings, mmap_vectors=False)
+
+def load_vector_store(path=FAISS_DIR):
+    """Return the shared store for the generation published at `path`, loading it only once.
+
+    Callers that must not see a newer generation mid-read resolve and pin one with
+    index_store.pin_generation and pass the generation directory here.
+    """
+    generation = current_generation(path)
+    if generation is None:
+        raise FileNotFoundError(f"No index found at {path}")
+    key = _cache_key(generation)
+    version = _index_version(generation)
+    with _store_lock:
+        cached = _store_cache.get(key)
+        if cached and cached[0] == version:
+            _store_stats["hits"] += 1
+            return cached[1]
+        _store_stats["misses"] += 1
+        _check_embedder(load_manifest(generation), path)
+        # load while holding the lock so concurrent sessions wait for one load instead of racing
+        start = time.perf_counter()
+        embeddings = _get_embeddings()
+        db = load_index(generation, embeddings)
+        _store_stats["loads"] += 1
+        _store_stats["load_seconds"] += time.perf_counter() - start
+        _cache_store(generation, version, db)
+        return db
+
+def loaded_index_version(path=FAISS_DIR):
+    """Version token of the store currently cached for `path` (None if nothing is loaded)."""
+    generation = current_generation(path)
+    if generation is None:
+        return None
+    with _store_lock:
+        cached = _store_cache.get(_cache_key(generation))
+    return cached[0] if cached else None
+
+def _drop_cached(path):
+    with _store_lock:
+        if _store_cache.pop(_cache_key(path), None) is not None:
+            _store_stats["invalidations"] += 1
+
+def invalidate_vector_store(path=FAISS_DIR):
+    """Drop the cached store for `path` so the next load reads it from disk."""
+    _drop_cached(current_generation(path) or path)
+
+def delete_vector_store(path=FAISS_DIR):
+    """Unpublish the index at `path` and delete every generation no reader has pinned.
+
+    Other namespaces stored under `path` are left alone.
+    """
+    with _write_lock:
+        if not os.path.isdir(path):
+            return
+        with store_lock(path):
+            _unpublish(path)
+
+def get_vector_store_cache_stats():
+    """Return a snapshot of the cache counters (hits, misses, loads, load time)."""
+    with _store_lock:
+        stats = dict(_store_stats)
+        stats["cached_indexes"] = len(_store_cache)
+    return stats
+
+class IndexWriter:
+    """Exclusive writer for the index store at `path`.
+
+    Holds the process write lock and the store's cross-process lock, and edits a private
+    copy of the published generation. `commit` writes it as a new generation and swaps
+    CURRENT, so readers never observe a partial update. Use as a context manager.
+    Writers that only remove documents pass check_embedder=False: they drop rows and
+    never embed, so they work on an index built by another embedder. With rebuild=True
+    the writer starts from an empty index and `commit` replaces the published one, which
+    stays searchable (and is kept if nothing is committed) until then.
+    """
+
+    def __init__(self, path=FAISS_DIR, check_embedder=True, rebuild=False):
+        self.path = path
+        self.check_embedder = check_embedder and not rebuild
+        self.rebuild = rebuild
+        self.embeddings = _get_embeddings()
+        self.base = None
+        self.manifest = None
+        self.store = None
+        self.lexical = None
+        self.changed = False
+        self._locks = None
+
+    def __enter__(self):
+        self._locks = contextlib.ExitStack()
+        self._locks.enter_context(_write_lock)
+        self._locks.enter_context(store_lock(self.path))
+        self.base = current_generation(self.path)
+        self.manifest = {"documents": {}} if self.rebuild else load_manifest(self.path)
+        try:
+            if self.check_embedder:
+                _check_embedder(self.manifest, self.path)
+        except EmbedderMismatchError:
+            self._locks.close()
+            raise
+        return self
+
+    def __exit__(self, *exc):
+        self._locks.close()
+        return False
+
+    def has_document(self, doc_id):
+        return doc_id in self.manifest["documents"]
+
+    def document(self, doc_id):
+        """Manifest entry {"name", "chunk_ids"} of an indexed document, or None."""
+        return self.manifest["documents"].get(doc_id)
+
+    def known_documents(self):
+        return set(self.manifest["documents"])
+
+    def _open_store(self):
+        source = None if self.rebuild else self.base
+        if self.store is None and source and index_exists(source):
+            self.store = _load_writable(source)
+        if self.lexical is None:
+            self.lexical = LexicalIndex.load(source) if source else LexicalIndex()
+            if self.store is not None and not len(self.lexical):
+                # index built before the lexical index existed: backfill it once
+                for row, chunk_id in self.store.index_to_docstore_id.items():
+                    self.lexical.add(chunk_id, self.store.docstore.search(chunk_id).page_content)
+
+    def add_chunks(self, doc_id, name, chunk_records, vectors):
+        """Append embedded chunks; `chunk_records` carry "chunk" (index) and "text"."""
+        self._open_store()
+        text_embeddings, metadatas, ids = [], [], []
+        for record, vector in zip(chunk_records, vectors):
+            chunk_id = f"{doc_id}:{record['chunk']}"
+            text_embeddings.append((record["text"], vector))
+            metadatas.append({"source": name, "doc_id": doc_id, "chunk": record["chunk"], "chunk_id": chunk_id})
+            ids.append(chunk_id)
+        if not ids:
+            return
+        if self.store is None:
+            self.store = FAISS.from_embeddings(text_embeddings, embedding=self.embeddings, metadatas=metadatas, ids=ids)
+        else:
+            self.store.add_embeddings(text_embeddings, metadatas=metadatas, ids=ids)
+        for (text, _), chunk_id in zip(text_embeddings, ids):
+            self.lexical.add(chunk_id, text)
+        entry = self.manifest["documents"].setdefault(doc_id, {"name": name, "chunk_ids": []})
+        entry["chunk_ids"].extend(ids)
+        self.changed = True
+
+    def remove(self, doc_id):
+        info = self.manifest["documents"].pop(doc_id, None)
+        if info is None:
+            return False
+        self._open_store()
+        if self.store is not None and info["chunk_ids"]:
+            if supports_compacting_removal(self.store.index):
+                self.store.delete(info["chunk_ids"])
+            else:
+                # IVF / HNSW indexes are rebuilt from their stored vectors without the document
+                self._rebuild(drop=set(info["chunk_ids"]))
+            self.lexical.remove(info["chunk_ids"])
+        self.changed = True
+        return True
+
+    def _rebuild(self, kind=None, drop=()):
+        """Rebuild the FAISS index from its stored vectors, optionally dropping chunk ids."""
+        store = self.store
+        vectors = reconstruct_all(store.index)
+        ids = [store.index_to_docstore_id[i] for i in range(store.index.ntotal)]
+        keep = [i for i, chunk_id in enumerate(ids) if chunk_id not in drop]
+        vectors = vectors[keep]
+        kind = kind or choose_index_kind(len(keep))
+        compression = INDEX_COMPRESSION if len(keep) >= _MIN_TRAIN_VECTORS else None
+        if kind != "flat" and len(keep) < _MIN_TRAIN_VECTORS:
+            kind = "flat"
+        store.index = build_index(vectors, kind, compression)
+        if drop:
+            store.docstore.delete([chunk_id for chunk_id in ids if chunk_id in drop])
+        store.index_to_docstore_id = {j: ids[i] for j, i in enumerate(keep)}
+        exact = kind == "flat" and not compression
+        self.manifest["index"] = {
+            "kind": kind, "compression": compression, "trained_on": len(keep),
+            "recall_at_10": 1.0 if exact else round(recall_at_k(store.index, vectors), 4),
+        }
+
+    def _maybe_reindex(self):
+        """Move to an approximate/compressed index when the corpus outgrows the exact one."""
+        n = self.store.index.ntotal
+        if n < _MIN_TRAIN_VECTORS:
+            return
+        if is_exact_flat(self.store.index):
+            if choose_index_kind(n) != "flat" or INDEX_COMPRESSION:
+                self._rebuild()
+        elif n > _RETRAIN_GROWTH * self.manifest.get("index", {}).get("trained_on", n):
+            self._rebuild()
+
+    def commit(self):
+        """Write the updated store and manifest as a new generation and publish it to readers."""
+        if not self.changed:
+            return
+        # chunks of legacy indexes are not in the manifest, so count vectors, not documents
+        if self.store is None or self.store.index.ntotal == 0:
+            _unpublish(self.path)
+            self.base = None
+        else:
+            self._maybe_reindex()
+            # the vectors kept are still the recorded embedder's when nothing new was embedded
+            if not self.manifest.get("embedder"):
+                self.manifest["embedder"] = current_embedder()
+            generation = new_generation(self.path)
+            save_index(self.store, generation)
+            self.lexical.save(generation, {chunk_id: row for row, chunk_id in self.store.index_to_docstore_id.items()})
+            _save_manifest(generation, self.manifest)
+            publish_generation(self.path, generation)
+            _publish(generation)
+            if self.base == self.path:
+                _remove_in_place_index(self.path)
+            _collect(self.path)
+            self.base = generation
+        self.changed = False
+        self.rebuild = False
+
+def remove_document(doc_id, path=FAISS_DIR):
+    """Delete one document's vectors by id without re-embedding the rest of the corpus."""
+    with IndexWriter(path, check_embedder=False) as writer:
+        removed = writer.remove(doc_id)
+        writer.commit()
+    return removed
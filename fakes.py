@@ -0,0 +1,74 @@
+"""Deterministic offline stand-ins for the Google embedding and chat backends.
+
+Used to exercise the router, benchmarks and the query service without network access.
+"""
+import hashlib
+import time
+from typing import Any, List, Optional
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+class FakeEmbeddings(Embeddings):
+    """Hashed bag-of-words vectors: texts sharing words get similar, unit-length embeddings."""
+
+    def __init__(self, dim=768):
+        self.dim = dim
+
+    def _embed(self, text):
+        vector = np.zeros(self.dim, dtype="float32")
+        for word in text.lower().split():
+            h = int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "little")
+            vector[h % self.dim] += 1.0 if h >> 63 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+class FakeChatModel(BaseChatModel):
+    """Chat model that answers after `latency` seconds, or raises `error` if set.
+
+    The reply is the first line of the last prompt's context, so answers depend on the
+    retrieved chunks and stay deterministic.
+    """
+
+    model_name: str = "fake"
+    latency: float = 0.0
+    error: Optional[Exception] = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def _reply(self, messages):
+        prompt = messages[-1].content if messages else ""
+        context = prompt.split("Context:", 1)[-1].strip()
+        first_line = context.splitlines()[0] if context else ""
+        return f"{self.model_name}: {first_line[:200]}"
+
+    def _generate(self, messages: List[Any], stop=None, run_manager=None, **kwargs) -> ChatResult:
+        time.sleep(self.latency)
+        if self.error is not None:
+            raise self.error
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self._reply(messages)))])
+
+    def _stream(self, messages: List[Any], stop=None, run_manager=None, **kwargs):
+        time.sleep(self.latency)
+        if self.error is not None:
+            raise self.error
+        for word in self._reply(messages).split(" "):
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word + " "))
+
+def fake_client_factory(latency=0.0, errors=None):
+    """Return a ModelRouter client_factory; `errors` maps model name -> exception to raise."""
+    errors = errors or {}
+
+    def factory(model_name):
+        return FakeChatModel(model_name=model_name, latency=latency, error=errors.get(model_name))
+    return factory
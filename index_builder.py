@@ -0,0 +1,95 @@
+import math
+import numpy as np
+import faiss
+from config import (INDEX_TYPE, ANN_MIN_VECTORS, INDEX_COMPRESSION, IVF_NLIST, IVF_NPROBE,
+                    HNSW_M, HNSW_EF_CONSTRUCTION, HNSW_EF_SEARCH, PQ_M, RECALL_EVAL_QUERIES)
+
+_SQ_TYPES = {"fp16": faiss.ScalarQuantizer.QT_fp16, "sq8": faiss.ScalarQuantizer.QT_8bit}
+
+def choose_index_kind(n_vectors, index_type=INDEX_TYPE):
+    """Return "flat", "ivf" or "hnsw" for a corpus of `n_vectors`."""
+    if index_type != "auto":
+        return index_type
+    # IVF rather than HNSW for auto: no per-vector graph overhead and it memory-maps cleanly
+    return "flat" if n_vectors < ANN_MIN_VECTORS else "ivf"
+
+def is_exact_flat(index):
+    return isinstance(index, faiss.IndexFlat)
+
+def supports_compacting_removal(index):
+    """True if remove_ids renumbers the remaining vectors, as LangChain's FAISS.delete assumes.
+
+    Flat-code indexes shift rows down; IVF keeps sparse labels and HNSW cannot remove at all.
+    """
+    return isinstance(faiss.downcast_index(index), faiss.IndexFlatCodes)
+
+def build_index(vectors, kind, compression=INDEX_COMPRESSION):
+    """Build and fill a FAISS index of `kind` over a float32 (n, d) matrix."""
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    n, d = vectors.shape
+    if kind == "flat":
+        if compression in _SQ_TYPES:
+            index = faiss.IndexScalarQuantizer(d, _SQ_TYPES[compression])
+            index.train(vectors)
+        elif compression == "pq":
+            index = faiss.IndexPQ(d, PQ_M, 8)
+            index.train(vectors)
+        else:
+            index = faiss.IndexFlatL2(d)
+    elif kind == "ivf":
+        nlist = IVF_NLIST or max(1, min(int(4 * math.sqrt(n)), n // 39))
+        quantizer = faiss.IndexFlatL2(d)
+        if compression in _SQ_TYPES:
+            index = faiss.IndexIVFScalarQuantizer(quantizer, d, nlist, _SQ_TYPES[compression])
+        elif compression == "pq":
+            index = faiss.IndexIVFPQ(quantizer, d, nlist, PQ_M, 8)
+        else:
+            index = faiss.IndexIVFFlat(quantizer, d, nlist)
+        # faiss wants ~39+ points per centroid; a bounded sample keeps training time flat
+        sample = vectors if n <= nlist * 256 else vectors[np.random.default_rng(0).choice(n, nlist * 256, replace=False)]
+        index.train(sample)
+    elif kind == "hnsw":
+        if compression in _SQ_TYPES:
+            index = faiss.IndexHNSWSQ(d, _SQ_TYPES[compression], HNSW_M)
+            index.train(vectors)
+        else:
+            # PQ on top of HNSW loses too much recall for chunk retrieval; fall back to flat storage
+            index = faiss.IndexHNSWFlat(d, HNSW_M)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    else:
+        raise ValueError(f"Unknown index type: {kind}")
+    index.add(vectors)
+    apply_search_params(index)
+    return index
+
+def apply_search_params(index):
+    """Set the recall/speed knobs from config (nprobe, efSearch) on a built or loaded index."""
+    # the downcast proxy does not own the C++ object; keep returning the original
+    target = faiss.downcast_index(index)
+    if isinstance(target, faiss.IndexIVF):
+        target.nprobe = IVF_NPROBE
+    elif isinstance(target, faiss.IndexHNSW):
+        target.hnsw.efSearch = HNSW_EF_SEARCH
+    return index
+
+def reconstruct_all(index):
+    """Return every stored vector (decoded approximations for compressed indexes)."""
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.make_direct_map()
+    return index.reconstruct_n(0, index.ntotal)
+
+def recall_at_k(index, vectors, k=10, n_queries=RECALL_EVAL_QUERIES):
+    """Recall@k of `index` against an exact search over the original `vectors`.
+
+    Queries are a deterministic sample of the indexed vectors themselves.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    n = vectors.shape[0]
+    k = min(k, n)
+    rows = np.random.default_rng(0).choice(n, min(n_queries, n), replace=False)
+    queries = vectors[rows]
+    _, exact = faiss.knn(queries, vectors, k)
+    _, approx = index.search(queries, k)
+    hits = sum(len(set(e) & set(a)) for e, a in zip(exact, approx))
+    return hits / float(len(rows) * k)
@@ -0,0 +1,188 @@
+import json
+import mmap
+import os
+from array import array
+from collections.abc import Mapping
+import numpy as np
+import faiss
+from langchain_core.documents import Document
+from langchain_community.docstore.base import Docstore
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from index_builder import apply_search_params
+
+# On-disk layout (no pickles):
+#   meta.json        format version, index kind, dim, ntotal, metric
+#   vectors.f32      raw row-major float32 vectors (flat indexes), memory-mapped at load
+#   index.faiss      native FAISS index (non-flat kinds), opened with the mmap IO flag
+#   docstore.jsonl   one {"id", "text", "metadata"} JSON line per index row
+#   docstore.offsets uint64 byte offsets of each line, plus the end offset
+META_NAME = "meta.json"
+VECTORS_NAME = "vectors.f32"
+FAISS_NAME = "index.faiss"
+DOCSTORE_NAME = "docstore.jsonl"
+OFFSETS_NAME = "docstore.offsets"
+LEGACY_PICKLE_NAME = "index.pkl"
+FORMAT_VERSION = 1
+# every file an index directory may contain ("index.faiss" is also save_local's output)
+INDEX_FILES = (META_NAME, VECTORS_NAME, FAISS_NAME, DOCSTORE_NAME, OFFSETS_NAME, LEGACY_PICKLE_NAME)
+
+def index_exists(path):
+    return (os.path.exists(os.path.join(path, META_NAME))
+            or os.path.exists(os.path.join(path, LEGACY_PICKLE_NAME)))
+
+def _map_file(file_path):
+    with open(file_path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+class MmapFlatIndex:
+    """Read-only exact index over a memory-mapped float32 matrix.
+
+    Exposes the subset of the faiss.Index API that the LangChain FAISS wrapper uses for
+    searching; the matrix is never copied into process memory.
+    """
+
+    def __init__(self, vectors, metric):
+        self.xb = vectors
+        self.ntotal, self.d = vectors.shape
+        self.metric_type = metric
+
+    def search(self, x, k):
+        return faiss.knn(np.ascontiguousarray(x, dtype="float32"), self.xb, min(k, self.ntotal), metric=self.metric_type)
+
+    def reconstruct(self, i):
+        return np.array(self.xb[i])
+
+    def reconstruct_n(self, i0, n):
+        return np.array(self.xb[i0:i0 + n])
+
+class _RowIds(Mapping):
+    """index_to_docstore_id for memory-mapped stores: row number maps to itself."""
+
+    def __init__(self, n):
+        self._n = n
+
+    def __getitem__(self, i):
+        if not 0 <= i < self._n:
+            raise KeyError(i)
+        return int(i)
+
+    def __iter__(self):
+        return iter(range(self._n))
+
+    def __len__(self):
+        return self._n
+
+class MmapDocstore(Docstore):
+    """Read-only docstore that decodes one JSON line per lookup from a memory-mapped file."""
+
+    def __init__(self, path):
+        self._data = _map_file(os.path.join(path, DOCSTORE_NAME))
+        self._offsets = memoryview(_map_file(os.path.join(path, OFFSETS_NAME))).cast("Q")
+
+    def __len__(self):
+        return max(0, len(self._offsets) - 1)
+
+    def row(self, i):
+        return json.loads(self._data[self._offsets[i]:self._offsets[i + 1]])
+
+    def search(self, search):
+        try:
+            row = self.row(search)
+        except (IndexError, TypeError):
+            return f"ID {search} not found."
+        return Document(page_content=row["text"], metadata=row["metadata"])
+
+    def rows(self):
+        for i in range(len(self)):
+            yield self.row(i)
+
+def _write_atomic(file_path, write):
+    tmp = file_path + ".tmp"
+    with open(tmp, "wb") as f:
+        write(f)
+    os.replace(tmp, file_path)
+
+def save_index(store, path):
+    """Persist a LangChain FAISS store in the mmap-friendly format (replaces save_local)."""
+    os.makedirs(path, exist_ok=True)
+    index = store.index
+    ntotal = index.ntotal
+
+    offsets = array("Q", [0])
+
+    def write_docstore(f):
+        for i in range(ntotal):
+            doc_id = store.index_to_docstore_id[i]
+            doc = store.docstore.search(doc_id)
+            line = json.dumps({"id": doc_id, "text": doc.page_content, "metadata": doc.metadata}).encode("utf-8") + b"\n"
+            f.write(line)
+            offsets.append(offsets[-1] + len(line))
+
+    _write_atomic(os.path.join(path, DOCSTORE_NAME), write_docstore)
+    _write_atomic(os.path.join(path, OFFSETS_NAME), offsets.tofile)
+
+    if isinstance(index, (faiss.IndexFlat, MmapFlatIndex)):
+        kind = "flat"
+        vectors = np.ascontiguousarray(index.reconstruct_n(0, ntotal), dtype="float32")
+        _write_atomic(os.path.join(path, VECTORS_NAME), lambda f: f.write(vectors.tobytes()))
+        stale = [FAISS_NAME]
+    else:
+        kind = "faiss"
+        tmp = os.path.join(path, FAISS_NAME + ".tmp")
+        faiss.write_index(index, tmp)
+        os.replace(tmp, os.path.join(path, FAISS_NAME))
+        stale = [VECTORS_NAME]
+    meta = {"format": FORMAT_VERSION, "kind": kind, "dim": index.d, "ntotal": ntotal,
+            "metric": int(index.metric_type)}
+    # meta.json goes last: it is what marks the directory as a complete index
+    _write_atomic(os.path.join(path, META_NAME), lambda f: f.write(json.dumps(meta).encode("utf-8")))
+    for name in stale + [LEGACY_PICKLE_NAME]:
+        if os.path.exists(os.path.join(path, name)):
+            os.remove(os.path.join(path, name))
+
+def load_index(path, embeddings, mmap_vectors=True):
+    """Open the index at `path` as a LangChain FAISS store.
+
+    With mmap_vectors (the default, for readers) vectors and docstore stay memory-mapped
+    and are shared between processes through the OS page cache. Writers pass False to get
+    a mutable in-memory copy. Indexes still in the old pickle format are loaded once via
+    FAISS.load_local and converted on the next save.
+    """
+    meta_path = os.path.join(path, META_NAME)
+    if not os.path.exists(meta_path):
+        return FAISS.load_local(path, embeddings, allow_dangerous_deserialization=True)
+    with open(meta_path, "r", encoding="utf-8") as f:
+        meta = json.load(f)
+
+    if meta["kind"] == "flat":
+        vectors = np.memmap(os.path.join(path, VECTORS_NAME), dtype="float32", mode="r",
+                            shape=(meta["ntotal"], meta["dim"]))
+        if mmap_vectors:
+            index = MmapFlatIndex(vectors, meta["metric"])
+        else:
+            index = faiss.IndexFlat(meta["dim"], meta["metric"])
+            index.add(np.ascontiguousarray(vectors))
+    else:
+        index_path = os.path.join(path, FAISS_NAME)
+        index = None
+        if mmap_vectors:
+            try:
+                index = faiss.read_index(index_path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+            except RuntimeError:
+                # this index type cannot be mapped by the installed faiss build
+                index = None
+        if index is None:
+            index = faiss.read_index(index_path)
+        index = apply_search_params(index)
+
+    docstore = MmapDocstore(path)
+    if mmap_vectors:
+        return FAISS(embeddings, index, docstore, _RowIds(len(docstore)))
+    rows = list(docstore.rows())
+    in_memory = InMemoryDocstore({
+        r["id"]: Document(page_content=r["text"], metadata=r["metadata"]) for r in rows
+    })
+    return FAISS(embeddings, index, in_memory, {i: r["id"] for i, r in enumerate(rows)})
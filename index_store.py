@@ -0,0 +1,183 @@
+import contextlib
+import json
+import os
+import re
+import shutil
+import threading
+import time
+from config import FAISS_DIR, INDEX_KEEP_GENERATIONS
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows: writers are then only serialized in-process
+    fcntl = None
+
+# Versioned index store layout (one per namespace):
+#   <root>/CURRENT              name of the published generation, replaced atomically
+#   <root>/LOCK                 advisory lock file held by the active writer
+#   <root>/generations/<name>/  one complete, never-modified index per build
+#   <root>/namespaces/<ns>/     optional per-workspace stores with the same layout
+# Writers build a new generation next to the published one and swap CURRENT, so readers
+# never see a partial index; old generations are removed once no reader has them pinned.
+CURRENT_NAME = "CURRENT"
+LOCK_NAME = "LOCK"
+GENERATIONS_DIR = "generations"
+NAMESPACES_DIR = "namespaces"
+# per-generation document list, index parameters and embedder id
+MANIFEST_NAME = "manifest.json"
+_NAMESPACE_RE = re.compile(r"[A-Za-z0-9_-][A-Za-z0-9_.-]{0,63}")
+
+# in-process reader pins: generation path -> number of active readers
+_pins = {}
+_pin_lock = threading.Lock()
+
+def namespace_root(namespace=None, base=FAISS_DIR):
+    """Store root for a workspace; None (or "") is the shared default store."""
+    if not namespace:
+        return base
+    if not _NAMESPACE_RE.fullmatch(namespace):
+        raise ValueError(f"Invalid namespace {namespace!r}: use letters, digits, '.', '_' or '-'.")
+    return os.path.join(base, NAMESPACES_DIR, namespace)
+
+def _read_current(root):
+    try:
+        with open(os.path.join(root, CURRENT_NAME), "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+def current_generation(path=FAISS_DIR):
+    """Directory of the published index under `path`, or None when there is none.
+
+    `path` may also be a generation directory or an index written in place before
+    generations existed; both resolve to themselves.
+    """
+    name = _read_current(path)
+    if name:
+        return os.path.join(path, GENERATIONS_DIR, name)
+    if not os.path.isdir(path):
+        return None
+    # imported here so the UI can check for an index without loading FAISS and LangChain
+    from index_format import index_exists
+    return path if index_exists(path) else None
+
+def has_index(path=FAISS_DIR):
+    return current_generation(path) is not None
+
+def load_manifest(path=FAISS_DIR):
+    """Return {"documents": {doc_id: {"name", "chunk_ids"}}} for the published index at `path`."""
+    generation = current_generation(path)
+    if generation is None:
+        return {"documents": {}}
+    try:
+        with open(os.path.join(generation, MANIFEST_NAME), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {"documents": {}}
+
+def list_documents(path=FAISS_DIR):
+    """Return [(doc_id, name, chunk_count)] for every document in the index."""
+    docs = load_manifest(path)["documents"]
+    return [(doc_id, info["name"], len(info["chunk_ids"])) for doc_id, info in docs.items()]
+
+def get_index_info(path=FAISS_DIR):
+    """Return the index kind, compression, build-time recall@10 and embedder from the manifest."""
+    manifest = load_manifest(path)
+    info = manifest.get("index", {"kind": "flat", "compression": None, "recall_at_10": 1.0})
+    return dict(info, embedder=manifest.get("embedder"))
+
+@contextlib.contextmanager
+def pin_generation(path=FAISS_DIR):
+    """Resolve and pin the published generation for the duration of a read.
+
+    Yields the generation directory (None when there is no index); garbage collection
+    skips it until the block exits, even if a writer publishes a newer one meanwhile.
+    """
+    with _pin_lock:
+        generation = current_generation(path)
+        key = os.path.abspath(generation) if generation else None
+        if key:
+            _pins[key] = _pins.get(key, 0) + 1
+    try:
+        yield generation
+    finally:
+        if key:
+            with _pin_lock:
+                _pins[key] -= 1
+                if not _pins[key]:
+                    del _pins[key]
+
+def stale_generations(generation, cached_paths):
+    """The cached paths that are other, unpinned generations of the same store as `generation`.
+
+    Long-lived readers call this when they load a newly published generation, so caches
+    drop generations another process may have retired and deleted (their mmaps would
+    otherwise keep the disk space and page cache in use).
+    """
+    generation = os.path.abspath(generation)
+    generations_dir = os.path.dirname(generation)
+    if os.path.basename(generations_dir) != GENERATIONS_DIR:
+        return []
+    with _pin_lock:
+        return [p for p in cached_paths
+                if os.path.dirname(p) == generations_dir and p != generation and p not in _pins]
+
+def new_generation(root):
+    """Create and return an empty, unpublished generation directory under `root`."""
+    generations = os.path.join(root, GENERATIONS_DIR)
+    os.makedirs(generations, exist_ok=True)
+    # names sort by creation time
+    name = f"{time.time_ns():020d}-{os.getpid()}-{threading.get_ident() % 10000:04d}"
+    path = os.path.join(generations, name)
+    os.makedirs(path)
+    return path
+
+def publish_generation(root, generation):
+    """Atomically point CURRENT at `generation` (None unpublishes the index)."""
+    os.makedirs(root, exist_ok=True)
+    current = os.path.join(root, CURRENT_NAME)
+    if generation is None:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(current)
+        return
+    tmp = current + f".{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(os.path.basename(generation))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, current)
+
+def collect_garbage(root, keep=INDEX_KEEP_GENERATIONS):
+    """Delete retired generations under `root`; returns the removed directories.
+
+    The published generation, any pinned by a reader in this process and the `keep` most
+    recent retired ones (a grace period for readers in other processes) are kept. Call it
+    while holding the store's write lock so an in-progress build is never collected.
+    """
+    generations = os.path.join(root, GENERATIONS_DIR)
+    if not os.path.isdir(generations):
+        return []
+    removed = []
+    with _pin_lock:
+        current = _read_current(root)
+        retired = sorted((name for name in os.listdir(generations) if name != current), reverse=True)
+        for name in retired[keep:]:
+            path = os.path.join(generations, name)
+            if os.path.abspath(path) in _pins:
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+            removed.append(path)
+    return removed
+
+@contextlib.contextmanager
+def store_lock(root):
+    """Cross-process exclusive lock for writers of the store at `root`."""
+    os.makedirs(root, exist_ok=True)
+    with open(os.path.join(root, LOCK_NAME), "a") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
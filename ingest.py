@@ -0,0 +1,224 @@
+import queue
+import threading
+import time
+from config import FAISS_DIR, EMBED_BATCH_SIZE, EMBED_WORKERS, INGEST_QUEUE_SIZE
+from parsers import iter_pdf_pages, iter_text_chunks
+from embeddings import IndexWriter
+from embed_scheduler import EmbeddingScheduler
+from tracing import span
+
+_DONE = object()
+
+class StageStats:
+    """Item count, wall time and busy time (excluding queue waits) of one pipeline stage."""
+
+    def __init__(self, name, unit):
+        self.name = name
+        self.unit = unit
+        self.items = 0
+        self.busy = 0.0
+        self.idle = 0.0
+        self.started = None
+        self.finished = None
+
+    @property
+    def elapsed(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.perf_counter()) - self.started
+
+    @property
+    def rate(self):
+        return self.items / self.elapsed if self.elapsed else 0.0
+
+    def as_dict(self):
+        return {"items": self.items, "unit": self.unit, "seconds": round(self.elapsed, 3),
+                "busy_seconds": round(self.busy, 3), "rate": round(self.rate, 2)}
+
+    def __str__(self):
+        busy = self.busy / self.elapsed if self.elapsed else 0.0
+        return f"{self.name}: {self.items} {self.unit} ({self.rate:.1f} {self.unit}/s, {busy:.0%} busy)"
+
+class IngestPipeline:
+    """Pipelined ingest: extract -> chunk -> embed -> index.
+
+    Extraction, chunking and embedding each run on their own thread, connected by bounded
+    queues: a slow stage blocks the ones before it, so peak memory stays flat regardless
+    of upload size. The index stage runs on the calling thread (it owns the index write
+    lock and may call Streamlit from progress_callback). With `rebuild`, the files replace
+    the published index once they are all indexed; until then readers keep the old one.
+    """
+
+    def __init__(self, path=FAISS_DIR, queue_size=INGEST_QUEUE_SIZE, batch_size=EMBED_BATCH_SIZE,
+                 workers=EMBED_WORKERS, progress_callback=None, report_interval=1.0, rebuild=False):
+        self.path = path
+        self.rebuild = rebuild
+        self.queue_size = queue_size
+        self.group_size = batch_size * workers
+        self.progress_callback = progress_callback
+        self.report_interval = report_interval
+        self.stages = [StageStats("extract", "pages"), StageStats("chunk", "chunks"),
+                       StageStats("embed", "vectors"), StageStats("index", "vectors")]
+        self._abort = threading.Event()
+        self._errors = []
+
+    def _put(self, q, item):
+        while not self._abort.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _iter_queue(self, q, stats=None):
+        while not self._abort.is_set():
+            start = time.perf_counter()
+            try:
+                item = q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            finally:
+                if stats is not None:
+                    stats.idle += time.perf_counter() - start
+            if item is _DONE:
+                return
+            yield item
+
+    def _run_stage(self, stats, items, out_q, count=lambda item: 1, parent=None):
+        with span(f"ingest.{stats.name}", parent=parent) as s:
+            self._run_stage_items(stats, items, out_q, count, s)
+            s.set(**{stats.unit: stats.items, "busy_seconds": round(stats.busy, 3)})
+
+    def _run_stage_items(self, stats, items, out_q, count, stage_span):
+        stats.started = time.perf_counter()
+        it = iter(items)
+        try:
+            while True:
+                start, idle = time.perf_counter(), stats.idle
+                try:
+                    item = next(it)
+                except StopIteration:
+                    break
+                # time spent waiting on the upstream queue is not work
+                stats.busy += time.perf_counter() - start - (stats.idle - idle)
+                stats.items += count(item)
+                if not self._put(out_q, item):
+                    break
+        except Exception as e:
+            stage_span.fail(e)
+            self._errors.append(e)
+            self._abort.set()
+        finally:
+            stats.finished = time.perf_counter()
+            if hasattr(it, "close"):
+                # shuts down the extraction process pool when the pipeline is aborted
+                it.close()
+            self._put(out_q, _DONE)
+
+    def _embed_groups(self, chunk_q, scheduler, stats):
+        group = []
+        for record in self._iter_queue(chunk_q, stats):
+            group.append(record)
+            if len(group) >= self.group_size:
+                yield group, scheduler.embed([r["text"] for r in group])
+                group = []
+        if group:
+            yield group, scheduler.embed([r["text"] for r in group])
+
+    def _report(self, force=False):
+        now = time.perf_counter()
+        if self.progress_callback and (force or now - self._last_report >= self.report_interval):
+            self._last_report = now
+            self.progress_callback(" · ".join(str(s) for s in self.stages))
+
+    def run(self, pdf_files):
+        """Ingest uploaded PDFs; returns a summary with added/skipped/failed files and stage stats."""
+        def pages(writer, summary, failed_doc_ids):
+            return iter_pdf_pages(pdf_files, summary["failures"], skip_doc_ids=writer.known_documents(),
+                                  skipped=summary["skipped"], failed_doc_ids=failed_doc_ids)
+        return self._run(pages, files=len(pdf_files))
+
+    def run_documents(self, documents):
+        """Ingest already extracted {"doc_id", "name", "text"} dicts (e.g. synthetic corpora)."""
+        def pages(writer, summary, failed_doc_ids):
+            known = writer.known_documents()
+            for doc in documents:
+                if doc["doc_id"] in known:
+                    summary["skipped"].append(doc["name"])
+                    continue
+                known.add(doc["doc_id"])
+                yield {"source": doc["name"], "doc_id": doc["doc_id"], "page": 1, "text": doc["text"]}
+        return self._run(pages)
+
+    def _run(self, make_pages, **span_attrs):
+        summary = {"added": [], "skipped": [], "failures": [], "chunks": 0}
+        extract, chunk, embed, index = self.stages
+        page_q = queue.Queue(self.queue_size)
+        chunk_q = queue.Queue(self.queue_size)
+        vector_q = queue.Queue(max(1, self.queue_size // max(1, self.group_size)))
+        self._last_report = 0.0
+
+        with span("ingest", **span_attrs) as root, IndexWriter(self.path, rebuild=self.rebuild) as writer:
+            scheduler = EmbeddingScheduler(writer.embeddings)
+            failed_doc_ids = set()
+            pages = make_pages(writer, summary, failed_doc_ids)
+            threads = [
+                threading.Thread(target=self._run_stage, args=(extract, pages, page_q, lambda item: 1, root), daemon=True),
+                threading.Thread(target=self._run_stage, args=(chunk, iter_text_chunks(self._iter_queue(page_q, chunk)), chunk_q,
+                                                               lambda item: 1, root), daemon=True),
+                threading.Thread(target=self._run_stage, args=(embed, self._embed_groups(chunk_q, scheduler, embed), vector_q,
+                                                               lambda item: len(item[0]), root), daemon=True),
+            ]
+            for t in threads:
+                t.start()
+
+            index.started = time.perf_counter()
+            try:
+                for records, vectors in self._iter_queue(vector_q):
+                    start = time.perf_counter()
+                    by_doc = {}
+                    for record, vector in zip(records, vectors):
+                        by_doc.setdefault(record["doc_id"], ([], [], record["source"]))
+                        by_doc[record["doc_id"]][0].append(record)
+                        by_doc[record["doc_id"]][1].append(vector)
+                    for doc_id, (doc_records, doc_vectors, name) in by_doc.items():
+                        writer.add_chunks(doc_id, name, doc_records, doc_vectors)
+                        if name not in summary["added"]:
+                            summary["added"].append(name)
+                    index.items += len(records)
+                    index.busy += time.perf_counter() - start
+                    self._report()
+            finally:
+                # also on BaseException (e.g. Streamlit's rerun/stop raised from progress_callback):
+                # stages blocked on a full queue only return once the pipeline is aborted
+                self._abort.set()
+                for t in threads:
+                    t.join()
+            if self._errors:
+                raise self._errors[0]
+            # a file whose later pages failed to extract is not indexed at all, so a re-upload retries it
+            for doc_id in failed_doc_ids:
+                info = writer.document(doc_id)
+                if info and writer.remove(doc_id):
+                    index.items -= len(info["chunk_ids"])
+                    summary["added"].remove(info["name"])
+            with span("ingest.commit", vectors=index.items) as s:
+                writer.commit()
+            index.busy += s.duration
+            index.finished = time.perf_counter()
+            root.set(added=len(summary["added"]), skipped=len(summary["skipped"]),
+                     failures=len(summary["failures"]), chunks=index.items)
+
+        summary["chunks"] = index.items
+        summary["stages"] = {s.name: s.as_dict() for s in self.stages}
+        self._report(force=True)
+        return summary
+
+def ingest_pdfs(pdf_files, progress_callback=None, path=FAISS_DIR, rebuild=False):
+    """Run the pipelined ingest over uploaded PDFs with the configured defaults."""
+    return IngestPipeline(path, progress_callback=progress_callback, rebuild=rebuild).run(pdf_files)
+
+def ingest_documents(documents, progress_callback=None, path=FAISS_DIR):
+    """Run the pipelined ingest over already extracted documents whose content hash is not indexed yet."""
+    return IngestPipeline(path, progress_callback=progress_callback).run_documents(documents)
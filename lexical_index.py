@@ -0,0 +1,172 @@
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+from config import BM25_K1, BM25_B
+from index_store import stale_generations
+
+LEXICAL_NAME = "lexical.json"
+# keeps identifiers such as part numbers ("ab-1234") and clause ids ("4.2.1") as one token
+_TOKEN_RE = re.compile(r"[a-z0-9](?:[a-z0-9_.\-]*[a-z0-9])?")
+# ...and also indexes their parts, so "ab1234" finds "part-ab1234"
+_PART_SEP_RE = re.compile(r"[_.\-]+")
+# rewrite postings once this share of slots belongs to removed chunks
+_COMPACT_RATIO = 0.25
+
+def tokenize(text, parts=True):
+    """Lowercase tokens of `text`; with `parts`, a compound token is followed by its parts."""
+    tokens = _TOKEN_RE.findall(text.lower())
+    if not parts:
+        return tokens
+    expanded = []
+    for token in tokens:
+        expanded.append(token)
+        pieces = _PART_SEP_RE.split(token)
+        if len(pieces) > 1:
+            expanded.extend(piece for piece in pieces if piece)
+    return expanded
+
+class LexicalIndex:
+    """BM25 inverted index over chunks, stored next to the FAISS index.
+
+    Chunks live in integer slots; postings are flat [slot, tf, slot, tf, ...] lists.
+    Removal tombstones a slot and postings are compacted once enough slots are dead.
+    `rows[slot]` is the chunk's row in the saved docstore, written at save time so
+    lexical hits can be read back without touching the vector index.
+    """
+
+    def __init__(self):
+        self.chunk_ids = []
+        self.lengths = []
+        self.rows = []
+        self.postings = {}
+        self._slot_of = {}
+        self._live = 0
+        self._total_length = 0
+
+    @classmethod
+    def load(cls, path):
+        index = cls()
+        try:
+            with open(os.path.join(path, LEXICAL_NAME), "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return index
+        index.chunk_ids = data["chunk_ids"]
+        index.lengths = data["lengths"]
+        index.rows = data["rows"]
+        index.postings = data["postings"]
+        for slot, chunk_id in enumerate(index.chunk_ids):
+            if chunk_id is not None:
+                index._slot_of[chunk_id] = slot
+                index._live += 1
+                index._total_length += index.lengths[slot]
+        return index
+
+    def __len__(self):
+        return self._live
+
+    def add(self, chunk_id, text):
+        if chunk_id in self._slot_of:
+            return
+        slot = len(self.chunk_ids)
+        tokens = tokenize(text)
+        self.chunk_ids.append(chunk_id)
+        self.lengths.append(len(tokens))
+        self.rows.append(-1)
+        self._slot_of[chunk_id] = slot
+        self._live += 1
+        self._total_length += len(tokens)
+        for term, tf in Counter(tokens).items():
+            self.postings.setdefault(term, []).extend((slot, tf))
+
+    def remove(self, chunk_ids):
+        for chunk_id in chunk_ids:
+            slot = self._slot_of.pop(chunk_id, None)
+            if slot is None:
+                continue
+            self.chunk_ids[slot] = None
+            self._live -= 1
+            self._total_length -= self.lengths[slot]
+        if len(self.chunk_ids) and 1 - self._live / len(self.chunk_ids) > _COMPACT_RATIO:
+            self._compact()
+
+    def _compact(self):
+        remap, chunk_ids, lengths, rows = {}, [], [], []
+        for slot, chunk_id in enumerate(self.chunk_ids):
+            if chunk_id is None:
+                continue
+            remap[slot] = len(chunk_ids)
+            chunk_ids.append(chunk_id)
+            lengths.append(self.lengths[slot])
+            rows.append(self.rows[slot])
+        postings = {}
+        for term, flat in self.postings.items():
+            kept = []
+            for i in range(0, len(flat), 2):
+                if flat[i] in remap:
+                    kept.extend((remap[flat[i]], flat[i + 1]))
+            if kept:
+                postings[term] = kept
+        self.chunk_ids, self.lengths, self.rows, self.postings = chunk_ids, lengths, rows, postings
+        self._slot_of = {chunk_id: slot for slot, chunk_id in enumerate(chunk_ids)}
+
+    def search(self, query, k):
+        """Return [(chunk_id, row, score)] for the `k` best BM25 matches."""
+        if not self._live:
+            return []
+        avg_len = self._total_length / self._live or 1.0
+        scores = {}
+        for term in set(tokenize(query)):
+            flat = self.postings.get(term)
+            if not flat:
+                continue
+            df = sum(1 for i in range(0, len(flat), 2) if self.chunk_ids[flat[i]] is not None)
+            if not df:
+                continue
+            idf = math.log(1 + (self._live - df + 0.5) / (df + 0.5))
+            for i in range(0, len(flat), 2):
+                slot, tf = flat[i], flat[i + 1]
+                if self.chunk_ids[slot] is None:
+                    continue
+                norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[slot] / avg_len)
+                scores[slot] = scores.get(slot, 0.0) + idf * tf * (BM25_K1 + 1) / norm
+        best = sorted(scores.items(), key=lambda kv: kv[1], reverse=True)[:k]
+        return [(self.chunk_ids[slot], self.rows[slot], score) for slot, score in best]
+
+    def save(self, path, row_of):
+        """Write the index; `row_of` maps chunk id -> docstore row of the index being saved."""
+        self.rows = [row_of.get(chunk_id, -1) if chunk_id is not None else -1 for chunk_id in self.chunk_ids]
+        tmp = os.path.join(path, LEXICAL_NAME + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"chunk_ids": self.chunk_ids, "lengths": self.lengths, "rows": self.rows,
+                       "postings": self.postings}, f, separators=(",", ":"))
+        os.replace(tmp, os.path.join(path, LEXICAL_NAME))
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+def load_lexical_index(path):
+    """Shared read-only LexicalIndex for `path`, reloaded when the file changes (None if absent)."""
+    file_path = os.path.join(path, LEXICAL_NAME)
+    try:
+        version = os.stat(file_path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    key = os.path.abspath(path)
+    with _cache_lock:
+        cached = _cache.get(key)
+        if cached and cached[0] == version:
+            return cached[1]
+        index = LexicalIndex.load(path)
+        _cache[key] = (version, index)
+        for stale in stale_generations(key, list(_cache)):
+            del _cache[stale]
+        return index
+
+def forget_lexical_index(path):
+    """Drop the cached index for `path` (its generation was garbage-collected)."""
+    with _cache_lock:
+        _cache.pop(os.path.abspath(path), None)
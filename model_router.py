@@ -0,0 +1,307 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from langchain_google_genai import ChatGoogleGenerativeAI
+from langchain.chains.question_answering import load_qa_chain
+from google.api_core.exceptions import ResourceExhausted, NotFound
+from context_packer import estimate_tokens
+from tracing import span, start_span
+from config import (MODEL_ORDER, MODEL_HEDGE_AFTER_SECONDS, MODEL_QUOTA_COOLDOWN_SECONDS,
+                    MODEL_NOT_FOUND_COOLDOWN_SECONDS, MODEL_FAILURE_THRESHOLD, MODEL_FAILURE_COOLDOWN_SECONDS)
+
+def extract_response_text(response):
+    """Normalize the response shapes returned by QA chains to a string (or None)."""
+    text = None
+    if isinstance(response, dict):
+        for key in ("output_text", "text", "answer", "output"):
+            if key in response and response[key]:
+                text = response[key]
+                break
+        if not text:
+            for v in response.values():
+                if isinstance(v, str) and v.strip():
+                    text = v
+                    break
+                if isinstance(v, list) and v:
+                    parts = [p for p in v if isinstance(p, str) and p.strip()]
+                    if parts:
+                        text = "\n".join(parts)
+                        break
+    elif isinstance(response, str):
+        text = response
+    else:
+        try:
+            text = str(response)
+        except Exception:
+            text = None
+    return text
+
+def format_stuff_prompt(prompt_template, docs, question):
+    """Render the prompt exactly as the "stuff" QA chain would (chunks joined by blank lines)."""
+    context = "\n\n".join(doc.page_content for doc in docs)
+    return prompt_template.format(context=context, question=question)
+
+def default_client_factory(model_name):
+    return ChatGoogleGenerativeAI(model=model_name, temperature=0.2)
+
+class CircuitBreaker:
+    """Skips a model for a cooldown after quota / not-found errors or repeated failures."""
+
+    def __init__(self):
+        self.open_until = 0.0
+        self.consecutive_failures = 0
+
+    def available(self, now):
+        return now >= self.open_until
+
+    def record_success(self):
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+
+    def record_failure(self, error, now):
+        if isinstance(error, ResourceExhausted):
+            self.open_until = now + MODEL_QUOTA_COOLDOWN_SECONDS
+        elif isinstance(error, NotFound):
+            self.open_until = now + MODEL_NOT_FOUND_COOLDOWN_SECONDS
+        else:
+            self.consecutive_failures += 1
+            if self.consecutive_failures >= MODEL_FAILURE_THRESHOLD:
+                self.open_until = now + MODEL_FAILURE_COOLDOWN_SECONDS
+
+class ModelRouter:
+    """Answers with the first healthy model in `models`, reusing clients and chains.
+
+    `client_factory(model_name)` builds the chat model; pass a factory returning a fake
+    LangChain chat model to run without network access. With `hedge_after_seconds` set,
+    the next model is started in parallel when the current one is slower than that, and
+    the first non-empty answer wins.
+    """
+
+    def __init__(self, models=None, client_factory=default_client_factory,
+                 hedge_after_seconds=MODEL_HEDGE_AFTER_SECONDS, max_workers=8):
+        self.models = list(models or MODEL_ORDER)
+        self.client_factory = client_factory
+        self.hedge_after_seconds = hedge_after_seconds
+        self._clients = {}
+        self._chains = {}
+        self._breakers = {m: CircuitBreaker() for m in self.models}
+        self._stats = {m: {"calls": 0, "successes": 0, "failures": 0, "skipped": 0,
+                           "latency_total": 0.0, "last_error": None} for m in self.models}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="model-router")
+
+    def client(self, model_name):
+        with self._lock:
+            if model_name not in self._clients:
+                self._clients[model_name] = self.client_factory(model_name)
+            return self._clients[model_name]
+
+    def _chain(self, model_name, prompt_template):
+        key = (model_name, prompt_template.template)
+        with self._lock:
+            chain = self._chains.get(key)
+        if chain is None:
+            chain = load_qa_chain(self.client(model_name), chain_type="stuff", prompt=prompt_template)
+            with self._lock:
+                self._chains[key] = chain
+        return chain
+
+    def available_models(self):
+        """Models whose circuit breaker is closed, in preference order; counts the skipped ones."""
+        now = time.monotonic()
+        models = []
+        with self._lock:
+            for m in self.models:
+                if self._breakers[m].available(now):
+                    models.append(m)
+                else:
+                    self._stats[m]["skipped"] += 1
+        return models
+
+    def record(self, model_name, latency, error=None):
+        """Update breaker and stats for one attempt; `error` is an exception or a reason string."""
+        with self._lock:
+            stats = self._stats[model_name]
+            stats["calls"] += 1
+            stats["latency_total"] += latency
+            if error is None:
+                stats["successes"] += 1
+                self._breakers[model_name].record_success()
+            else:
+                stats["failures"] += 1
+                stats["last_error"] = error if isinstance(error, str) else f"{type(error).__name__}: {error}"
+                self._breakers[model_name].record_failure(error, time.monotonic())
+
+    def _attempt(self, model_name, prompt_template, docs, question, parent=None):
+        # runs on the pool: the span is attached to the caller's explicitly
+        with span("model", parent=parent, model=model_name) as attempt:
+            start = time.perf_counter()
+            try:
+                chain = self._chain(model_name, prompt_template)
+                response = chain({"input_documents": docs, "question": question}, return_only_outputs=True)
+                text = extract_response_text(response)
+            except Exception as e:
+                attempt.fail(e)
+                self.record(model_name, time.perf_counter() - start, e)
+                return None
+            if text and text.strip():
+                self.record(model_name, time.perf_counter() - start)
+                return text
+            attempt.fail("empty response")
+            self.record(model_name, time.perf_counter() - start, "empty response")
+            return None
+
+    def generate(self, prompt_template, docs, question):
+        """Return (text, model_name, error_or_none)."""
+        with span("generate", chunks=len(docs)) as generate_span:
+            text, model_name, error = self._generate(prompt_template, docs, question, generate_span)
+            if error:
+                generate_span.fail(error)
+            else:
+                generate_span.set(model=model_name)
+            return text, model_name, error
+
+    def _generate(self, prompt_template, docs, question, parent):
+        candidates = self.available_models()
+        if not candidates:
+            return None, None, "All models are cooling down after recent failures or quota errors."
+        pending = {}
+
+        def launch():
+            model_name = candidates.pop(0)
+            pending[self._pool.submit(self._attempt, model_name, prompt_template, docs, question, parent)] = model_name
+
+        launch()
+        while pending:
+            hedge = self.hedge_after_seconds if candidates else None
+            done, _ = wait(pending, timeout=hedge, return_when=FIRST_COMPLETED)
+            if not done:
+                # current attempts are slower than the hedge deadline: race the next model too
+                launch()
+                continue
+            for future in done:
+                model_name = pending.pop(future)
+                text = future.result()
+                if text:
+                    return text, model_name, None
+            if candidates and not pending:
+                launch()
+        return None, None, "All models failed or exhausted their quotas."
+
+    def stream(self, prompt_template, docs, question):
+        """Return an AnswerStream that yields answer text as the model produces it."""
+        return AnswerStream(self, prompt_template, docs, question)
+
+    def get_stats(self):
+        """Per-model calls, successes, failures, skips, mean latency, last error and breaker state."""
+        now = time.monotonic()
+        with self._lock:
+            result = {}
+            for m in self.models:
+                stats = dict(self._stats[m])
+                stats["mean_latency"] = stats["latency_total"] / stats["calls"] if stats["calls"] else 0.0
+                stats["available"] = self._breakers[m].available(now)
+                result[m] = stats
+        return result
+
+class AnswerStream:
+    """Iterate to receive answer text pieces; `text`, `model_name`, `error` and
+    `time_to_first_token` are filled in as the stream progresses.
+
+    A model that fails before its first token is recorded as a failure and the next
+    available model is tried. Once text has been shown, a failure ends the stream with
+    `error` set, since switching models mid-answer would splice two different answers.
+    `on_complete(stream)` runs after a successful stream. If `trace` is set, per-model
+    spans are recorded under it and it is finished when iteration ends.
+    """
+
+    def __init__(self, router=None, prompt_template=None, docs=None, question=None,
+                 text="", model_name=None, error=None, on_complete=None):
+        self.router = router
+        self.prompt_template = prompt_template
+        self.docs = docs
+        self.question = question
+        self.text = text
+        self.model_name = model_name
+        self.error = error
+        self.time_to_first_token = None
+        self.on_complete = on_complete
+        self.trace = None
+
+    @classmethod
+    def from_text(cls, text, model_name):
+        """A stream that replays an already known answer (e.g. from the answer cache)."""
+        return cls(text=text, model_name=model_name)
+
+    def __iter__(self):
+        if self.router is None:
+            # replay / error-only stream
+            self.time_to_first_token = 0.0
+            if self.text:
+                yield self.text
+            return
+        try:
+            yield from self._stream_models()
+        finally:
+            if self.trace is not None:
+                self.trace.set(outcome="failed" if self.error else "answered", model=self.model_name,
+                               time_to_first_token=self.time_to_first_token)
+                self.trace.finish(self.error)
+
+    def _stream_models(self):
+        with span("prompt", parent=self.trace) as s:
+            prompt = format_stuff_prompt(self.prompt_template, self.docs, self.question)
+            s.set(prompt_tokens=estimate_tokens(prompt))
+        started = time.perf_counter()
+        for model_name in self.router.available_models():
+            attempt = start_span("model", parent=self.trace, model=model_name)
+            attempt_start = time.perf_counter()
+            emitted = False
+            try:
+                for chunk in self.router.client(model_name).stream(prompt):
+                    piece = chunk.content if hasattr(chunk, "content") else str(chunk)
+                    if not piece:
+                        continue
+                    if not emitted:
+                        emitted = True
+                        self.time_to_first_token = time.perf_counter() - started
+                    self.text += piece
+                    yield piece
+            except Exception as e:
+                attempt.finish(e)
+                self.router.record(model_name, time.perf_counter() - attempt_start, e)
+                if emitted:
+                    self.error = f"{model_name} stopped mid-answer: {type(e).__name__}"
+                    return
+                continue
+            except GeneratorExit:
+                # the consumer stopped iterating early
+                attempt.finish()
+                raise
+            if self.text.strip():
+                attempt.finish()
+                self.router.record(model_name, time.perf_counter() - attempt_start)
+                self.model_name = model_name
+                if self.on_complete:
+                    self.on_complete(self)
+                return
+            attempt.finish("empty response")
+            self.router.record(model_name, time.perf_counter() - attempt_start, "empty response")
+        self.error = "All models failed or exhausted their quotas."
+
+_default_router = None
+_default_lock = threading.Lock()
+
+def set_default_router(router):
+    """Replace the shared router, e.g. with one over fake chat models for offline runs."""
+    global _default_router
+    with _default_lock:
+        _default_router = router
+
+def get_default_router():
+    """Process-wide router over MODEL_ORDER, shared by every session."""
+    global _default_router
+    with _default_lock:
+        if _default_router is None:
+            _default_router = ModelRouter()
+        return _default_router
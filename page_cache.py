@@ -0,0 +1,120 @@
+import threading
+import time
+import zlib
+from config import PAGE_CACHE_PATH, PAGE_CACHE_MAX_BYTES
+from sqlite_store import ProcessWide, connect, evict_lru
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    page_hash TEXT NOT NULL,
+    version TEXT NOT NULL,
+    text BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (page_hash, version)
+);
+CREATE INDEX IF NOT EXISTS pages_by_last_used ON pages (last_used);
+CREATE TABLE IF NOT EXISTS files (
+    file_hash TEXT NOT NULL,
+    version TEXT NOT NULL,
+    page INTEGER NOT NULL,
+    page_hash TEXT NOT NULL,
+    PRIMARY KEY (file_hash, version, page)
+) WITHOUT ROWID;
+"""
+
+class PageTextCache:
+    """Persistent cache of extracted PDF page text in one SQLite file.
+
+    Text is stored zlib-compressed once per (page content hash, extractor version); a
+    second table maps (file hash, page number, extractor version) to page hashes, so a
+    known file is served without parsing the PDF and an edited file only re-extracts the
+    pages whose content changed. When the compressed text grows past `max_bytes`, least
+    recently used pages are dropped together with the file maps that point at them.
+    """
+
+    def __init__(self, path=PAGE_CACHE_PATH, max_bytes=PAGE_CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+        # one connection shared by the ingest threads of every session, serialized by _lock
+        self._db = connect(path, _SCHEMA)
+        self._bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+
+    def file_pages(self, file_hash, version):
+        """[(page_no, text)] for a file whose every page is cached, else None."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT f.page, f.page_hash, p.text FROM files f LEFT JOIN pages p "
+                "ON p.page_hash = f.page_hash AND p.version = f.version "
+                "WHERE f.file_hash = ? AND f.version = ? ORDER BY f.page", (file_hash, version)).fetchall()
+            if not rows or any(text is None for _, _, text in rows):
+                return None
+            self._touch([page_hash for _, page_hash, _ in rows], version)
+            self.stats["hits"] += len(rows)
+        return [(page, zlib.decompress(text).decode("utf-8")) for page, _, text in rows]
+
+    def get_pages(self, page_hashes, version):
+        """{page_hash: text} for the cached pages among `page_hashes`."""
+        found = {}
+        with self._lock:
+            for start in range(0, len(page_hashes), 500):
+                batch = page_hashes[start:start + 500]
+                marks = ",".join("?" * len(batch))
+                found.update(self._db.execute(
+                    f"SELECT page_hash, text FROM pages WHERE version = ? AND page_hash IN ({marks})",
+                    [version, *batch]).fetchall())
+            self._touch(list(found), version)
+            self.stats["hits"] += len(found)
+            self.stats["misses"] += len(set(page_hashes)) - len(found)
+        return {page_hash: zlib.decompress(text).decode("utf-8") for page_hash, text in found.items()}
+
+    def put_pages(self, version, pages):
+        """Store [(page_hash, text)] extracted by extractor `version`."""
+        now = time.time()
+        rows = []
+        for page_hash, text in pages:
+            blob = zlib.compress(text.encode("utf-8"), 6)
+            rows.append((page_hash, version, blob, len(blob), now))
+        with self._lock, self._db:
+            for row in rows:
+                if self._db.execute("INSERT OR IGNORE INTO pages VALUES (?, ?, ?, ?, ?)", row).rowcount:
+                    self._bytes += row[3]
+            if self._bytes > self.max_bytes:
+                self._evict()
+
+    def put_file(self, file_hash, version, page_hashes):
+        """Record the page hashes of every page of a file (page numbers start at 1)."""
+        with self._lock, self._db:
+            self._db.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)",
+                                 [(file_hash, version, page, page_hash)
+                                  for page, page_hash in enumerate(page_hashes, start=1)])
+
+    def _touch(self, page_hashes, version):
+        if page_hashes:
+            with self._db:
+                self._db.executemany("UPDATE pages SET last_used = ? WHERE page_hash = ? AND version = ?",
+                                     [(time.time(), page_hash, version) for page_hash in page_hashes])
+
+    def _evict(self):
+        removed = evict_lru(self._db, "pages", "size", self.max_bytes)
+        self._db.execute("DELETE FROM files WHERE NOT EXISTS (SELECT 1 FROM pages p "
+                         "WHERE p.page_hash = files.page_hash AND p.version = files.version)")
+        self.stats["evictions"] += removed
+        self._bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats["entries"] = self._db.execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+            stats["bytes"] = self._bytes
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_ratio"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+get_page_cache = ProcessWide(PageTextCache)
@@ -1,21 +1,252 @@
+import hashlib
+import io
+import os
+import tempfile
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+import PyPDF2
 from PyPDF2 import PdfReader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
+from config import EXTRACT_WORKERS, EXTRACT_PAGES_PER_TASK
+from page_cache import get_page_cache
 
-def get_pdf_text(pdf_files):
+# part of every page cache key: bump the suffix when the extraction code changes its output
+EXTRACTOR_VERSION = f"pypdf2-{PyPDF2.__version__}-1"
+
+def get_pdf_text(pdf_files, page_cache=True):
     """Extract text from a list of file-like objects (Streamlit uploaded files)."""
-    text = ""
-    for pdf in pdf_files:
+    return "\n".join(record["text"] for record in iter_pdf_pages(pdf_files, page_cache=page_cache))
+
+def _read_bytes(pdf):
+    if hasattr(pdf, "getvalue"):
+        return pdf.getvalue()
+    pdf.seek(0)
+    return pdf.read()
+
+def hash_pdf_bytes(data: bytes) -> str:
+    """Content hash used as the document id in the index manifest."""
+    return hashlib.sha256(data).hexdigest()
+
+def _extract_pages(source, indices):
+    # runs in a worker process: `source` is the path of a spooled copy of the PDF (only the
+    # path crosses the process boundary), or the raw bytes when extracting in-process
+    with (open(source, "rb") if isinstance(source, str) else io.BytesIO(source)) as stream:
+        reader = PdfReader(stream)
+        return [(i + 1, reader.pages[i].extract_text() or "") for i in indices]
+
+# keys that point back up the page tree or at embedded font programs: neither changes the text
+_FINGERPRINT_SKIP_KEYS = {"/Parent", "/FontDescriptor"}
+_FINGERPRINT_MAX_DEPTH = 8
+
+def _canonical(obj, depth=0):
+    """Deterministic serialization of a PDF object with indirect references resolved.
+
+    Never uses repr(): PyPDF2 reprs of indirect objects include the reader's id().
+    Stream data is included as a digest; image data is skipped.
+    """
+    if obj is None:
+        return b"null"
+    obj = obj.get_object()
+    if depth > _FINGERPRINT_MAX_DEPTH:
+        return b"..."
+    if isinstance(obj, dict):
+        parts = [b"<<"]
+        for key in sorted(obj):
+            if key not in _FINGERPRINT_SKIP_KEYS:
+                parts += [str(key).encode(), _canonical(obj[key], depth + 1)]
+        if hasattr(obj, "get_data") and obj.get("/Subtype") != "/Image":
+            parts.append(hashlib.sha256(obj.get_data()).hexdigest().encode())
+        return b" ".join(parts) + b">>"
+    if isinstance(obj, list):
+        return b"[" + b" ".join(_canonical(item, depth + 1) for item in obj) + b"]"
+    if isinstance(obj, bytes):
+        return obj.hex().encode()
+    return str(obj).encode()
+
+def page_fingerprint(page):
+    """Hash of what text extraction reads from a page: content stream, fonts and forms."""
+    h = hashlib.sha256()
+    contents = page.get_contents()
+    if contents is not None:
+        h.update(contents.get_data())
+    h.update(_canonical(page.get("/Rotate")))
+    resources = page.get("/Resources")
+    resources = resources.get_object() if resources is not None else {}
+    h.update(_canonical(resources.get("/Font")))
+    xobjects = resources.get("/XObject")
+    for xobject_name, xobject in sorted((xobjects.get_object() if xobjects is not None else {}).items()):
+        xobject = xobject.get_object()
+        if xobject.get("/Subtype") == "/Form":
+            h.update(str(xobject_name).encode() + _canonical(xobject))
+    return h.hexdigest()
+
+def _page_hashes(reader, doc_id):
+    hashes = []
+    for i, page in enumerate(reader.pages):
         try:
-            reader = PdfReader(pdf)
-            for page in reader.pages:
-                p = page.extract_text()
-                if p:
-                    text += p + "\n"
+            hashes.append(page_fingerprint(page))
         except Exception:
-            # skip unreadable files
+            # unusual page structure: cache the page under its file instead of its content
+            hashes.append(hashlib.sha256(f"{doc_id}:{i}".encode()).hexdigest())
+    return hashes
+
+def _iter_tasks(pdf_files, pages_per_task, failures, skip_doc_ids, skipped, cache):
+    """Yield (name, doc_id, data, start, stop, page_hashes, known) per page range.
+
+    `known` maps page indices in the range to text already in the cache; `page_hashes`
+    (None without a cache) are the range's cache keys for the pages still to extract.
+    """
+    for pdf in pdf_files:
+        name = getattr(pdf, "name", "document.pdf")
+        try:
+            data = _read_bytes(pdf)
+        except Exception as e:
+            failures.append((name, str(e)))
+            continue
+        doc_id = hash_pdf_bytes(data)
+        if doc_id in skip_doc_ids:
+            skipped.append(name)
+            continue
+        # identical files within one upload share a doc_id: only the first one is extracted
+        skip_doc_ids.add(doc_id)
+        cached = cache.file_pages(doc_id, EXTRACTOR_VERSION) if cache else None
+        if cached is not None:
+            # identical bytes seen before: no PDF parsing at all
+            yield name, doc_id, None, 0, len(cached), None, {page - 1: text for page, text in cached}
             continue
-    return text
+        try:
+            reader = PdfReader(io.BytesIO(data))
+            n_pages = len(reader.pages)
+            hashes = _page_hashes(reader, doc_id) if cache else None
+        except Exception as e:
+            failures.append((name, str(e)))
+            continue
+        known = {}
+        if cache:
+            texts = cache.get_pages(hashes, EXTRACTOR_VERSION)
+            known = {i: texts[h] for i, h in enumerate(hashes) if h in texts}
+            cache.put_file(doc_id, EXTRACTOR_VERSION, hashes)
+        for start in range(0, n_pages, pages_per_task):
+            stop = min(start + pages_per_task, n_pages)
+            yield (name, doc_id, data, start, stop, hashes and hashes[start:stop],
+                   {i: known[i] for i in range(start, stop) if i in known})
+
+def _missing(start, stop, known):
+    return [i for i in range(start, stop) if i not in known]
+
+def _merge(start, page_hashes, known, extracted, cache):
+    """Pages of a range in order; newly extracted ones are added to the cache."""
+    if cache and extracted:
+        cache.put_pages(EXTRACTOR_VERSION, [(page_hashes[page_no - 1 - start], text) for page_no, text in extracted])
+    return sorted([(i + 1, text) for i, text in known.items()] + extracted)
+
+def iter_pdf_pages(pdf_files, failures=None, workers=EXTRACT_WORKERS, pages_per_task=EXTRACT_PAGES_PER_TASK,
+                   skip_doc_ids=(), skipped=None, page_cache=True, failed_doc_ids=None):
+    """Yield {"source", "doc_id", "page", "text"} records in file and page order.
+
+    Page ranges are extracted in parallel on a process pool with at most 2 * workers tasks
+    in flight, so memory stays bounded while callers consume records as they arrive.
+    Files that cannot be read are appended to `failures` as (name, error) instead of
+    being dropped silently; pages without text are skipped. Files whose content hash is in
+    `skip_doc_ids`, or repeating an earlier file of the same call, are not extracted at all
+    and their names go to `skipped`. The content
+    hashes of files that failed part-way are added to `failed_doc_ids`: pages before the
+    failing range may already have been yielded, and callers should discard them.
+
+    Page text comes from the on-disk page cache where possible (`page_cache`: True for the
+    shared cache, a PageTextCache, or None to always extract).
+    """
+    if failures is None:
+        failures = []
+    if skipped is None:
+        skipped = []
+    cache = get_page_cache() if page_cache is True else page_cache
+    tasks = _iter_tasks(pdf_files, pages_per_task, failures, set(skip_doc_ids), skipped, cache)
+    failed = failed_doc_ids if failed_doc_ids is not None else set()
+
+    def emit(name, doc_id, pages):
+        for page_no, text in pages:
+            if text:
+                yield {"source": name, "doc_id": doc_id, "page": page_no, "text": text}
+
+    if workers <= 1:
+        for name, doc_id, data, start, stop, page_hashes, known in tasks:
+            if doc_id in failed:
+                continue
+            missing = _missing(start, stop, known)
+            try:
+                extracted = _extract_pages(data, missing) if missing else []
+            except Exception as e:
+                failed.add(doc_id)
+                failures.append((name, str(e)))
+                continue
+            yield from emit(name, doc_id, _merge(start, page_hashes, known, extracted, cache))
+        return
+
+    # each PDF is written to disk once and workers open it by path, instead of every page
+    # range pickling the whole file through the pool
+    with tempfile.TemporaryDirectory(prefix="pdf-extract-") as spool, \
+            ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        spooled = {}
+        for name, doc_id, data, start, stop, page_hashes, known in tasks:
+            missing = _missing(start, stop, known)
+            if missing:
+                if doc_id not in spooled:
+                    spooled[doc_id] = os.path.join(spool, f"{doc_id}.pdf")
+                    with open(spooled[doc_id], "wb") as f:
+                        f.write(data)
+                future = pool.submit(_extract_pages, spooled[doc_id], missing)
+            else:
+                future = Future()
+                future.set_result([])
+            pending.append((name, doc_id, future, (start, page_hashes, known)))
+            while len(pending) >= 2 * workers:
+                yield from _drain_one(pending, failed, failures, emit, cache)
+        while pending:
+            yield from _drain_one(pending, failed, failures, emit, cache)
+
+def _drain_one(pending, failed, failures, emit, cache):
+    name, doc_id, future, (start, page_hashes, known) = pending.popleft()
+    try:
+        extracted = future.result()
+    except Exception as e:
+        if doc_id not in failed:
+            failed.add(doc_id)
+            failures.append((name, str(e)))
+        return
+    if doc_id not in failed:
+        yield from emit(name, doc_id, _merge(start, page_hashes, known, extracted, cache))
 
 def get_text_chunks(text, chunk_size=3000, chunk_overlap=300):
     splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
     return splitter.split_text(text)
+
+def iter_text_chunks(page_records, chunk_size=3000, chunk_overlap=300):
+    """Chunk streamed page records per document without holding whole documents in memory.
+
+    Yields {"doc_id", "source", "chunk", "text"}. Only the trailing, still-growing chunk of
+    the current document is buffered; it is re-split once more text arrives.
+    """
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    current, buffer, index = None, "", 0
+
+    def flush(final):
+        nonlocal buffer, index
+        chunks = splitter.split_text(buffer)
+        keep = chunks if final else chunks[:-1]
+        for chunk in keep:
+            yield {"doc_id": current["doc_id"], "source": current["source"], "chunk": index, "text": chunk}
+            index += 1
+        buffer = "" if final or not chunks else chunks[-1]
+
+    for record in page_records:
+        if current and record["doc_id"] != current["doc_id"]:
+            yield from flush(final=True)
+            index = 0
+        current = record
+        buffer = f"{buffer}\n{record['text']}" if buffer else record["text"]
+        if len(buffer) > 4 * chunk_size:
+            yield from flush(final=False)
+    if current and buffer:
+        yield from flush(final=True)
@@ -1,8 +1,5 @@
 from langchain.prompts import PromptTemplate
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain.chains.question_answering import load_qa_chain
-from google.api_core.exceptions import ResourceExhausted, NotFound
-from config import MODEL_ORDER
+from model_router import get_default_router
 
 def build_plain_prompt():
     template = (
@@ -39,50 +36,19 @@ Question:
     )
     return PromptTemplate(template=template, input_variables=["context", "question"])
 
-def generate_answer_with_fallback_using_prompt(prompt_template: PromptTemplate, docs, question):
-    """Try models from MODEL_ORDER and return (text, model_name, error_or_none)."""
-    for model_name in MODEL_ORDER:
-        try:
-            model = ChatGoogleGenerativeAI(model=model_name, temperature=0.2)
-            chain = load_qa_chain(model, chain_type="stuff", prompt=prompt_template)
-            response = chain({"input_documents": docs, "question": question}, return_only_outputs=True)
+def generate_answer_with_fallback_using_prompt(prompt_template: PromptTemplate, docs, question, router=None):
+    """Try models from MODEL_ORDER and return (text, model_name, error_or_none).
 
-            # normalize response shapes
-            text = None
-            if isinstance(response, dict):
-                for key in ("output_text", "text", "answer", "output"):
-                    if key in response and response[key]:
-                        text = response[key]
-                        break
-                if not text:
-                    for v in response.values():
-                        if isinstance(v, str) and v.strip():
-                            text = v
-                            break
-                        if isinstance(v, list) and v:
-                            parts = [p for p in v if isinstance(p, str) and p.strip()]
-                            if parts:
-                                text = "\n".join(parts)
-                                break
-            elif isinstance(response, str):
-                text = response
-            else:
-                try:
-                    text = str(response)
-                except Exception:
-                    text = None
+    Goes through the shared ModelRouter, which reuses clients and skips models whose
+    circuit breaker is open; pass `router` to use another one (e.g. with a fake LLM).
+    """
+    router = router or get_default_router()
+    return router.generate(prompt_template, docs, question)
 
-            if text and text.strip():
-                return text, model_name, None
-            else:
-                # try next model
-                continue
+def stream_answer_with_fallback_using_prompt(prompt_template: PromptTemplate, docs, question, router=None):
+    """Streaming variant: returns an AnswerStream yielding text as tokens arrive.
 
-        except ResourceExhausted:
-            continue
-        except NotFound:
-            continue
-        except Exception:
-            continue
-
-    return None, None, "All models failed or exhausted their quotas."
+    Falls back to the next model in MODEL_ORDER if a stream fails before its first token.
+    """
+    router = router or get_default_router()
+    return router.stream(prompt_template, docs, question)
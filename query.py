@@ -0,0 +1,101 @@
+import hashlib
+import os
+from config import FAISS_DIR, MODEL_ORDER, RETRIEVAL_K
+from embeddings import loaded_index_version
+from retriever import HybridRetriever
+from index_store import pin_generation
+from context_packer import pack_context
+from qa_chain import generate_answer_with_fallback_using_prompt, stream_answer_with_fallback_using_prompt
+from model_router import AnswerStream
+from answer_cache import answer_cache
+from tracing import span, start_span, activate
+
+NO_CONTEXT_ERROR = "No matching context found in the index."
+
+def chunk_id_of(doc):
+    """Stable id of a retrieved chunk (indexes built before per-document ids fall back to a text hash)."""
+    chunk_id = doc.metadata.get("chunk_id")
+    if chunk_id:
+        return chunk_id
+    return hashlib.sha256(doc.page_content.encode("utf-8")).hexdigest()
+
+def retrieve(question, k=RETRIEVAL_K, path=FAISS_DIR, timings=None, vector=None):
+    """Return (docs, query_vector_or_None) for `question` using the configured retrieval mode."""
+    return HybridRetriever(path, k=k).retrieve(question, timings, vector)
+
+def _prepare(question, prompt_template, k, path, report, vector=None):
+    """Retrieve, look up the answer cache and pack the context.
+
+    Returns (packed_docs, cache_args, vector, cached_answer_or_None); packed_docs is None
+    when nothing was retrieved. `report` receives "timings" and "context" (packing stats).
+    """
+    report = {} if report is None else report
+    timings = report.setdefault("timings", {})
+    with pin_generation(path) as generation:
+        # the cache key must name the generation the chunks were actually read from
+        generation = generation or path
+        docs, vector = retrieve(question, k, generation, timings, vector)
+        if not docs:
+            return None, None, vector, None
+        # scoped by index root, so a version change only drops that namespace's answers
+        cache_args = (os.path.abspath(path), [chunk_id_of(d) for d in docs], prompt_template.template,
+                      tuple(MODEL_ORDER), loaded_index_version(generation))
+    with span("answer_cache.lookup") as s:
+        cached = answer_cache.get(question, *cache_args, question_vector=vector)
+        s.set(hit=cached is not None)
+    with span("context.pack", chunks=len(docs)) as s:
+        packed, report["context"] = pack_context(docs)
+        s.set(tokens_in=report["context"]["tokens_in"], tokens_out=report["context"]["tokens_out"])
+    return packed, cache_args, vector, cached
+
+def answer_question(question, prompt_template, k=RETRIEVAL_K, path=FAISS_DIR, report=None, vector=None):
+    """Retrieve context and answer through the answer cache; returns (text, model_name, error).
+
+    `vector` is an already computed query embedding, which skips the embedding call.
+    `report` receives the timings and packing stats (see _prepare) and the "query" trace.
+    """
+    report = {} if report is None else report
+    with span("query", streaming=False) as root:
+        report["trace"] = root
+        docs, cache_args, vector, cached = _prepare(question, prompt_template, k, path, report, vector)
+        if docs is None:
+            root.set(outcome="no_context")
+            return None, None, NO_CONTEXT_ERROR
+        if cached:
+            root.set(outcome="cached", model=cached[1])
+            return cached[0], cached[1], None
+        text, model_name, error = generate_answer_with_fallback_using_prompt(prompt_template, docs, question)
+        if text:
+            answer_cache.put(question, *cache_args, text, model_name, question_vector=vector)
+            root.set(outcome="answered", model=model_name)
+        else:
+            root.fail(error)
+        return text, model_name, error
+
+def stream_answer(question, prompt_template, k=RETRIEVAL_K, path=FAISS_DIR, report=None):
+    """Like answer_question but returns an AnswerStream; cached answers are replayed at once.
+
+    The "query" trace stays open until the stream has been consumed.
+    """
+    report = {} if report is None else report
+    root = start_span("query", streaming=True)
+    report["trace"] = root
+    try:
+        with activate(root):
+            docs, cache_args, vector, cached = _prepare(question, prompt_template, k, path, report)
+    except Exception as e:
+        root.finish(e)
+        raise
+    if docs is None:
+        root.set(outcome="no_context")
+        root.finish()
+        return AnswerStream(error=NO_CONTEXT_ERROR)
+    if cached:
+        root.set(outcome="cached", model=cached[1])
+        root.finish()
+        return AnswerStream.from_text(cached[0], cached[1])
+    stream = stream_answer_with_fallback_using_prompt(prompt_template, docs, question)
+    stream.on_complete = lambda s: answer_cache.put(question, *cache_args, s.text, s.model_name,
+                                                    question_vector=vector)
+    stream.trace = root
+    return stream
@@ -0,0 +1,87 @@
+from config import FAISS_DIR, RETRIEVAL_MODE, RETRIEVAL_K, RETRIEVAL_CANDIDATES, RRF_K
+from embeddings import load_vector_store
+from index_store import pin_generation
+from tracing import span
+from lexical_index import load_lexical_index
+
+def _chunk_key(doc):
+    return doc.metadata.get("chunk_id") or doc.page_content
+
+class HybridRetriever:
+    """Vector, BM25 or fused retrieval over the shared index at `path`.
+
+    Each query pins the generation published when it starts, so the vector and lexical
+    indexes it reads always come from the same build.
+
+    "hybrid" merges the top RETRIEVAL_CANDIDATES of both retrievers with reciprocal rank
+    fusion; "lexical" skips the query embedding round trip entirely. Falls back to
+    vector search when no lexical index exists (indexes built before it was added).
+    """
+
+    def __init__(self, path=FAISS_DIR, k=RETRIEVAL_K, mode=RETRIEVAL_MODE,
+                 candidates=RETRIEVAL_CANDIDATES, rrf_k=RRF_K):
+        self.path = path
+        self.k = k
+        self.mode = mode
+        self.candidates = max(candidates, k)
+        self.rrf_k = rrf_k
+
+    def _lexical(self, db, lexical, question, n):
+        docs = []
+        for _, row, _ in lexical.search(question, n):
+            if row < 0:
+                continue
+            doc = db.docstore.search(db.index_to_docstore_id[row])
+            if not isinstance(doc, str):
+                docs.append(doc)
+        return docs
+
+    def retrieve(self, question, timings=None, vector=None):
+        """Return (docs, query_vector_or_None); per-retriever seconds go into `timings`.
+
+        Pass `vector` when the query embedding was already computed (e.g. micro-batched).
+        """
+        timings = {} if timings is None else timings
+        with pin_generation(self.path) as generation, span("retrieve", k=self.k) as s:
+            docs, vector = self._retrieve(generation or self.path, question, timings, s, vector)
+            s.set(docs=len(docs))
+            return docs, vector
+
+    def _retrieve(self, path, question, timings, retrieve_span, vector=None):
+        with span("retrieve.index_load") as s:
+            db = load_vector_store(path)
+        timings["index_load"] = s.duration
+        lexical = load_lexical_index(path) if self.mode != "vector" else None
+        mode = self.mode if lexical is not None and len(lexical) else "vector"
+        retrieve_span.set(mode=mode)
+
+        if mode == "lexical":
+            with span("retrieve.lexical") as s:
+                docs = self._lexical(db, lexical, question, self.k)
+            timings["lexical"] = s.duration
+            return docs, None
+
+        if vector is None:
+            with span("retrieve.embed") as s:
+                vector = db.embedding_function.embed_query(question)
+            timings["embed"] = s.duration
+        n = self.k if mode == "vector" else self.candidates
+        with span("retrieve.vector", candidates=n) as s:
+            vector_docs = db.similarity_search_by_vector(vector, k=n)
+        timings["vector"] = s.duration
+        if mode == "vector":
+            return vector_docs, vector
+
+        with span("retrieve.lexical", candidates=self.candidates) as s:
+            lexical_docs = self._lexical(db, lexical, question, self.candidates)
+        timings["lexical"] = s.duration
+        with span("retrieve.fusion") as s:
+            scores, by_key = {}, {}
+            for ranked in (vector_docs, lexical_docs):
+                for rank, doc in enumerate(ranked):
+                    key = _chunk_key(doc)
+                    by_key.setdefault(key, doc)
+                    scores[key] = scores.get(key, 0.0) + 1.0 / (self.rrf_k + rank + 1)
+            best = sorted(scores, key=scores.get, reverse=True)[:self.k]
+        timings["fusion"] = s.duration
+        return [by_key[key] for key in best], vector
@@ -0,0 +1,303 @@
+"""Async HTTP query service over the same retrieval and answer path as the chat UI.
+
+    python service.py --port 8080          # Google backends, index at FAISS_DIR
+    python service.py --stub --port 8080   # offline: fake embeddings and LLM, seeded demo index
+
+    POST /query    {"question": "...", "style": "plain"|"bullets", "k": 4, "deadline_s": 10}
+    GET  /healthz
+    GET  /metrics  Prometheus text (traced stages plus service counters)
+
+Query embeddings of concurrent requests are micro-batched into one backend call, and
+identical questions already in flight share one answer instead of each calling the LLM.
+Every request has a deadline; a request that misses it gets 504 while the shared work
+keeps running for the other waiters (and the answer cache).
+"""
+import argparse
+import asyncio
+import functools
+import json
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from config import (FAISS_DIR, RETRIEVAL_K, RETRIEVAL_MODE, SERVICE_HOST, SERVICE_PORT, SERVICE_WORKERS,
+                    SERVICE_DEADLINE_SECONDS, QUERY_EMBED_BATCH_SIZE, QUERY_EMBED_BATCH_WAIT_MS, init_config)
+from answer_cache import normalize_question
+from embeddings import embed_queries, use_embeddings
+from index_store import has_index
+from model_router import ModelRouter, set_default_router
+from qa_chain import build_plain_prompt, build_bullets_prompt
+from query import answer_question
+from tracing import prometheus_text
+
+PROMPT_BUILDERS = {"plain": build_plain_prompt, "bullets": build_bullets_prompt}
+MAX_BODY_BYTES = 1024 * 1024
+IDLE_TIMEOUT_SECONDS = 60
+STUB_INDEX_DIR = "stub_index"
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+            413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable",
+            504: "Gateway Timeout"}
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+class QueryEmbeddingBatcher:
+    """Collects query embeddings requested within `max_wait` seconds into one backend call.
+
+    A batch is sent as soon as it holds `max_batch` questions or the oldest one has waited
+    `max_wait`; duplicate questions in a batch are embedded once.
+    """
+
+    def __init__(self, embed_batch, executor, max_batch=QUERY_EMBED_BATCH_SIZE,
+                 max_wait=QUERY_EMBED_BATCH_WAIT_MS / 1000):
+        self.embed_batch = embed_batch
+        self.executor = executor
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._pending = []
+        self._timer = None
+        self.batches = 0
+        self.embedded = 0
+
+    async def embed(self, text):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            asyncio.ensure_future(self._run(batch))
+
+    async def _run(self, batch):
+        texts = list(dict.fromkeys(text for text, _ in batch))
+        self.batches += 1
+        self.embedded += len(texts)
+        try:
+            vectors = await asyncio.get_running_loop().run_in_executor(self.executor, self.embed_batch, texts)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        by_text = dict(zip(texts, vectors))
+        for text, future in batch:
+            if not future.done():
+                future.set_result(by_text[text])
+
+class QueryService:
+    """Answers questions for the HTTP layer: coalescing, embedding batches and deadlines."""
+
+    def __init__(self, path=FAISS_DIR, workers=SERVICE_WORKERS, deadline=SERVICE_DEADLINE_SECONDS):
+        self.path = path
+        self.deadline = deadline
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="query-service")
+        self.batcher = QueryEmbeddingBatcher(embed_queries, self.executor)
+        self.prompts = {style: build() for style, build in PROMPT_BUILDERS.items()}
+        self._inflight = {}
+        self.stats = {"requests": 0, "coalesced": 0, "timeouts": 0, "errors": 0}
+
+    async def answer(self, question, style="plain", k=RETRIEVAL_K, deadline=None):
+        """Return the answer dict, sharing work with an identical in-flight question."""
+        self.stats["requests"] += 1
+        key = (normalize_question(question), style, k)
+        task = self._inflight.get(key)
+        coalesced = task is not None
+        if coalesced:
+            self.stats["coalesced"] += 1
+        else:
+            task = asyncio.ensure_future(self._answer(question, style, k))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        start = time.perf_counter()
+        try:
+            # shielded: one caller timing out must not cancel the answer others are waiting for
+            result = await asyncio.wait_for(asyncio.shield(task), deadline or self.deadline)
+        except asyncio.TimeoutError:
+            self.stats["timeouts"] += 1
+            raise HTTPError(504, f"No answer within {deadline or self.deadline:g}s")
+        if result["error"]:
+            self.stats["errors"] += 1
+        return dict(result, coalesced=coalesced, latency_ms=round((time.perf_counter() - start) * 1000, 3))
+
+    async def _answer(self, question, style, k):
+        vector = None
+        if RETRIEVAL_MODE != "lexical":
+            vector = await self.batcher.embed(question)
+        report = {}
+        call = functools.partial(answer_question, question, self.prompts[style], k=k, path=self.path,
+                                 report=report, vector=vector)
+        text, model_name, error = await asyncio.get_running_loop().run_in_executor(self.executor, call)
+        return {
+            "answer": text, "model": model_name, "error": error,
+            "retrieval_ms": {stage: round(seconds * 1000, 3) for stage, seconds in report.get("timings", {}).items()},
+            "context_tokens": report.get("context", {}).get("tokens_out"),
+        }
+
+    def metrics_text(self):
+        lines = [f"# TYPE chatpdf_service_{name}_total counter\nchatpdf_service_{name}_total {value}"
+                 for name, value in self.stats.items()]
+        lines.append(f"# TYPE chatpdf_service_embed_batches_total counter\n"
+                     f"chatpdf_service_embed_batches_total {self.batcher.batches}")
+        lines.append(f"# TYPE chatpdf_service_embedded_queries_total counter\n"
+                     f"chatpdf_service_embedded_queries_total {self.batcher.embedded}")
+        return prometheus_text() + "\n".join(lines) + "\n"
+
+def _parse_query(body):
+    try:
+        payload = json.loads(body or b"{}")
+    except ValueError:
+        raise HTTPError(400, "Body must be JSON")
+    question = payload.get("question") if isinstance(payload, dict) else None
+    if not isinstance(question, str) or not question.strip():
+        raise HTTPError(400, "\"question\" is required")
+    style = payload.get("style", "plain")
+    if style not in PROMPT_BUILDERS:
+        raise HTTPError(400, f"\"style\" must be one of {sorted(PROMPT_BUILDERS)}")
+    try:
+        k = int(payload.get("k", RETRIEVAL_K))
+        deadline = float(payload["deadline_s"]) if payload.get("deadline_s") is not None else None
+    except (TypeError, ValueError):
+        raise HTTPError(400, "\"k\" and \"deadline_s\" must be numbers")
+    if not 1 <= k <= 50 or (deadline is not None and deadline <= 0):
+        raise HTTPError(400, "\"k\" must be 1-50 and \"deadline_s\" positive")
+    return question, style, k, deadline
+
+async def _read_request(reader):
+    """Return (method, path, headers, body), or None when the client closed the connection."""
+    line = await reader.readline()
+    if not line:
+        return None
+    parts = line.decode("latin-1").split()
+    if len(parts) != 3:
+        raise HTTPError(400, "Malformed request line")
+    method, target, _ = parts
+    headers = {}
+    while True:
+        header = await reader.readline()
+        if header in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = header.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    try:
+        length = int(headers.get("content-length") or 0)
+    except ValueError:
+        raise HTTPError(400, "Content-Length must be a number")
+    if length < 0:
+        raise HTTPError(400, "Content-Length must not be negative")
+    if length > MAX_BODY_BYTES:
+        raise HTTPError(413, "Request body too large")
+    body = await reader.readexactly(length) if length else b""
+    return method, target.split("?", 1)[0], headers, body
+
+def _response(status, body, content_type="application/json", keep_alive=True):
+    if not isinstance(body, bytes):
+        body = (json.dumps(body) if content_type == "application/json" else body).encode("utf-8")
+    head = (f"HTTP/1.1 {status} {_REASONS.get(status, '')}\r\nContent-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+    return head.encode("latin-1") + body
+
+async def _route(service, method, path, body):
+    if path == "/query":
+        if method != "POST":
+            raise HTTPError(405, "Use POST")
+        question, style, k, deadline = _parse_query(body)
+        return 200, await service.answer(question, style, k, deadline), "application/json"
+    if path == "/healthz":
+        return 200, {"ok": True, "index": has_index(service.path)}, "application/json"
+    if path == "/metrics":
+        return 200, service.metrics_text(), "text/plain; version=0.0.4"
+    raise HTTPError(404, f"No route for {path}")
+
+async def handle_connection(service, reader, writer):
+    """Serve HTTP/1.1 requests on one connection until the client closes it (keep-alive)."""
+    try:
+        while True:
+            try:
+                request = await asyncio.wait_for(_read_request(reader), IDLE_TIMEOUT_SECONDS)
+            except HTTPError as e:
+                writer.write(_response(e.status, {"error": str(e)}, keep_alive=False))
+                break
+            if request is None:
+                break
+            method, path, headers, body = request
+            keep_alive = headers.get("connection", "").lower() != "close"
+            try:
+                status, payload, content_type = await _route(service, method, path, body)
+            except HTTPError as e:
+                status, payload, content_type = e.status, {"error": str(e)}, "application/json"
+            except Exception as e:
+                status, payload, content_type = 500, {"error": f"{type(e).__name__}: {e}"}, "application/json"
+            writer.write(_response(status, payload, content_type, keep_alive))
+            await writer.drain()
+            if not keep_alive:
+                break
+    except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+def _seed_stub_index(path, n_docs=20, words_per_doc=3000):
+    """Fill an empty index with deterministic synthetic documents for offline load tests."""
+    rng = random.Random(0)
+    vocabulary = ["".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(3, 9)))
+                  for _ in range(2000)]
+    docs = ({"doc_id": f"stub-{i}", "name": f"stub-{i}.pdf",
+             "text": " ".join(rng.choice(vocabulary) for _ in range(words_per_doc))} for i in range(n_docs))
+    from ingest import ingest_documents
+    ingest_documents(docs, path=path)
+
+def use_stub_backends(llm_latency=0.0):
+    """Serve with fake embeddings and chat models (no network, deterministic answers)."""
+    from fakes import FakeEmbeddings, fake_client_factory
+    use_embeddings(FakeEmbeddings())
+    set_default_router(ModelRouter(client_factory=fake_client_factory(latency=llm_latency)))
+
+async def serve(service, host=SERVICE_HOST, port=SERVICE_PORT, ready=None):
+    server = await asyncio.start_server(functools.partial(handle_connection, service), host, port)
+    if ready is not None:
+        ready(server)
+    async with server:
+        await server.serve_forever()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve PDF question answering over HTTP.")
+    parser.add_argument("--host", default=SERVICE_HOST)
+    parser.add_argument("--port", type=int, default=SERVICE_PORT)
+    parser.add_argument("--index", help=f"index store directory (default: {FAISS_DIR}, or {STUB_INDEX_DIR} with --stub)")
+    parser.add_argument("--workers", type=int, default=SERVICE_WORKERS)
+    parser.add_argument("--deadline", type=float, default=SERVICE_DEADLINE_SECONDS,
+                        help="default per-request deadline in seconds")
+    parser.add_argument("--stub", action="store_true", help="use fake embedding and LLM backends (offline)")
+    parser.add_argument("--stub-latency", type=float, default=0.5, help="fake LLM latency in seconds")
+    args = parser.parse_args(argv)
+
+    if args.stub:
+        path = args.index or STUB_INDEX_DIR
+        use_stub_backends(args.stub_latency)
+        if not has_index(path):
+            _seed_stub_index(path)
+    else:
+        path = args.index or FAISS_DIR
+        init_config()
+    service = QueryService(path, workers=args.workers, deadline=args.deadline)
+    print(f"Serving {path} on http://{args.host}:{args.port} ({'stub' if args.stub else 'google'} backends)",
+          file=sys.stderr)
+    try:
+        asyncio.run(serve(service, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,53 @@
+"""SQLite plumbing shared by the page cache, the embedding cache and the conversation store."""
+import os
+import sqlite3
+import threading
+
+# after an eviction a byte-capped table is trimmed down to this fraction of the cap
+LOW_WATERMARK = 0.8
+
+def connect(path, schema, **kwargs):
+    """Open the database at `path` in WAL mode and apply `schema`.
+
+    The connection may be used from any thread; callers serialize access with their own
+    lock. `kwargs` go to sqlite3.connect (e.g. isolation_level, timeout).
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    db = sqlite3.connect(path, check_same_thread=False, **kwargs)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    db.executescript(schema)
+    return db
+
+def evict_lru(db, table, size_expr, max_bytes):
+    """Delete the least recently used rows of `table` that do not fit under LOW_WATERMARK * max_bytes.
+
+    Rows need a `last_used` column; `size_expr` is the SQL expression of a row's size.
+    Returns the number of rows deleted. Run it inside the caller's write transaction.
+    """
+    # keep the most recently used rows whose running total fits under the low watermark
+    return db.execute(
+        f"DELETE FROM {table} WHERE rowid IN (SELECT rowid FROM (SELECT rowid, SUM({size_expr}) "
+        f"OVER (ORDER BY last_used DESC, rowid DESC) AS running FROM {table}) WHERE running > ?)",
+        (int(max_bytes * LOW_WATERMARK),)).rowcount
+
+class ProcessWide:
+    """Process-wide instance of `factory`, created on the first call: `get_x = ProcessWide(X)`."""
+
+    def __init__(self, factory):
+        self.factory = factory
+        self._instance = None
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        with self._lock:
+            if self._instance is None:
+                self._instance = self.factory()
+            return self._instance
+
+    def reset(self):
+        """Forget the instance, so the next call opens a new one (e.g. in another directory)."""
+        with self._lock:
+            self._instance = None
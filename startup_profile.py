@@ -0,0 +1,95 @@
+"""Startup import profile: how long the app takes to import before its first paint.
+
+Imports the app in a fresh interpreter under `python -X importtime`, with Streamlit
+preloaded (as it is under `streamlit run`), and reports the cumulative import time of each
+module the app pulls in. The exit status is 1 when the total exceeds the budget
+(config.STARTUP_IMPORT_BUDGET_MS), so heavy imports cannot creep back onto the first paint.
+
+    python startup_profile.py
+    python startup_profile.py --module service --preload "" --budget-ms 2000
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from config import STARTUP_IMPORT_BUDGET_MS
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+def parse_importtime(stderr):
+    """[(depth, name, self_us, cumulative_us)] from -X importtime output, in print order."""
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip(" ")) - 1) // 2
+        entries.append((depth, name.strip(), int(self_us), int(cumulative_us)))
+    return entries
+
+def module_profile(entries, module):
+    """Total time of `module` and the cumulative time of each module it imported directly.
+
+    -X importtime prints a module after everything it imported, so the direct imports are the
+    depth-1 entries between the module's own line and the previous top-level one.
+    """
+    for end in range(len(entries) - 1, -1, -1):
+        depth, name, _, cumulative = entries[end]
+        if depth == 0 and name == module:
+            break
+    else:
+        raise ValueError(f"{module} was not imported (already loaded by a preloaded module?)")
+    children = []
+    for depth, name, _, child_cumulative in reversed(entries[:end]):
+        if depth == 0:
+            break
+        if depth == 1:
+            children.append((name, child_cumulative))
+    return cumulative, sorted(children, key=lambda c: -c[1])
+
+def profile(module="app", preload=("streamlit",), runs=3):
+    """Import `module` in `runs` fresh interpreters; returns the fastest run's profile in ms."""
+    code = "".join(f"import {name}; " for name in preload) + f"import {module}"
+    best = None
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=HERE,
+                                capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"importing {module} failed:\n{result.stderr[-2000:]}")
+        total, children = module_profile(parse_importtime(result.stderr), module)
+        if best is None or total < best[0]:
+            best = (total, children)
+    total, children = best
+    return {"module": module, "preload": list(preload), "total_ms": round(total / 1000, 2),
+            "imports_ms": {name: round(us / 1000, 2) for name, us in children}}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Report per-module import time of the app's startup.")
+    parser.add_argument("--module", default="app", help="module to profile (default: %(default)s)")
+    parser.add_argument("--preload", default="streamlit",
+                        help="comma-separated modules imported first and not counted (default: %(default)s)")
+    parser.add_argument("--budget-ms", type=float, default=STARTUP_IMPORT_BUDGET_MS)
+    parser.add_argument("--runs", type=int, default=3, help="fresh interpreters; the fastest run is reported")
+    parser.add_argument("--top", type=int, default=15, help="direct imports listed (default: %(default)s)")
+    parser.add_argument("--json", action="store_true", help="print the full profile as JSON")
+    args = parser.parse_args(argv)
+
+    preload = tuple(name.strip() for name in args.preload.split(",") if name.strip())
+    result = profile(args.module, preload, max(1, args.runs))
+    over_budget = result["total_ms"] > args.budget_ms
+    if args.json:
+        print(json.dumps(dict(result, budget_ms=args.budget_ms, over_budget=over_budget), indent=2))
+    else:
+        print(f"import {args.module}: {result['total_ms']:.1f} ms (budget {args.budget_ms:.0f} ms)"
+              + (f", after preloading {', '.join(preload)}" if preload else ""))
+        for name, ms in list(result["imports_ms"].items())[:args.top]:
+            print(f"  {ms:9.1f} ms  {name}")
+    if over_budget:
+        print(f"startup import time {result['total_ms']:.1f} ms exceeds the {args.budget_ms:.0f} ms budget",
+              file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,62 @@
+"""Answer cache: keys, per-namespace invalidation, TTL, LRU and semantic matches."""
+from types import SimpleNamespace
+import pytest
+import answer_cache
+from answer_cache import AnswerCache, normalize_question
+
+CONTEXT = (["doc:0", "doc:1"], "template", ("model-a",))
+
+def put(cache, question, scope="/index", version="v1", text="answer", vector=None):
+    cache.put(question, scope, *CONTEXT, version, text, "model-a", question_vector=vector)
+
+def get(cache, question, scope="/index", version="v1", vector=None):
+    return cache.get(question, scope, *CONTEXT, version, question_vector=vector)
+
+def test_normalized_question_hits():
+    cache = AnswerCache()
+    put(cache, "What is the warranty?")
+    assert normalize_question("  what IS the   warranty?! ") == "what is the warranty"
+    assert get(cache, "  what IS the   warranty?! ") == ("answer", "model-a")
+    assert cache.get("What is the warranty?", "/index", ["doc:0"], "template", ("model-a",), "v1") is None
+
+def test_version_change_only_drops_that_namespace():
+    cache = AnswerCache()
+    put(cache, "q", scope="/a", text="from a")
+    put(cache, "q", scope="/b", text="from b")
+    for _ in range(3):
+        assert get(cache, "q", scope="/a") == ("from a", "model-a")
+        assert get(cache, "q", scope="/b") == ("from b", "model-a")
+    assert get(cache, "q", scope="/a", version="v2") is None
+    assert get(cache, "q", scope="/b") == ("from b", "model-a")
+    stats = cache.get_stats()
+    assert stats["invalidations"] == 1 and stats["entries"] == 1
+
+def test_entries_expire_after_ttl(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(answer_cache, "time", SimpleNamespace(monotonic=lambda: now[0]))
+    cache = AnswerCache(ttl_seconds=10)
+    put(cache, "q")
+    now[0] += 10
+    assert get(cache, "q") is not None
+    now[0] += 1
+    assert get(cache, "q") is None
+    assert cache.get_stats()["entries"] == 0
+
+def test_least_recently_used_entry_is_evicted():
+    cache = AnswerCache(max_entries=2)
+    put(cache, "first")
+    put(cache, "second")
+    get(cache, "first")
+    put(cache, "third")
+    assert get(cache, "second") is None
+    assert get(cache, "first") is not None and get(cache, "third") is not None
+    assert cache.get_stats()["evictions"] == 1
+
+@pytest.mark.parametrize("vector, scope, hit", [([1.0, 0.01], "/index", True), ([0.0, 1.0], "/index", False),
+                                                ([1.0, 0.01], "/other", False)])
+def test_semantic_match_needs_similar_vector_and_same_scope(vector, scope, hit):
+    cache = AnswerCache(semantic=True, semantic_threshold=0.95)
+    put(cache, "how long is the warranty", vector=[1.0, 0.0])
+    found = get(cache, "what is the warranty period", scope=scope, vector=vector)
+    assert (found == ("answer", "model-a")) is hit
+    assert cache.get_stats()["semantic_hits"] == int(hit)
@@ -0,0 +1,95 @@
+"""Page text cache, embedding cache and the page fingerprints that key the page cache."""
+import io
+import os
+import random
+import pytest
+from PyPDF2 import PdfReader
+from bench import _vocabulary, make_pdf
+from embedding_cache import DB_NAME, CachedEmbeddings, EmbeddingCache
+from page_cache import PageTextCache
+from parsers import EXTRACTOR_VERSION, iter_pdf_pages, page_fingerprint
+
+class CountingEmbeddings:
+    def __init__(self):
+        self.embedded = []
+
+    def embed_documents(self, texts):
+        self.embedded.extend(texts)
+        return [[float(len(text)), 1.0] for text in texts]
+
+    def embed_query(self, text):
+        return [0.0, 1.0]
+
+def test_page_cache_serves_whole_files_and_single_pages(tmp_path):
+    cache = PageTextCache(str(tmp_path / "pages.sqlite3"))
+    cache.put_pages("v1", [("h1", "first page"), ("h2", "second page")])
+    cache.put_file("file", "v1", ["h1", "h2"])
+    assert cache.file_pages("file", "v1") == [(1, "first page"), (2, "second page")]
+    assert cache.file_pages("file", "v2") is None
+    assert cache.get_pages(["h2", "h3"], "v1") == {"h2": "second page"}
+    stats = cache.get_stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (3, 1, 2)
+
+def test_page_cache_evicts_least_recently_used_pages_and_their_file_maps(tmp_path):
+    rng = random.Random(0)
+    text = lambda: "".join(rng.choice("abcdefghij") for _ in range(2000))
+    cache = PageTextCache(str(tmp_path / "pages.sqlite3"), max_bytes=8000)
+    cache.put_pages("v1", [("old", text())])
+    cache.put_file("old-file", "v1", ["old"])
+    for i in range(10):
+        cache.put_pages("v1", [(f"p{i}", text())])
+    stats = cache.get_stats()
+    assert stats["evictions"] > 0 and stats["bytes"] <= 8000
+    assert cache.get_pages(["old"], "v1") == {}
+    assert cache.file_pages("old-file", "v1") is None
+    assert cache.get_pages(["p9"], "v1")
+
+def test_second_extraction_of_a_file_is_served_from_the_page_cache(tmp_path):
+    cache = PageTextCache(str(tmp_path / "pages.sqlite3"))
+    pdf = make_pdf(3, random.Random(1), _vocabulary(random.Random(0)))
+    first = list(iter_pdf_pages([io.BytesIO(pdf)], workers=1, page_cache=cache))
+    hits = cache.get_stats()["hits"]
+    again = list(iter_pdf_pages([io.BytesIO(pdf)], workers=1, page_cache=cache))
+    assert again == first and len(first) == 3
+    assert cache.get_stats()["hits"] == hits + 3
+    assert cache.file_pages(first[0]["doc_id"], EXTRACTOR_VERSION) is not None
+
+def test_page_fingerprints_depend_on_content_not_on_the_reader():
+    words = _vocabulary(random.Random(0))
+    pdf = make_pdf(2, random.Random(2), words)
+    first = [page_fingerprint(p) for p in PdfReader(io.BytesIO(pdf)).pages]
+    second = [page_fingerprint(p) for p in PdfReader(io.BytesIO(pdf)).pages]
+    assert first == second and first[0] != first[1]
+    other = make_pdf(2, random.Random(3), words)
+    assert not set(first) & {page_fingerprint(p) for p in PdfReader(io.BytesIO(other)).pages}
+
+def test_embedding_cache_round_trips_float32_vectors(tmp_path):
+    cache = EmbeddingCache(str(tmp_path))
+    cache.put_many("model", ["a", "b"], [[0.5, -1.25], [3.0, 4.0]])
+    assert cache.get_many("model", ["b", "missing", "a"]) == [[3.0, 4.0], None, [0.5, -1.25]]
+    assert cache.get_many("other-model", ["a"]) == [None]
+    # a second connection, as another process would open it, sees the committed vectors
+    assert EmbeddingCache(str(tmp_path)).get_many("model", ["a"]) == [[0.5, -1.25]]
+
+def test_embedding_cache_evicts_down_to_the_low_watermark(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), max_bytes=10 * 64 * 4)
+    for i in range(30):
+        cache.put_many("model", [f"text {i}"], [[float(i)] * 64])
+    stats = cache.get_stats()
+    assert stats["bytes"] <= 10 * 64 * 4 and stats["evictions"] == 30 - stats["entries"]
+    assert cache.get_many("model", ["text 29"]) == [[29.0] * 64]
+    assert cache.get_many("model", ["text 0"]) == [None]
+
+def test_embedding_cache_removes_the_legacy_flat_files(tmp_path):
+    for name in ("vectors.f32", "index.json"):
+        (tmp_path / name).write_bytes(b"old")
+    EmbeddingCache(str(tmp_path))
+    assert sorted(n for n in os.listdir(tmp_path) if not n.startswith(DB_NAME)) == []
+
+def test_cached_embeddings_only_send_misses_to_the_backend(tmp_path):
+    backend = CountingEmbeddings()
+    embeddings = CachedEmbeddings(backend, "model", EmbeddingCache(str(tmp_path)))
+    assert embeddings.embed_documents(["a", "bb"]) == [[1.0, 1.0], [2.0, 1.0]]
+    assert embeddings.embed_documents(["bb", "ccc", "ccc"]) == [[2.0, 1.0], [3.0, 1.0], [3.0, 1.0]]
+    assert backend.embedded == ["a", "bb", "ccc"]
+    assert embeddings.embed_query("a") == [0.0, 1.0]
@@ -0,0 +1,50 @@
+"""Context packing: neighbour stitching, near-duplicate removal and the token budget."""
+from langchain_core.documents import Document
+from context_packer import estimate_tokens, pack_context
+
+def chunk(doc_id, n, text):
+    return Document(page_content=text, metadata={"doc_id": doc_id, "chunk": n, "chunk_id": f"{doc_id}:{n}"})
+
+OVERLAP = "the overlap the splitter repeats at the start of the next chunk, long enough. "
+
+def test_consecutive_chunks_are_stitched_without_repeating_the_overlap():
+    first = chunk("d", 0, "Opening section of the document. " + OVERLAP)
+    second = chunk("d", 1, OVERLAP + "Closing section of the document.")
+    packed, stats = pack_context([second, first])
+    assert len(packed) == 1
+    assert packed[0].page_content.count(OVERLAP) == 1
+    assert packed[0].page_content.startswith("Opening") and packed[0].page_content.endswith("document.")
+    assert packed[0].metadata["chunks"] == [0, 1]
+    assert stats["merged"] == 1
+
+def test_short_coincidental_overlap_is_not_stitched():
+    first = chunk("d", 0, "The limit is ten")
+    second = chunk("d", 1, "ten units per order.")
+    packed, _ = pack_context([first, second])
+    assert packed[0].page_content == "The limit is ten\nten units per order."
+
+def test_near_duplicates_are_dropped_keeping_the_more_relevant_copy():
+    text = "identical paragraph about installing the pump on a level concrete base with four bolts"
+    packed, stats = pack_context([chunk("a", 0, text), chunk("b", 5, text + "."), chunk("c", 0, "something else")])
+    assert [d.metadata["doc_id"] for d in packed] == ["a", "c"]
+    assert stats["dropped"] == 1
+
+def test_budget_keeps_chunks_in_relevance_order():
+    docs = [chunk(f"d{i}", 0, f"chunk number {i} " * 40) for i in range(4)]
+    budget = estimate_tokens(docs[0].page_content) * 2
+    packed, stats = pack_context(docs, token_budget=budget)
+    assert [d.metadata["doc_id"] for d in packed] == ["d0", "d1"]
+    assert stats["dropped"] == 2
+    assert stats["tokens_out"] <= budget
+    assert stats["tokens_saved"] == stats["tokens_in"] - stats["tokens_out"]
+
+def test_a_single_oversized_chunk_is_trimmed_to_the_budget():
+    packed, stats = pack_context([chunk("d", 0, "x" * 4000)], token_budget=100)
+    assert len(packed[0].page_content) == 400
+    assert stats["tokens_out"] == 100
+
+def test_merged_run_ranks_as_its_best_chunk():
+    docs = [chunk("a", 3, "most relevant chunk of document a"), chunk("b", 0, "document b"),
+            chunk("a", 4, "next chunk of document a")]
+    packed, _ = pack_context(docs)
+    assert [d.metadata["doc_id"] for d in packed] == ["a", "b"]
@@ -0,0 +1,84 @@
+"""ConversationStore positions, paging and lookups, and the streamed transcript export."""
+import threading
+import conversation_store
+from conversation_store import ConversationStore, get_conversation_store, new_conversation_id
+from utils import export_conversation_file
+
+def make_store(tmp_path):
+    return ConversationStore(str(tmp_path / "conversations.sqlite3"))
+
+def test_messages_are_numbered_per_conversation(tmp_path):
+    store = make_store(tmp_path)
+    first, second = new_conversation_id(), new_conversation_id()
+    assert store.count(first) == 0
+    assert store.add(first, "user", "hello")["id"] == 0
+    assert store.add(second, "user", "other")["id"] == 0
+    answer = store.add(first, "assistant", "hi", reply_to=0)
+    assert (answer["id"], answer["reply_to"]) == (1, 0)
+    assert store.count(first) == 2
+    assert [m["text"] for m in store.page(first, 0, 10)] == ["hello", "hi"]
+    assert store.page(first, 1, 2) == [store.get(first, 1)]
+    assert store.get(first, 5) is None
+
+def test_question_and_answer_lookups(tmp_path):
+    store = make_store(tmp_path)
+    conv = new_conversation_id()
+    store.add(conv, "user", "q0")
+    store.add(conv, "assistant", "a0", reply_to=0)
+    store.add(conv, "user", "q2")
+    store.add(conv, "assistant", "a3")
+    store.add(conv, "user", "q4")
+    assert store.question_for(conv, 1)["text"] == "q0"
+    # without a reply_to link the closest earlier question is used
+    assert store.question_for(conv, 3)["text"] == "q2"
+    assert store.question_for(conv, 9) is None
+    assert store.find_answer(conv) == 3
+    assert store.find_answer(conv, at=2) == 3
+    assert store.find_answer(conv, at=4) is None
+
+def test_iter_messages_crosses_batch_boundaries(tmp_path, monkeypatch):
+    monkeypatch.setattr(conversation_store, "_EXPORT_BATCH", 3)
+    store = make_store(tmp_path)
+    conv = new_conversation_id()
+    for i in range(7):
+        store.add(conv, "user", f"m{i}")
+    assert [m["id"] for m in store.iter_messages(conv)] == list(range(7))
+    for i in range(7, 9):
+        store.add(conv, "user", f"m{i}")
+    assert [m["id"] for m in store.iter_messages(conv)] == list(range(9))
+
+def test_clear_only_removes_one_conversation(tmp_path):
+    store = make_store(tmp_path)
+    kept, cleared = new_conversation_id(), new_conversation_id()
+    store.add(kept, "user", "keep me")
+    store.add(cleared, "user", "drop me")
+    store.clear(cleared)
+    assert store.count(cleared) == 0 and store.count(kept) == 1
+    assert store.add(cleared, "user", "again")["id"] == 0
+
+def test_concurrent_writers_on_one_file_never_share_a_position(tmp_path):
+    stores = [make_store(tmp_path), make_store(tmp_path)]
+    conv = new_conversation_id()
+
+    def write(store):
+        for i in range(50):
+            store.add(conv, "user", str(i))
+    threads = [threading.Thread(target=write, args=(store,)) for store in stores]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert stores[0].count(conv) == 100
+    assert [m["id"] for m in stores[1].iter_messages(conv)] == list(range(100))
+
+def test_export_writes_every_message_in_order(workdir):
+    store = get_conversation_store()
+    conv = new_conversation_id()
+    for i in range(5):
+        store.add(conv, "user" if i % 2 == 0 else "assistant", f"message {i}")
+    with export_conversation_file(conv, batch=2) as out:
+        lines = out.read().decode("utf-8").splitlines()
+    assert len(lines) == 5
+    assert lines[0].endswith("] You: message 0")
+    assert lines[1].endswith("] Assistant: message 1")
+    assert lines[4].endswith("] You: message 4")
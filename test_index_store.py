@@ -0,0 +1,58 @@
+"""Versioned index store: publishing, pinning and garbage collection of generations."""
+import os
+import pytest
+from index_store import (collect_garbage, current_generation, has_index, namespace_root, new_generation,
+                         pin_generation, publish_generation, stale_generations)
+
+def publish_new(root):
+    generation = new_generation(root)
+    publish_generation(root, generation)
+    return generation
+
+def test_publish_swaps_current_and_unpublish_removes_it(tmp_path):
+    root = str(tmp_path / "store")
+    assert current_generation(root) is None
+    first = new_generation(root)
+    assert current_generation(root) is None  # built but not published yet
+    publish_generation(root, first)
+    assert current_generation(root) == first
+    second = publish_new(root)
+    assert current_generation(root) == second
+    publish_generation(root, None)
+    assert current_generation(root) is None and not has_index(root)
+
+def test_gc_keeps_current_recent_and_pinned_generations(tmp_path):
+    root = str(tmp_path / "store")
+    oldest = publish_new(root)
+    with pin_generation(root) as pinned:
+        assert pinned == oldest
+        older = publish_new(root)
+        recent = publish_new(root)
+        current = publish_new(root)
+        removed = collect_garbage(root, keep=1)
+        assert removed == [older]
+        assert all(os.path.isdir(g) for g in (oldest, recent, current))
+    assert collect_garbage(root, keep=1) == [oldest]
+    assert collect_garbage(root, keep=0) == [recent]
+    assert current_generation(root) == current and os.path.isdir(current)
+
+def test_stale_generations_skips_pinned_and_other_stores(tmp_path):
+    root = str(tmp_path / "store")
+    old = os.path.abspath(publish_new(root))
+    other_store = os.path.abspath(publish_new(str(tmp_path / "other")))
+    new = os.path.abspath(publish_new(root))
+    cached = [old, new, other_store]
+    assert stale_generations(new, cached) == [old]
+    with pin_generation(root):
+        publish_generation(root, old)
+        with pin_generation(root):
+            assert stale_generations(new, cached) == []
+
+def test_namespaces_get_their_own_store(tmp_path):
+    base = str(tmp_path / "store")
+    assert namespace_root(None, base) == base
+    team = namespace_root("team-a", base)
+    publish_new(team)
+    assert has_index(team) and not has_index(base)
+    with pytest.raises(ValueError):
+        namespace_root("../escape", base)
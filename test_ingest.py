@@ -0,0 +1,107 @@
+"""Pipelined ingest into the index store, including its abort paths."""
+import threading
+import pytest
+from embedders import EmbedderMismatchError
+from embeddings import IndexWriter, remove_document, use_embeddings
+from fakes import FakeEmbeddings
+from index_store import get_index_info, list_documents
+from ingest import IngestPipeline, ingest_documents, ingest_pdfs
+
+class Interrupted(BaseException):
+    """Like Streamlit's RerunException: not an Exception, raised from the progress callback."""
+
+def run_in_thread(fn, timeout=60):
+    result = {}
+
+    def target():
+        try:
+            result["value"] = fn()
+        except BaseException as e:
+            result["error"] = e
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "ingest did not return"
+    return result
+
+def test_ingest_adds_documents_and_skips_known_ones(workdir, make_upload):
+    summary = ingest_pdfs([make_upload("a.pdf", seed=1), make_upload("b.pdf", seed=2)], path="index")
+    assert sorted(summary["added"]) == ["a.pdf", "b.pdf"]
+    assert summary["chunks"] > 0 and summary["failures"] == []
+    assert sorted(name for _, name, _ in list_documents("index")) == ["a.pdf", "b.pdf"]
+
+    again = ingest_pdfs([make_upload("a-copy.pdf", seed=1), make_upload("a-again.pdf", seed=1)], path="index")
+    assert again["added"] == []
+    assert again["skipped"] == ["a-copy.pdf", "a-again.pdf"]
+
+def test_unreadable_file_is_reported(workdir, make_upload):
+    broken = make_upload("broken.pdf")
+    broken.seek(0)
+    broken.truncate(100)
+    summary = ingest_pdfs([broken, make_upload("ok.pdf", seed=3)], path="index")
+    assert summary["added"] == ["ok.pdf"]
+    assert [name for name, _ in summary["failures"]] == ["broken.pdf"]
+
+def test_base_exception_from_progress_callback_stops_the_pipeline(workdir, make_upload):
+    uploads = [make_upload(f"{i}.pdf", pages=200, seed=10 + i) for i in range(4)]
+
+    def callback(message):
+        raise Interrupted()
+    pipeline = IngestPipeline("index", queue_size=8, batch_size=4, workers=1, progress_callback=callback,
+                              report_interval=0.0)
+    result = run_in_thread(lambda: pipeline.run(uploads))
+    assert isinstance(result.get("error"), Interrupted)
+    assert list_documents("index") == []
+    # the write locks were released: the next ingest goes through
+    result = run_in_thread(lambda: ingest_pdfs(uploads[:1], path="index"))
+    assert result["value"]["added"] == ["0.pdf"]
+
+def test_stage_error_aborts_without_publishing(workdir, make_upload, monkeypatch):
+    ingest_pdfs([make_upload("kept.pdf", seed=4)], path="index")
+
+    def fail(self, texts, progress_callback=None):
+        raise RuntimeError("embedding backend down")
+    monkeypatch.setattr("embed_scheduler.EmbeddingScheduler.embed", fail)
+    pipeline = IngestPipeline("index", queue_size=8)
+    result = run_in_thread(lambda: pipeline.run([make_upload("new.pdf", pages=50, seed=5)]))
+    assert isinstance(result.get("error"), RuntimeError)
+    assert [name for _, name, _ in list_documents("index")] == ["kept.pdf"]
+    with IndexWriter("index") as writer:
+        assert len(writer.known_documents()) == 1
+
+def test_remove_works_on_an_index_from_another_embedder(workdir, make_upload):
+    ingest_pdfs([make_upload("a.pdf", seed=6), make_upload("b.pdf", seed=7)], path="index")
+    built_with = get_index_info("index")["embedder"]
+    use_embeddings(FakeEmbeddings(dim=64), embedder="other-embedder")
+    with pytest.raises(EmbedderMismatchError):
+        ingest_pdfs([make_upload("c.pdf", seed=8)], path="index")
+    doc_id = next(doc_id for doc_id, name, _ in list_documents("index") if name == "a.pdf")
+    assert remove_document(doc_id, "index")
+    assert [name for _, name, _ in list_documents("index")] == ["b.pdf"]
+    assert get_index_info("index")["embedder"] == built_with
+
+def test_full_rebuild_keeps_the_old_index_until_it_commits(workdir, make_upload, monkeypatch):
+    ingest_pdfs([make_upload("old.pdf", seed=9)], path="index")
+    seen_during_rebuild = []
+
+    def callback(message):
+        seen_during_rebuild.append(sorted(name for _, name, _ in list_documents("index")))
+    summary = IngestPipeline("index", progress_callback=callback, report_interval=0.0, rebuild=True).run(
+        [make_upload("old.pdf", seed=9), make_upload("new.pdf", seed=10)])
+    assert sorted(summary["added"]) == ["new.pdf", "old.pdf"]
+    assert seen_during_rebuild[0] == ["old.pdf"]
+
+    def fail(self, texts, progress_callback=None):
+        raise RuntimeError("quota exhausted")
+    monkeypatch.setattr("embed_scheduler.EmbeddingScheduler.embed", fail)
+    with pytest.raises(RuntimeError):
+        ingest_pdfs([make_upload("replacement.pdf", seed=11)], path="index", rebuild=True)
+    assert sorted(name for _, name, _ in list_documents("index")) == ["new.pdf", "old.pdf"]
+
+def test_ingest_documents_runs_through_the_pipeline(workdir):
+    docs = [{"doc_id": f"doc-{i}", "name": f"doc-{i}.txt", "text": f"section {i} " * 800} for i in range(3)]
+    summary = ingest_documents(iter(docs), path="index")
+    assert summary["added"] == ["doc-0.txt", "doc-1.txt", "doc-2.txt"]
+    assert summary["stages"]["index"]["items"] == summary["chunks"] > 3
+    again = ingest_documents(docs[:1] + [docs[0]], path="index")
+    assert again["added"] == [] and again["skipped"] == ["doc-0.txt", "doc-0.txt"]
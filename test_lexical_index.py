@@ -0,0 +1,73 @@
+"""BM25 lexical index and the hybrid retriever's rank fusion."""
+import os
+from ingest import ingest_documents
+from lexical_index import LEXICAL_NAME, LexicalIndex, load_lexical_index, tokenize
+from index_store import current_generation
+from retriever import HybridRetriever
+
+def test_tokenize_keeps_identifiers_and_adds_their_parts():
+    assert tokenize("Order PART-ab1234 per clause 4.2.") == ["order", "part-ab1234", "part", "ab1234", "per",
+                                                            "clause", "4.2", "4", "2"]
+    assert tokenize("part-ab1234 foo_bar", parts=False) == ["part-ab1234", "foo_bar"]
+
+def test_search_ranks_by_bm25_and_matches_identifier_parts():
+    index = LexicalIndex()
+    index.add("a", "the pump seal part-ab1234 must be replaced yearly")
+    index.add("b", "the pump housing is cast iron")
+    index.add("c", "warranty terms and conditions")
+    assert [chunk_id for chunk_id, _, _ in index.search("pump seal", 3)] == ["a", "b"]
+    assert index.search("ab1234", 3)[0][0] == "a"
+    assert index.search("part-ab1234", 3)[0][0] == "a"
+    assert index.search("nothing matches", 3) == []
+
+def test_removed_chunks_disappear_and_postings_are_compacted():
+    index = LexicalIndex()
+    for i in range(8):
+        index.add(f"c{i}", f"shared word unique{i}")
+    index.remove(["c0", "c1", "c2"])
+    assert len(index) == 5
+    assert len(index.chunk_ids) == 5  # more than a quarter was dead: slots were compacted
+    assert index.search("unique1", 5) == []
+    assert {chunk_id for chunk_id, _, _ in index.search("shared", 10)} == {f"c{i}" for i in range(3, 8)}
+    index.add("c0", "shared word unique0")
+    assert index.search("unique0", 1)[0][0] == "c0"
+
+def test_save_and_load_round_trip(tmp_path):
+    index = LexicalIndex()
+    index.add("a", "alpha beta")
+    index.add("b", "beta gamma")
+    index.save(tmp_path, {"a": 7, "b": 3})
+    loaded = LexicalIndex.load(tmp_path)
+    assert loaded.search("gamma", 2) == [("b", 3, index.search("gamma", 2)[0][2])]
+    assert load_lexical_index(tmp_path).search("alpha", 1)[0][:2] == ("a", 7)
+    assert load_lexical_index(tmp_path / "missing") is None
+
+def corpus():
+    topics = ["pump maintenance schedule and seal replacement", "invoice payment terms net thirty days",
+              "safety goggles required in the workshop", "server rack cooling and airflow"]
+    docs = [{"doc_id": f"doc-{i}", "name": f"doc-{i}.pdf", "text": (topic + ". ") * 20}
+            for i, topic in enumerate(topics)]
+    docs[2]["text"] += " Reorder code zx-4471 for replacement lenses."
+    return docs
+
+def test_retrieval_modes_over_one_generation(workdir):
+    ingest_documents(corpus(), path="index")
+    lexical = HybridRetriever("index", k=2, mode="lexical").retrieve("zx-4471")
+    assert lexical[1] is None  # no query embedding in lexical mode
+    assert lexical[0][0].metadata["doc_id"] == "doc-2"
+
+    vector_docs, vector = HybridRetriever("index", k=2, mode="vector").retrieve("invoice payment terms")
+    assert vector is not None and vector_docs[0].metadata["doc_id"] == "doc-1"
+
+    timings = {}
+    hybrid, _ = HybridRetriever("index", k=3, mode="hybrid").retrieve("replacement zx-4471", timings)
+    assert hybrid[0].metadata["doc_id"] == "doc-2"  # first in both rankings
+    assert len({d.metadata["chunk_id"] for d in hybrid}) == len(hybrid) == 3
+    assert {"vector", "lexical", "fusion"} <= set(timings)
+
+def test_hybrid_falls_back_to_vector_without_a_lexical_index(workdir):
+    ingest_documents(corpus(), path="index")
+    # as in indexes built before the lexical index existed
+    os.remove(os.path.join(current_generation("index"), LEXICAL_NAME))
+    docs, vector = HybridRetriever("index", k=2, mode="hybrid").retrieve("server rack cooling")
+    assert vector is not None and docs[0].metadata["doc_id"] == "doc-3"
@@ -0,0 +1,152 @@
+"""ModelRouter and AnswerStream against the offline chat models in fakes.py."""
+import time
+from types import SimpleNamespace
+import pytest
+from google.api_core.exceptions import NotFound, ResourceExhausted
+from langchain_core.documents import Document
+from langchain_core.messages import AIMessageChunk
+from langchain_core.outputs import ChatGenerationChunk
+import model_router
+from config import (MODEL_FAILURE_COOLDOWN_SECONDS, MODEL_FAILURE_THRESHOLD, MODEL_NOT_FOUND_COOLDOWN_SECONDS,
+                    MODEL_QUOTA_COOLDOWN_SECONDS)
+from fakes import FakeChatModel, fake_client_factory
+from model_router import CircuitBreaker, ModelRouter
+from qa_chain import build_plain_prompt
+
+MODELS = ["primary", "secondary", "tertiary"]
+DOCS = [Document(page_content="The warranty lasts two years.")]
+QUESTION = "How long is the warranty?"
+
+class Clock:
+    """Stands in for time.monotonic so cooldowns can be skipped without sleeping."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(model_router, "time", SimpleNamespace(monotonic=clock, perf_counter=time.perf_counter))
+    return clock
+
+def make_router(errors=None, **kwargs):
+    return ModelRouter(MODELS, client_factory=fake_client_factory(errors=errors), **kwargs)
+
+def generate(router):
+    return router.generate(build_plain_prompt(), DOCS, QUESTION)
+
+class StopsMidAnswer(FakeChatModel):
+    """Streams the first word of its reply, then fails."""
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        yield ChatGenerationChunk(message=AIMessageChunk(content=self._reply(messages).split(" ")[0] + " "))
+        raise RuntimeError("connection reset")
+
+def test_breaker_opens_after_repeated_failures():
+    breaker = CircuitBreaker()
+    for _ in range(MODEL_FAILURE_THRESHOLD - 1):
+        breaker.record_failure(RuntimeError("boom"), 0.0)
+    assert breaker.available(0.0)
+    breaker.record_failure(RuntimeError("boom"), 0.0)
+    assert not breaker.available(0.0)
+    assert breaker.available(MODEL_FAILURE_COOLDOWN_SECONDS)
+
+@pytest.mark.parametrize("error, cooldown", [(ResourceExhausted("quota"), MODEL_QUOTA_COOLDOWN_SECONDS),
+                                             (NotFound("no such model"), MODEL_NOT_FOUND_COOLDOWN_SECONDS)])
+def test_breaker_opens_at_once_on_quota_and_not_found(error, cooldown):
+    breaker = CircuitBreaker()
+    breaker.record_failure(error, 0.0)
+    assert not breaker.available(cooldown - 1)
+    assert breaker.available(cooldown)
+
+def test_half_open_breaker_reopens_on_failure_and_closes_on_success():
+    breaker = CircuitBreaker()
+    for _ in range(MODEL_FAILURE_THRESHOLD):
+        breaker.record_failure(RuntimeError("boom"), 0.0)
+    # after the cooldown one trial call is let through: a single failure opens it again
+    now = MODEL_FAILURE_COOLDOWN_SECONDS
+    breaker.record_failure(RuntimeError("boom"), now)
+    assert not breaker.available(now)
+    now += MODEL_FAILURE_COOLDOWN_SECONDS
+    breaker.record_success()
+    assert breaker.available(now)
+    breaker.record_failure(RuntimeError("boom"), now)
+    assert breaker.available(now)
+
+def test_falls_back_in_model_order():
+    router = make_router(errors={"primary": RuntimeError("boom")})
+    text, model_name, error = generate(router)
+    assert (model_name, error) == ("secondary", None)
+    assert text.startswith("secondary:")
+    stats = router.get_stats()
+    assert stats["primary"]["failures"] == 1
+    assert stats["tertiary"]["calls"] == 0
+
+def test_reports_error_when_every_model_fails():
+    router = make_router(errors={m: RuntimeError("boom") for m in MODELS})
+    text, model_name, error = generate(router)
+    assert text is None and model_name is None
+    assert error == "All models failed or exhausted their quotas."
+
+def test_skips_model_during_cooldown_and_retries_after(clock):
+    router = make_router(errors={"primary": ResourceExhausted("quota")})
+    assert generate(router)[1] == "secondary"
+    assert router.available_models() == ["secondary", "tertiary"]
+    assert generate(router)[1] == "secondary"
+    assert router.get_stats()["primary"]["calls"] == 1
+    assert router.get_stats()["primary"]["skipped"] >= 1
+
+    clock.now += MODEL_QUOTA_COOLDOWN_SECONDS
+    router.client("primary").error = None
+    assert generate(router)[1] == "primary"
+    assert router.get_stats()["primary"]["available"]
+
+def test_all_models_cooling_down(clock):
+    router = make_router(errors={m: NotFound("gone") for m in MODELS})
+    generate(router)
+    assert generate(router) == (None, None, "All models are cooling down after recent failures or quota errors.")
+
+def test_hedge_races_next_model_when_first_is_slow():
+    latency = {"primary": 1.0, "secondary": 0.0, "tertiary": 0.0}
+    router = ModelRouter(MODELS, client_factory=lambda m: FakeChatModel(model_name=m, latency=latency[m]),
+                         hedge_after_seconds=0.05)
+    start = time.perf_counter()
+    text, model_name, error = generate(router)
+    assert (model_name, error) == ("secondary", None)
+    assert time.perf_counter() - start < latency["primary"]
+
+def test_without_hedge_waits_for_first_model():
+    router = ModelRouter(MODELS, client_factory=fake_client_factory(latency=0.05), hedge_after_seconds=None)
+    assert generate(router)[1] == "primary"
+    assert router.get_stats()["secondary"]["calls"] == 0
+
+def test_stream_falls_back_before_first_token():
+    router = make_router(errors={"primary": RuntimeError("boom")})
+    completed = []
+    stream = router.stream(build_plain_prompt(), DOCS, QUESTION)
+    stream.on_complete = completed.append
+    pieces = list(stream)
+    assert stream.model_name == "secondary" and stream.error is None
+    assert "".join(pieces) == stream.text
+    assert stream.text.startswith("secondary:")
+    assert stream.time_to_first_token is not None
+    assert completed == [stream]
+
+def test_stream_does_not_switch_models_mid_answer():
+    def factory(model_name):
+        if model_name == "primary":
+            return StopsMidAnswer(model_name=model_name)
+        return FakeChatModel(model_name=model_name)
+    router = ModelRouter(MODELS, client_factory=factory)
+    completed = []
+    stream = router.stream(build_plain_prompt(), DOCS, QUESTION)
+    stream.on_complete = completed.append
+    pieces = list(stream)
+    assert pieces == ["primary: "]
+    assert stream.error == "primary stopped mid-answer: RuntimeError"
+    assert stream.model_name is None
+    assert completed == []
+    assert router.get_stats()["secondary"]["calls"] == 0
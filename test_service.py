@@ -0,0 +1,53 @@
+"""HTTP layer of the query service, over raw sockets."""
+import asyncio
+import functools
+import json
+import pytest
+from model_router import ModelRouter, get_default_router, set_default_router
+from fakes import fake_client_factory
+from service import MAX_BODY_BYTES, QueryService, _seed_stub_index, handle_connection
+
+async def exchange(service, raw):
+    server = await asyncio.start_server(functools.partial(handle_connection, service), "127.0.0.1", 0)
+    async with server:
+        reader, writer = await asyncio.open_connection(*server.sockets[0].getsockname()[:2])
+        writer.write(raw)
+        await writer.drain()
+        response = await asyncio.wait_for(reader.read(), 10)
+        writer.close()
+    head, _, body = response.partition(b"\r\n\r\n")
+    return int(head.split()[1]), json.loads(body)
+
+def request(method, path, body=b"", headers=None):
+    headers = dict({"Content-Length": str(len(body)), "Connection": "close"}, **(headers or {}))
+    lines = [f"{method} {path} HTTP/1.1"] + [f"{name}: {value}" for name, value in headers.items()]
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body
+
+@pytest.fixture
+def service(workdir):
+    previous = get_default_router()
+    set_default_router(ModelRouter(client_factory=fake_client_factory()))
+    yield QueryService("index", workers=2)
+    set_default_router(previous)
+
+@pytest.mark.parametrize("length, status", [("abc", 400), ("-5", 400), (str(MAX_BODY_BYTES + 1), 413)])
+def test_bad_content_length_gets_an_error_response(service, length, status):
+    raw = request("POST", "/query", headers={"Content-Length": length})
+    got, body = asyncio.run(exchange(service, raw))
+    assert got == status and body["error"]
+
+def test_malformed_request_line(service):
+    assert asyncio.run(exchange(service, b"NONSENSE\r\n\r\n"))[0] == 400
+
+def test_query_validation_and_routes(service):
+    assert asyncio.run(exchange(service, request("GET", "/healthz"))) == (200, {"ok": True, "index": False})
+    assert asyncio.run(exchange(service, request("GET", "/query")))[0] == 405
+    assert asyncio.run(exchange(service, request("GET", "/nowhere")))[0] == 404
+    assert asyncio.run(exchange(service, request("POST", "/query", b"not json")))[0] == 400
+    assert asyncio.run(exchange(service, request("POST", "/query", b'{"question": "x", "k": 0}')))[0] == 400
+
+def test_query_answers_from_the_index(service):
+    _seed_stub_index("index", n_docs=3, words_per_doc=400)
+    status, body = asyncio.run(exchange(service, request("POST", "/query", b'{"question": "what is in stub 1?"}')))
+    assert status == 200
+    assert body["error"] is None and body["answer"] and body["coalesced"] is False
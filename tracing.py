@@ -0,0 +1,209 @@
+"""Lightweight tracing spans for the ingest and query paths.
+
+A span records its duration, free-form attributes (chunk / token counts, the model
+tried) and the failure reason if it raised. Spans nest through a context variable; work
+handed to other threads passes `parent=` explicitly. Every finished span feeds the
+process-wide metrics (Prometheus text via prometheus_text()), and finished traces are
+kept in memory for the debug panel and optionally appended to TRACE_LOG_PATH as JSON
+lines.
+"""
+import contextlib
+import contextvars
+import json
+import threading
+import time
+import uuid
+from collections import deque
+from config import TRACE_HISTORY, TRACE_LOG_PATH
+
+# upper bounds (seconds) of the duration histogram buckets
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# span attributes exported as Prometheus labels instead of counters
+_LABEL_ATTRS = ("model",)
+
+_current = contextvars.ContextVar("tracing_current_span", default=None)
+
+def _error_text(error):
+    return error if isinstance(error, str) else f"{type(error).__name__}: {error}"
+
+class Span:
+    """One timed stage; `children` are the spans started under it."""
+
+    def __init__(self, name, parent=None, attrs=None):
+        self.name = name
+        self.parent = parent
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex[:16]
+        self.span_id = uuid.uuid4().hex[:8]
+        self.attrs = dict(attrs or {})
+        self.error = None
+        self.children = []
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self._end = None
+        self._lock = threading.Lock()
+        if parent is not None:
+            with parent._lock:
+                parent.children.append(self)
+
+    @property
+    def duration(self):
+        return (self._end or time.perf_counter()) - self._start
+
+    @property
+    def finished(self):
+        return self._end is not None
+
+    @property
+    def root(self):
+        span = self
+        while span.parent is not None:
+            span = span.parent
+        return span
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def fail(self, error):
+        """Mark the span as failed; `error` is an exception or a reason string."""
+        self.error = _error_text(error)
+
+    def finish(self, error=None):
+        if self._end is not None:
+            return
+        if error is not None:
+            self.fail(error)
+        self._end = time.perf_counter()
+        metrics.observe(self)
+        if self.parent is None:
+            _record_trace(self)
+
+    def walk(self, depth=0):
+        """Yield (depth, span) for this span and its descendants in start order."""
+        yield depth, self
+        with self._lock:
+            children = sorted(self.children, key=lambda s: s._start)
+        for child in children:
+            yield from child.walk(depth + 1)
+
+    def to_dict(self):
+        root = self.root
+        return {
+            "trace_id": self.trace_id, "span_id": self.span_id,
+            "parent_id": self.parent.span_id if self.parent else None,
+            "name": self.name, "started_at": self.started_at,
+            "offset_ms": round((self._start - root._start) * 1000, 3),
+            "duration_ms": round(self.duration * 1000, 3),
+            "attrs": self.attrs, "error": self.error,
+        }
+
+def current_span():
+    return _current.get()
+
+def start_span(name, parent=None, **attrs):
+    """Start a span without making it current; the caller must call finish().
+
+    For spans that outlive a with-block, such as an answer stream iterated later.
+    """
+    return Span(name, parent if parent is not None else _current.get(), attrs)
+
+@contextlib.contextmanager
+def span(name, parent=None, **attrs):
+    """Time the block as a child of `parent` (default: the current span) and make it current."""
+    s = start_span(name, parent, **attrs)
+    token = _current.set(s)
+    try:
+        yield s
+    except Exception as e:
+        s.fail(e)
+        raise
+    finally:
+        _current.reset(token)
+        s.finish()
+
+@contextlib.contextmanager
+def activate(s):
+    """Make an already started span current for the block without finishing it."""
+    token = _current.set(s)
+    try:
+        yield s
+    finally:
+        _current.reset(token)
+
+class Metrics:
+    """Per-span-name duration histograms, error counts and summed numeric attributes."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, s):
+        labels = (s.name,) + tuple(str(s.attrs.get(a, "")) for a in _LABEL_ATTRS)
+        with self._lock:
+            series = self._series.setdefault(labels, {
+                "count": 0, "sum": 0.0, "errors": 0, "buckets": [0] * len(DURATION_BUCKETS), "attrs": {}})
+            series["count"] += 1
+            series["sum"] += s.duration
+            series["errors"] += s.error is not None
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if s.duration <= bound:
+                    series["buckets"][i] += 1
+            for key, value in s.attrs.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    series["attrs"][key] = series["attrs"].get(key, 0) + value
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+    def prometheus_text(self, prefix="chatpdf"):
+        """Render all series in the Prometheus text exposition format."""
+        with self._lock:
+            series = {labels: dict(s, buckets=list(s["buckets"]), attrs=dict(s["attrs"]))
+                      for labels, s in self._series.items()}
+        metric = f"{prefix}_span_duration_seconds"
+        lines = [f"# HELP {metric} Duration of traced stages.", f"# TYPE {metric} histogram"]
+        errors, counters = [], []
+        for labels, s in sorted(series.items()):
+            label_text = ",".join(f'{k}="{v}"' for k, v in zip(("span",) + _LABEL_ATTRS, labels) if v)
+            for bound, count in zip(DURATION_BUCKETS, s["buckets"]):
+                lines.append(f'{metric}_bucket{{{label_text},le="{bound}"}} {count}')
+            lines.append(f'{metric}_bucket{{{label_text},le="+Inf"}} {s["count"]}')
+            lines.append(f"{metric}_sum{{{label_text}}} {s['sum']:.6f}")
+            lines.append(f"{metric}_count{{{label_text}}} {s['count']}")
+            errors.append(f"{prefix}_span_errors_total{{{label_text}}} {s['errors']}")
+            for key, value in sorted(s["attrs"].items()):
+                counters.append(f'{prefix}_span_attribute_total{{{label_text},attr="{key}"}} {value}')
+        lines += [f"# HELP {prefix}_span_errors_total Traced stages that failed.",
+                  f"# TYPE {prefix}_span_errors_total counter"] + errors
+        lines += [f"# HELP {prefix}_span_attribute_total Sum of numeric span attributes (chunks, tokens, ...).",
+                  f"# TYPE {prefix}_span_attribute_total counter"] + counters
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics()
+
+_traces = deque(maxlen=TRACE_HISTORY)
+_traces_lock = threading.Lock()
+
+def json_lines(root):
+    """One JSON object per span of the trace rooted at `root`."""
+    return "".join(json.dumps(s.to_dict()) + "\n" for _, s in root.walk())
+
+def _record_trace(root):
+    with _traces_lock:
+        _traces.append(root)
+        if TRACE_LOG_PATH:
+            with open(TRACE_LOG_PATH, "a", encoding="utf-8") as f:
+                f.write(json_lines(root))
+
+def recent_traces(name=None):
+    """Finished root spans, newest first; `name` filters by root span name."""
+    with _traces_lock:
+        traces = list(_traces)
+    return [t for t in reversed(traces) if name is None or t.name == name]
+
+def latest_trace(name=None):
+    traces = recent_traces(name)
+    return traces[0] if traces else None
+
+def prometheus_text():
+    return metrics.prometheus_text()
@@ -1,35 +1,95 @@
 import streamlit as st
-import os
 import datetime
 import html as html_module
 import re
+import tempfile
+from functools import lru_cache
 
-from config import FAISS_DIR
+from config import INDEX_NAMESPACE, CHAT_PAGE_SIZE, RENDER_CACHE_SIZE
+from index_store import namespace_root, has_index
+from conversation_store import get_conversation_store, new_conversation_id
 
 def init_session_state():
-    if "history" not in st.session_state:
-        st.session_state.history = []
+    if "conversation_id" not in st.session_state:
+        # the id lives in the URL so a reloaded or reconnected session reopens the same chat
+        conversation_id = st.query_params.get("conversation") or new_conversation_id()
+        st.query_params["conversation"] = conversation_id
+        st.session_state.conversation_id = conversation_id
+    # an indexed lookup, so every rerun sees messages added from other tabs of the same chat
+    st.session_state.message_count = get_conversation_store().count(st.session_state.conversation_id)
+    if "workspace" not in st.session_state:
+        st.session_state.workspace = INDEX_NAMESPACE or ""
+    if "index_root" not in st.session_state:
+        st.session_state.index_root = namespace_root(st.session_state.workspace)
     if "faiss_ready" not in st.session_state:
-        st.session_state.faiss_ready = os.path.isdir(FAISS_DIR)
+        st.session_state.faiss_ready = has_index(st.session_state.index_root)
     if "last_model_used" not in st.session_state:
         st.session_state.last_model_used = None
     if "focus_index" not in st.session_state:
         st.session_state.focus_index = None
 
-def add_message(role, text):
-    st.session_state.history.append({
-        "role": role,
-        "text": text,
-        "time": datetime.datetime.now().isoformat()
-    })
+def add_message(role, text, reply_to=None):
+    """Store a message in the session's conversation; returns its id (position)."""
+    message = get_conversation_store().add(st.session_state.conversation_id, role, text, reply_to)
+    st.session_state.message_count = message["id"] + 1
+    return message["id"]
 
-def find_preceding_user_message_text(idx):
-    for i in range(idx - 1, -1, -1):
-        if st.session_state.history[i]["role"] == "user":
-            return st.session_state.history[i]["text"]
-    return None
+def clear_messages():
+    get_conversation_store().clear(st.session_state.conversation_id)
+    st.session_state.message_count = 0
+    st.session_state.focus_index = None
+    st.session_state.pop("chat_page", None)
 
-def format_time(iso_ts: str) -> str:
+def load_page(start, end):
+    """Messages [start, end) of the conversation; only the last page loaded is kept in the session."""
+    key = (st.session_state.conversation_id, start, end)
+    cached = st.session_state.get("chat_page")
+    if cached is None or cached[0] != key:
+        cached = (key, get_conversation_store().page(*key))
+        st.session_state.chat_page = cached
+    return cached[1]
+
+def chat_window(n_messages, focus_index, page_size=CHAT_PAGE_SIZE):
+    """Return (start, end) of the history page holding `focus_index` (the last page if unset)."""
+    if n_messages == 0:
+        return 0, 0
+    if focus_index is None or not 0 <= focus_index < n_messages:
+        focus_index = n_messages - 1
+    start = focus_index // page_size * page_size
+    return start, min(n_messages, start + page_size)
+
+def export_conversation_file(conversation_id, batch=500):
+    """Plain-text transcript in a rewound temporary file, written `batch` messages at a time.
+
+    Only one batch of lines is held in memory while the store is read.
+    """
+    out = tempfile.TemporaryFile(buffering=0)
+    lines = []
+    for m in get_conversation_store().iter_messages(conversation_id):
+        lines.append(f"[{format_time(m['time'])}] {'You' if m['role'] == 'user' else 'Assistant'}: {m['text']}\n")
+        if len(lines) >= batch:
+            out.write("".join(lines).encode("utf-8"))
+            lines = []
+    out.write("".join(lines).encode("utf-8"))
+    out.seek(0)
+    return out
+
+def find_question(idx):
+    """(id, text) of the question answered by message `idx`, or None."""
+    message = get_conversation_store().question_for(st.session_state.conversation_id, idx)
+    return (message["id"], message["text"]) if message else None
+
+def find_answer_to_regenerate(focus_idx):
+    """The focused answer, else the next answer after the focused question, else the latest answer."""
+    if focus_idx is not None and not 0 <= focus_idx < st.session_state.message_count:
+        focus_idx = None
+    return get_conversation_store().find_answer(st.session_state.conversation_id, focus_idx)
+
+def format_time(ts) -> str:
+    """Format epoch seconds (or a legacy ISO string) as local 'YYYY-mm-dd HH:MM:SS'."""
+    if isinstance(ts, (int, float)):
+        return datetime.datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S")
+    iso_ts = ts
     try:
         dt = datetime.datetime.fromisoformat(iso_ts)
         return dt.strftime("%Y-%m-%d %H:%M:%S")
@@ -41,6 +101,36 @@ def format_time(iso_ts: str) -> str:
         except Exception:
             return iso_ts
 
+_HEADING_RE = re.compile(r"^(#{1,6})\s+")
+_UL_ITEM_RE = re.compile(r"^\s*([-*])\s+")
+_OL_ITEM_RE = re.compile(r"^\s*\d+\.\s+")
+
+@lru_cache(maxsize=RENDER_CACHE_SIZE)
+def render_message_html(role: str, text: str) -> str:
+    """Bubble content for one message, memoized on its role and text across reruns."""
+    if role == "assistant":
+        return render_markdown_like_to_html(text)
+    return "<p>" + html_module.escape(text).replace("\n", "<br/>") + "</p>"
+
+def render_trace_waterfall(trace) -> str:
+    """HTML timing waterfall of a tracing span tree: one bar per span, offset from the root start."""
+    total_ms = max(trace.duration * 1000, 1e-6)
+    rows = []
+    for depth, s in trace.walk():
+        d = s.to_dict()
+        left = min(d["offset_ms"] / total_ms * 100, 100)
+        width = max(min(d["duration_ms"] / total_ms * 100, 100 - left), 0.5)
+        details = ", ".join(f"{k}={v}" for k, v in d["attrs"].items() if v is not None)
+        label = html_module.escape(s.name + (f" ({details})" if details else ""))
+        error = f"<div style='color:#dc2626'>{html_module.escape(s.error)}</div>" if s.error else ""
+        color = "#dc2626" if s.error else "#6366f1"
+        rows.append(
+            f"<div style='font-size:11px;padding-left:{depth * 8}px'>{label} — {d['duration_ms']:.1f} ms{error}</div>"
+            f"<div style='position:relative;height:6px;background:#eef2ff;margin-bottom:4px'>"
+            f"<div style='position:absolute;left:{left:.2f}%;width:{width:.2f}%;height:6px;background:{color}'></div></div>"
+        )
+    return "".join(rows)
+
 def render_markdown_like_to_html(text: str) -> str:
     if not text:
         return ""
@@ -79,22 +169,23 @@ def render_markdown_like_to_html(text: str) -> str:
                 i += 1
                 continue
 
-        if re.match(r"^#{1,6}\s+", line):
-            level = len(re.match(r"^(#+)", line).group(1))
+        heading = _HEADING_RE.match(line)
+        if heading:
+            level = len(heading.group(1))
             content = line[level+1:].strip()
             html_parts.append(f"<h{level}>{content}</h{level}>")
             i += 1
             continue
 
-        if re.match(r"^\s*([-*])\s+", line):
+        if _UL_ITEM_RE.match(line):
             if not in_ul:
                 in_ul = True
                 html_parts.append("<ul>")
-            content = re.sub(r"^\s*([-*])\s+", "", line)
+            content = _UL_ITEM_RE.sub("", line)
             html_parts.append(f"<li>{content}</li>")
             i += 1
             if i < len(lines):
-                if not re.match(r"^\s*([-*])\s+", lines[i]):
+                if not _UL_ITEM_RE.match(lines[i]):
                     html_parts.append("</ul>")
                     in_ul = False
             else:
@@ -102,15 +193,15 @@ def render_markdown_like_to_html(text: str) -> str:
                 in_ul = False
             continue
 
-        if re.match(r"^\s*\d+\.\s+", line):
+        if _OL_ITEM_RE.match(line):
             if not in_ol:
                 in_ol = True
                 html_parts.append("<ol>")
-            content = re.sub(r"^\s*\d+\.\s+", "", line)
+            content = _OL_ITEM_RE.sub("", line)
             html_parts.append(f"<li>{content}</li>")
             i += 1
             if i < len(lines):
-                if not re.match(r"^\s*\d+\.\s+", lines[i]):
+                if not _OL_ITEM_RE.match(lines[i]):
                     html_parts.append("</ol>")
                     in_ol = False
             else:
@@ -125,7 +216,7 @@ def render_markdown_like_to_html(text: str) -> str:
 
         para_lines = [line]
         j = i + 1
-        while j < len(lines) and lines[j].strip() != "" and not re.match(r"^\s*([-*])\s+", lines[j]) and not re.match(r"^\s*\d+\.\s+", lines[j]) and not re.match(r"^#{1,6}\s+", lines[j]) and not lines[j].strip().startswith("```"):
+        while j < len(lines) and lines[j].strip() != "" and not _UL_ITEM_RE.match(lines[j]) and not _OL_ITEM_RE.match(lines[j]) and not _HEADING_RE.match(lines[j]) and not lines[j].strip().startswith("```"):
             para_lines.append(lines[j])
             j += 1
         paragraph = " ".join([l.strip() for l in para_lines])